@@ -2,6 +2,8 @@
 ASGI config for lmsbackend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with SERVER_MODE=asgi so the async views are routed, see
+config/gunicorn.conf.py.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -9,8 +11,38 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
+from django.http import Http404
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('SERVER_MODE', 'asgi')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from whitenoise.middleware import WhiteNoiseMiddleware  # noqa: E402
+
+
+class WhiteNoiseASGIHandler(ASGIStaticFilesHandler):
+    """Serve STATIC_URL from the collectstatic output like WhiteNoise does
+    under WSGI: hashed names with far future cache headers and the gzip or
+    brotli copy the client accepts. WhiteNoiseMiddleware is sync only and
+    would push the async views back onto a thread, so it is not installed
+    in ASGI mode and only its file index is reused here.
+    """
+
+    def __init__(self, application):
+        super().__init__(application)
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    def serve(self, request):
+        if self.whitenoise.autorefresh:
+            static_file = self.whitenoise.find_file(request.path_info)
+        else:
+            static_file = self.whitenoise.files.get(request.path_info)
+        if static_file is None:
+            raise Http404(request.path_info)
+        return self.whitenoise.serve(static_file, request)
+
+
+application = WhiteNoiseASGIHandler(django_application)
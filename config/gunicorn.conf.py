@@ -0,0 +1,23 @@
+"""
+Gunicorn settings for the web dyno.
+SERVER_MODE=asgi serves config.asgi with uvicorn workers, anything else
+keeps the sync workers on config.wsgi. WEB_CONCURRENCY sets the worker
+count in both modes.
+"""
+import os
+
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "config.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "config.wsgi:application"
+    worker_class = "sync"
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+# Recycle workers now and then so slow leaks cannot grow without bound
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
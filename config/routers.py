@@ -0,0 +1,39 @@
+"""
+Database router sending the reads of reporting endpoints to the replica.
+Writes, migrations and every read outside those endpoints go to the
+primary; the views opt in with utils.replica.ReplicaReadMixin, which sets
+read_alias for the length of the request.
+"""
+from contextvars import ContextVar
+from typing import Optional
+
+from django.db import DEFAULT_DB_ALIAS
+
+
+REPLICA_DB_ALIAS = "replica"
+
+# Alias the reads of the current request or task are sent to, None for the
+# primary. A ContextVar so async views and their sync_to_async threads see
+# the alias of their own request only
+read_alias: ContextVar[Optional[str]] = ContextVar("read_alias", default=None)
+
+
+class PrimaryReplicaRouter:
+    """Primary for writes, the replica for reads of opted in requests"""
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica follows the primary's schema
+        return db == DEFAULT_DB_ALIAS
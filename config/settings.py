@@ -16,7 +16,8 @@ import sys
 from datetime import timedelta
 import logging
 import dj_database_url
-import django_heroku
+
+from utils.secret_store import lazy_secret
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,7 +28,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-c^du8oqah#y&8cmg126!&)m64%6nhxge)%@$h8!1vq5km*z(p%'
+SECRET_KEY = os.environ.get(
+    "SECRET_KEY",
+    'django-insecure-c^du8oqah#y&8cmg126!&)m64%6nhxge)%@$h8!1vq5km*z(p%'
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
 # DEBUG = bool(int(os.environ.get("DEBUG", 1)))
@@ -40,6 +44,9 @@ ALLOWED_HOSTS.extend(
         os.environ.get("ALLOWED_HOSTS", "").split(",")
     )
 )
+# django_heroku allowed every host, keep that until ALLOWED_HOSTS is set
+if not os.environ.get("ALLOWED_HOSTS"):
+    ALLOWED_HOSTS = ["*"]
 
 
 # Application definition
@@ -82,6 +89,9 @@ if "test" in sys.argv:
     EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
 MIDDLEWARE = [
+    "core.middleware.RequestIdMiddleware",
+    "core.middleware.PerfMiddleware",
+    "core.middleware.ReplicaStickinessMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -93,6 +103,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# "asgi" when served by config.asgi under uvicorn workers (see
+# config/gunicorn.conf.py), which routes the async views of the I/O bound
+# endpoints. WhiteNoiseMiddleware is sync only, config.asgi serves the
+# collected static files itself
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+if SERVER_MODE == "asgi":
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -127,9 +145,76 @@ DATABASES = {
     }
 }
 # if not DEBUG:
-db_from_env = dj_database_url.config(conn_max_age=600)
+db_from_env = dj_database_url.config(ssl_require="DYNO" in os.environ)
 DATABASES['default'].update(db_from_env)
 
+# Connection pool of each worker process (psycopg_pool). Keep
+# DB_POOL_MAX_SIZE x WEB_CONCURRENCY x dynos, plus release and one-off
+# dynos, under the connection cap of the Postgres plan.
+# DB_POOL_MAX_SIZE=0 falls back to persistent connections per thread
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 4))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+# Statement timeouts in milliseconds: the default of every connection and
+# the one of long running endpoints (payroll, reports), 0 disables them
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", 15000))
+DB_LONG_STATEMENT_TIMEOUT = int(
+    os.environ.get("DB_LONG_STATEMENT_TIMEOUT", 120000)
+)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+DATABASES["default"].setdefault("OPTIONS", {})
+if DB_POOL_MAX_SIZE:
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+        "max_size": DB_POOL_MAX_SIZE,
+        "timeout": DB_POOL_TIMEOUT,
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = 600
+if DB_STATEMENT_TIMEOUT:
+    DATABASES["default"]["OPTIONS"]["options"] = (
+        f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+    )
+# Server side cursors back QuerySet.iterator(), they do not survive a
+# transaction mode PgBouncer in front of the database
+DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = bool(
+    int(os.environ.get("DB_DISABLE_SERVER_SIDE_CURSORS", 0))
+)
+
+# Read replica (e.g. a Heroku follower) serving the reporting endpoints.
+# It gets its own pool of the same size, count it against its own
+# connection cap. DB_REPLICA_READS=0 sends every read back to the primary
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+DB_REPLICA_READS = bool(int(os.environ.get("DB_REPLICA_READS", 1)))
+# Seconds a user reads from the primary after writing, above the usual lag
+REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", 10))
+if DATABASE_REPLICA_URL or "test" in sys.argv:
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+    }
+    if "test" in sys.argv:
+        # A second connection to the test database, the replica tests turn
+        # DB_REPLICA_READS on. Unpooled, the test runner does not close the
+        # pools of mirrors before dropping the database
+        DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+        DATABASES["replica"]["OPTIONS"].pop("pool", None)
+        DB_REPLICA_READS = False
+    else:
+        replica_from_env = dj_database_url.parse(
+            DATABASE_REPLICA_URL, ssl_require="DYNO" in os.environ
+        )
+        # Server and credentials from the URL, pool and timeouts as above
+        DATABASES["replica"]["OPTIONS"].update(
+            replica_from_env.get("OPTIONS", {})
+        )
+        DATABASES["replica"].update({
+            key: replica_from_env[key]
+            for key in ("NAME", "USER", "PASSWORD", "HOST", "PORT")
+        })
+DATABASE_ROUTERS = ["config.routers.PrimaryReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -176,26 +261,103 @@ if USE_S3:
     AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
     AWS_STORAGE_BUCKET_NAME = os.environ.get("AWS_STORAGE_BUCKET_NAME")
     AWS_DEFAULT_ACL = None
-    AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
+    AWS_S3_REGION_NAME = os.environ.get("AWS_S3_REGION_NAME")
+    # Point at a local S3-compatible service (minio, moto server) in dev
+    AWS_S3_ENDPOINT_URL = os.environ.get("AWS_S3_ENDPOINT_URL")
+    AWS_S3_CUSTOM_DOMAIN = os.environ.get(
+        "AWS_S3_CUSTOM_DOMAIN", f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
+        )
     AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=86400'}
     # s3 static settings
     STATIC_LOCATION = 'static'
     STATIC_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/{STATIC_LOCATION}/'
     STATIC_ROOT = os.environ.get("STATIC_DIR", "staticfiles")
-    STATICFILES_STORAGE = "storages.backends.s3.S3Storage"
     # s3 public media settings
     PUBLIC_MEDIA_LOCATION = 'media'
     MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/{PUBLIC_MEDIA_LOCATION}/'
     MEDIA_ROOT = os.environ.get("MEDIA_DIR", "mediafiles")
-    DEFAULT_FILE_STORAGE = "storages.backends.s3.S3Storage"
+    STORAGES = {
+        "default": {"BACKEND": "storages.backends.s3.S3Storage"},
+        "staticfiles": {"BACKEND": "storages.backends.s3.S3Storage"},
+    }
 else:
     STATIC_URL = 'static/'
     STATIC_ROOT = os.environ.get("STATIC_DIR")
     MEDIA_URL = "media/"
     MEDIA_ROOT = os.environ.get("MEDIA_DIR")
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+    # Hashed, gzip and brotli compressed copies written by collectstatic,
+    # served by whitenoise with far future cache headers
+    STORAGES = {
+        "default": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage"
+        },
+        "staticfiles": {
+            "BACKEND": (
+                "whitenoise.storage.CompressedManifestStaticFilesStorage"
+            )
+        },
+    }
+    if "test" in sys.argv:
+        # Tests render templates without running collectstatic
+        STORAGES["staticfiles"]["BACKEND"] = (
+            "django.contrib.staticfiles.storage.StaticFilesStorage"
+        )
+
+# Direct to S3 uploads: ticket lifetime in seconds and largest accepted file
+UPLOAD_TICKET_TTL = int(os.environ.get("UPLOAD_TICKET_TTL", 900))
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE", 25 * 1024 * 1024))
+
+# Seconds the result of a POST with an Idempotency-Key header is replayed
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+
+# Numbers of a counter (receipt numbers) each worker reserves at a time
+COUNTER_BLOCK_SIZE = int(os.environ.get("COUNTER_BLOCK_SIZE", 20))
+
+# Student/staff photo thumbnails: longest side in pixels, background workers
+# and whether to render inline (tests, management commands)
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", 256))
+THUMBNAIL_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", 2))
+THUMBNAIL_SYNC = bool(int(os.environ.get("THUMBNAIL_SYNC", 0)))
+
+# Request performance statistics kept in memory by each worker
+PERF_ENABLED = bool(int(os.environ.get("PERF_ENABLED", 1)))
+PERF_SAMPLE_SIZE = int(os.environ.get("PERF_SAMPLE_SIZE", 500))
+PERF_SLOW_QUERY_MS = float(os.environ.get("PERF_SLOW_QUERY_MS", 100))
+PERF_SLOW_QUERY_SAMPLES = int(os.environ.get("PERF_SLOW_QUERY_SAMPLES", 50))
+
+# Shared cache: "file" (shared by the workers of one machine), "redis" (any
+# Redis protocol server at REDIS_URL) or "locmem" (per process)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "file")
+CACHE_TIMEOUT = int(os.environ.get("CACHE_TIMEOUT", 60 * 60))
+if "test" in sys.argv:
+    CACHE_BACKEND = "locmem"
+if CACHE_BACKEND == "redis":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0"),
+        }
+    }
+elif CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get(
+                "CACHE_LOCATION", "/tmp/school_backend_cache"
+                ),
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+for _cache in CACHES.values():
+    _cache["TIMEOUT"] = CACHE_TIMEOUT
+    _cache["KEY_PREFIX"] = os.environ.get("CACHE_KEY_PREFIX", "school")
 
-django_heroku.settings(locals(), staticfiles=False)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -221,6 +383,9 @@ SIMPLE_JWT = {
 # Date input format
 DATE_INPUT_FORMATS = ["%d-%m-%Y"]
 
+# Country calling code of local phone numbers ("024 123 4567")
+PHONE_COUNTRY_CODE = os.environ.get("PHONE_COUNTRY_CODE", "233")
+
 # Frontend Details
 FRONTEND_BASE_URL = os.environ.get("FRONTEND_BASE_URL")
 
@@ -232,7 +397,7 @@ EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 
 EMAIL_HOST = os.environ.get("EMAIL_HOST")
 EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
-EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
+EMAIL_HOST_PASSWORD = lazy_secret("EMAIL_HOST_PASSWORD", "")
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
@@ -278,7 +443,16 @@ SPECTACULAR_SETTINGS = {
     }
 }
 
-# Logging
+# Logging: records are queued by the request thread and written as JSON by
+# a listener thread, to a file and/or batched stdout. The workers do not
+# rotate the file, rotate it with logrotate (see README)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", 0.05))
+LOG_FILE = os.environ.get("LOG_FILE", "school_backend.log")
+LOG_STDOUT = bool(int(os.environ.get("LOG_STDOUT", 0)))
+LOG_STDOUT_BATCH_SIZE = int(os.environ.get("LOG_STDOUT_BATCH_SIZE", 50))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 1.0))
+
 if "test" in sys.argv:
     logging.disable(logging.CRITICAL)
 else:
@@ -295,12 +469,21 @@ else:
                 'style': '{',
             },
         },
+        'filters': {
+            'sample_debug': {
+                '()': 'utils.log_handlers.DebugSampleFilter',
+                'rate': LOG_DEBUG_SAMPLE_RATE,
+            },
+        },
         'handlers': {
-            'file': {
+            'async': {
                 'level': 'DEBUG',
-                'class': 'logging.FileHandler',
-                'filename': 'school_backend.log',
-                'formatter': 'verbose'
+                'class': 'utils.log_handlers.AsyncLogHandler',
+                'filters': ['sample_debug'],
+                'filename': LOG_FILE or None,
+                'stdout': LOG_STDOUT,
+                'batch_size': LOG_STDOUT_BATCH_SIZE,
+                'flush_interval': LOG_FLUSH_INTERVAL,
             },
             'mail_admins': {
                 'level': 'ERROR',
@@ -310,8 +493,8 @@ else:
         },
         'loggers': {
             '': {
-                'handlers': ['file'],
-                'level': 'DEBUG',
+                'handlers': ['async'],
+                'level': LOG_LEVEL,
                 'propagate': True,
             }
         }
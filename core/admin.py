@@ -2,13 +2,14 @@
 The administration of models
 """
 from django.contrib import admin
-from collections.abc import Sequence
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Count, QuerySet, Sum
 from django.http import HttpRequest
 from django.utils.translation import gettext as _
 # from django.urls import reverse
 
 from core import models
+from utils.pagination import EstimatedCountPaginator
 
 
 class UserAdmin(BaseUserAdmin):
@@ -63,6 +64,18 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin of the tables that grow with every payment. The changelist
+    is counted from the table estimate and only once, and the foreign keys
+    subclasses list in list_select_related are read in the page's query.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ["-date_created", "-id"]
+
+
 class AcademicTermAdmin(admin.ModelAdmin):
     """Admin view for the academic term"""
     list_display = ["term", "academic_year"]
@@ -76,12 +89,19 @@ class StudentAdmin(admin.ModelAdmin):
     list_per_page = 10
 
 
-class StudentClassAdmin(admin.ModelAdmin):
+class StudentClassAdmin(LargeTableAdmin):
     """Admin view for the student to class mapping"""
-    list_display = ["student", "student_class"]
+    list_display = [
+        "student", "student_class", "academic_year", "fee_assigned",
+        "fee_paid", "fee_owing"
+    ]
+    list_select_related = [
+        "student", "student_class", "academic_year", "fee_assigned"
+    ]
+    list_filter = ["academic_year", "student_class"]
     search_fields = [
         "student__first_name", "student__last_name", "student_class__name"]
-    list_per_page = 10
+    autocomplete_fields = ["student", "fee_assigned"]
     readonly_fields = ("fee_paid", "fee_owing")
 
 
@@ -114,34 +134,85 @@ class TeacherClassAdmin(admin.ModelAdmin):
     list_per_page = 10
 
 
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(LargeTableAdmin):
     """Admin view for the payment model"""
+    list_display = [
+        "student", "fee", "amount", "payment_method", "academic_year",
+        "academic_term", "date_created"
+    ]
+    list_select_related = [
+        "student", "fee", "academic_year", "academic_term"
+    ]
+    list_filter = ["academic_year", "payment_method"]
+    date_hierarchy = "date_created"
     search_fields = [
         "student__first_name", "student__last_name",
         "fee__name"
         ]
+    autocomplete_fields = ["student", "fee", "user"]
 
 
-class FeeArrearAdmin(admin.ModelAdmin):
+class FeeArrearAdmin(LargeTableAdmin):
     """Model Admin view for the fee arrear"""
+    list_display = [
+        "student", "academic_year", "academic_term", "amount",
+        "arrear_balance", "date_created"
+    ]
+    list_select_related = ["student", "academic_year", "academic_term"]
+    list_filter = ["academic_year"]
+    date_hierarchy = "date_created"
+    search_fields = ["student__first_name", "student__last_name"]
+    autocomplete_fields = ["student"]
     readonly_fields = ("arrear_balance", )
 
 
-class ArrearPaymentAdmin(admin.ModelAdmin):
+class ArrearPaymentAdmin(LargeTableAdmin):
     """Admin view for the arrear payment"""
+    list_display = [
+        "fee_arrear", "amount", "owing_after_payment", "payment_method",
+        "date_created"
+    ]
+    list_select_related = [
+        "fee_arrear__student", "fee_arrear__academic_year"
+    ]
+    list_filter = ["payment_method"]
+    date_hierarchy = "date_created"
+    search_fields = [
+        "fee_arrear__student__first_name", "fee_arrear__student__last_name"
+    ]
+    autocomplete_fields = ["fee_arrear", "user"]
     readonly_fields = ("owing_after_payment", )
 
 
 class StudentFeeGroupAdmin(admin.ModelAdmin):
     """Model Admin for the Student Group"""
+    list_display = ["name", "academic_year", "fee_count", "total_amount"]
+    list_select_related = ["academic_year"]
+    list_filter = ["academic_year"]
+    search_fields = ["name"]
+    autocomplete_fields = ["fees"]
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        # The fees of every row in the page's query, not one query a row
+        return super().get_queryset(request).annotate(
+            fee_count=Count("fees"), total_amount=Sum("fees__amount")
+        )
+
+    @admin.display(description="Fees", ordering="fee_count")
+    def fee_count(self, obj) -> int:
+        return obj.fee_count
 
-    def get_list_display(self, request: HttpRequest) -> Sequence[str]:
-        return super().get_list_display(request)
+    @admin.display(description="Total amount", ordering="total_amount")
+    def total_amount(self, obj):
+        return obj.total_amount
 
 
 class FeeAdmin(admin.ModelAdmin):
     """Model admin for the Fee mode"""
-    list_display = ["name", "academic_year"]
+    list_display = ["name", "academic_year", "academic_term", "amount"]
+    list_select_related = ["academic_year", "academic_term"]
+    list_filter = ["academic_year"]
+    search_fields = ["name"]
 
 
 admin.site.register(models.OrganizationConfig)
@@ -164,3 +235,4 @@ admin.site.register(models.Payment, PaymentAdmin)
 admin.site.register(models.PaymentReceipt)
 admin.site.register(models.FeeArrear, FeeArrearAdmin)
 admin.site.register(models.ArrearPayment, ArrearPaymentAdmin)
+admin.site.register(models.UploadTicket)
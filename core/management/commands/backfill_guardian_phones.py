@@ -0,0 +1,48 @@
+"""
+Fill the E.164 phone index of guardians (utils.phones), for guardians
+saved before it existed or imported without signals
+"""
+from typing import Optional, Any
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.models import ParentOrGuardian
+from utils.db import statement_timeout
+from utils.phones import CHUNK_SIZE, refresh_guardian_phones
+
+
+class Command(BaseCommand):
+    help = "Index the phone numbers of guardians in E.164 form"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--missing", action="store_true",
+            help="Only guardians without an indexed phone"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=CHUNK_SIZE,
+            help="Guardians indexed per transaction"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Index the guardians chunk by chunk, each chunk committed"""
+        guardians = ParentOrGuardian.objects.order_by("pk")
+        if options["missing"]:
+            guardians = guardians.filter(phones__isnull=True)
+        guardian_ids = list(guardians.values_list("id", flat=True))
+        chunk_size = options["chunk_size"]
+        written = 0
+        with statement_timeout(0):
+            for start in range(0, len(guardian_ids), chunk_size):
+                written += refresh_guardian_phones(
+                    guardian_ids[start:start + chunk_size],
+                    chunk_size=chunk_size
+                )
+                self.stdout.write(
+                    f"{min(start + chunk_size, len(guardian_ids))}/"
+                    f"{len(guardian_ids)} guardians"
+                )
+        self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully indexed {written} phone number(s)'
+                    )
+                )
@@ -0,0 +1,408 @@
+"""
+Time the main endpoints and bulk operations against a seeded school and
+count their queries, writing the results as JSON to compare commits.
+Everything runs in a transaction that is rolled back at the end, and each
+write is undone after every run, so runs are repeatable on the same data.
+"""
+import json
+import os
+import subprocess
+import time
+from io import StringIO
+from statistics import median
+from typing import Callable, Optional, Any
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import AcademicYear, Fee, StudentClass, User
+from utils.cache import CACHE_NAMESPACES, bump_namespace
+from utils.perf import summarise
+from utils.seed import CLASS_ORDER, seed_school
+
+
+# name -> (prepare, writes). prepare(admin) does the untimed set up and
+# returns the timed request as a callable
+BENCHMARKS = {}
+
+
+def benchmark(name: str, writes: bool = False):
+    """Register a benchmark under a name"""
+    def register(prepare: Callable) -> Callable:
+        BENCHMARKS[name] = (prepare, writes)
+        return prepare
+    return register
+
+
+def client_for(user) -> APIClient:
+    # A failing endpoint is reported with its status, not raised
+    client = APIClient(raise_request_exception=False)
+    client.force_authenticate(user=user)
+    return client
+
+
+def get(user, url_name: str, **params) -> Callable:
+    client = client_for(user)
+    url = reverse(url_name)
+    return lambda: client.get(url, params)
+
+
+@benchmark("dashboard")
+def dashboard(admin) -> Callable:
+    return get(admin, "dashboard:metrics")
+
+
+@benchmark("student_list")
+def student_list(admin) -> Callable:
+    return get(admin, "curriculum:student-list")
+
+
+@benchmark("student_metrics")
+def student_metrics(admin) -> Callable:
+    return get(admin, "curriculum:student-metrics")
+
+
+@benchmark("income_metrics")
+def income_metrics(admin) -> Callable:
+    return get(admin, "finance:income-metrics")
+
+
+@benchmark("expenditure_metrics")
+def expenditure_metrics(admin) -> Callable:
+    return get(admin, "finance:expenditure-metrics")
+
+
+@benchmark("transactions")
+def transactions(admin) -> Callable:
+    return get(admin, "finance:transactions")
+
+
+@benchmark("cashflow_series")
+def cashflow_series(admin) -> Callable:
+    return get(admin, "finance:cashflow-series")
+
+
+@benchmark("fees_owing")
+def fees_owing(admin) -> Callable:
+    return get(admin, "curriculum:student-class-owing", page_size=50)
+
+
+@benchmark("student_profile")
+def student_profile(admin) -> Callable:
+    """Profile of the student with the most payments"""
+    student_id = StudentClass.objects.filter(
+        academic_year__is_active=True
+    ).order_by("-fee_paid", "student__student_id").values_list(
+        "student_id", flat=True
+    ).first()
+    if student_id is None:
+        raise CommandError("No student in the active year")
+    client = client_for(admin)
+    url = reverse("curriculum:student-profile", args=[student_id])
+    return lambda: client.get(url)
+
+
+@benchmark("admin_payments")
+def admin_payments(admin) -> Callable:
+    """Payment changelist of the admin site, which uses the session"""
+    client = APIClient(raise_request_exception=False)
+    client.force_login(admin)
+    url = reverse("admin:core_payment_changelist")
+    return lambda: client.get(url)
+
+
+@benchmark("payment_post", writes=True)
+def payment_post(admin) -> Callable:
+    """A part payment by a student still owing this year"""
+    owing = StudentClass.objects.filter(
+        academic_year__is_active=True, owing=True
+    ).order_by(
+        "student__student_id"
+    ).first()
+    if owing is None:
+        raise CommandError("No student owes fees in the active year")
+    fee = Fee.objects.filter(
+        studentfeegroup=owing.fee_assigned
+    ).select_related("academic_term").order_by("name").first()
+    client = client_for(admin)
+    url = reverse("curriculum:payment-list")
+    data = {
+        "student": str(owing.student_id),
+        "fee": str(fee.id),
+        "academic_year": str(owing.academic_year_id),
+        "academic_term": str(fee.academic_term_id),
+        "amount": "1.00",
+        "payment_method": "Cash",
+    }
+    return lambda: client.post(url, data, format="json")
+
+
+@benchmark("payroll_run", writes=True)
+def payroll_run(admin) -> Callable:
+    client = client_for(admin)
+    url = reverse("finance:payrun-list")
+    return lambda: client.post(url, {}, format="json")
+
+
+@benchmark("payroll_preview")
+def payroll_preview(admin) -> Callable:
+    """A payroll run with another SSNIT rate, computed without saving"""
+    client = client_for(admin)
+    url = reverse("finance:payrun-preview")
+    return lambda: client.post(url, {"ssnit_rate": "6"}, format="json")
+
+
+@benchmark("rollover", writes=True)
+def rollover(admin) -> Callable:
+    return get(admin, "curriculum:academic-year-close-current")
+
+
+@benchmark("promotion", writes=True)
+def promotion(admin) -> Callable:
+    """Promote the largest class into the year a rollover just opened"""
+    current = AcademicYear.objects.get(is_active=True)
+    largest = StudentClass.objects.filter(
+        academic_year=current,
+        student_class__name__in=CLASS_ORDER[:-1]
+    ).values("student_class__name").annotate(
+        students=Count("id")
+    ).order_by("-students", "student_class__name").first()
+    if largest is None:
+        raise CommandError("No class to promote in the active year")
+    client = client_for(admin)
+    client.get(reverse("curriculum:academic-year-close-current"))
+    from_class = largest["student_class__name"]
+    data = {
+        "from_academic_year": current.year,
+        "to_academic_year": AcademicYear.objects.get(is_active=True).year,
+        "from_class": from_class,
+        "to_class": CLASS_ORDER[CLASS_ORDER.index(from_class) + 1],
+    }
+    url = reverse("curriculum:class-bulk-promote")
+    return lambda: client.post(url, data, format="json")
+
+
+def run_once(prepare: Callable, admin, warm: bool) -> tuple[float, int, int]:
+    """Wall time in ms, query count and status of one run, then undo it"""
+    savepoint = transaction.savepoint()
+    try:
+        request = prepare(admin)
+        if not warm:
+            for namespace in CACHE_NAMESPACES:
+                bump_namespace(namespace)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = request()
+            elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        transaction.savepoint_rollback(savepoint)
+    return elapsed, len(queries), response.status_code
+
+
+def git_commit() -> str:
+    """Commit being measured, the Heroku build's when git is missing"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return os.environ.get("SOURCE_VERSION", "unknown")[:7]
+
+
+def compare(baseline: dict, report: dict, threshold: float) -> list[dict]:
+    """Change of median time and queries per benchmark, regressions marked"""
+    rows = []
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        old_ms = before["wall_ms"]["median"]
+        new_ms = result["wall_ms"]["median"]
+        change = (new_ms - old_ms) / old_ms * 100 if old_ms else 0
+        rows.append({
+            "name": name,
+            "median_ms": [old_ms, new_ms],
+            "change_pct": round(change, 1),
+            "queries": [before["queries"], result["queries"]],
+            "regressed": (
+                change > threshold or result["queries"] > before["queries"]
+            ),
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Benchmark endpoints and bulk operations on a seeded school"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--students", type=int, default=2000)
+        parser.add_argument("--staff", type=int, default=100)
+        parser.add_argument(
+            "--years", type=int, default=3,
+            help="Academic years of payments"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=1,
+            help="Seed of the generated school, same seed same data"
+        )
+        parser.add_argument(
+            "--last-year", type=int,
+            help="Start year of the seeded active year (default: last year)"
+        )
+        parser.add_argument(
+            "--no-seed", action="store_true",
+            help="Measure the data already in the database"
+        )
+        parser.add_argument(
+            "--email",
+            help="User the requests are made as (default: seeded admin)"
+        )
+        parser.add_argument(
+            "--only", action="append",
+            choices=sorted(BENCHMARKS), help="Benchmark to run, repeatable"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="Timed runs per benchmark, after one warm up run"
+        )
+        parser.add_argument(
+            "--warm", action="store_true",
+            help="Keep the caches between runs instead of measuring misses"
+        )
+        parser.add_argument(
+            "--output",
+            help="JSON file for the results "
+                 "(default: benchmarks/<commit>.json)"
+        )
+        parser.add_argument(
+            "--compare", help="JSON results of an earlier run to compare to"
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=20,
+            help="Slow down in percent of the median counted as regression"
+        )
+        parser.add_argument(
+            "--fail-on-regression", action="store_true",
+            help="Exit with an error when a benchmark regressed"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Seed, run every benchmark and write the report"""
+        names = options["only"] or list(BENCHMARKS)
+        # Pages with static files render without a collectstatic run
+        storages = {
+            **settings.STORAGES, "staticfiles": {
+                "BACKEND":
+                    "django.contrib.staticfiles.storage.StaticFilesStorage"
+            }
+        }
+        # The replica would not see the rolled back data
+        with override_settings(
+            DB_REPLICA_READS=False, ALLOWED_HOSTS=["*"], STORAGES=storages
+        ):
+            try:
+                with transaction.atomic():
+                    report = self.run_benchmarks(names, options)
+                    transaction.set_rollback(True)
+            finally:
+                # Entries cached from the rolled back school; the on_commit
+                # bumps of the seeding never run
+                for namespace in CACHE_NAMESPACES:
+                    bump_namespace(namespace)
+
+        output = options["output"] or os.path.join(
+            settings.BASE_DIR, "benchmarks", f"{report['commit']}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        for name, result in report["results"].items():
+            self.stdout.write(
+                f"{name}: median {result['wall_ms']['median']} ms, "
+                f"{result['queries']} queries, status {result['status']}"
+            )
+        regressions = []
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as f:
+                baseline = json.load(f)
+            self.stdout.write(f"compared to {baseline.get('commit')}:")
+            for row in compare(baseline, report, options["threshold"]):
+                old_ms, new_ms = row["median_ms"]
+                old_queries, new_queries = row["queries"]
+                line = (
+                    f"  {row['name']}: {old_ms} -> {new_ms} ms "
+                    f"({row['change_pct']:+}%), "
+                    f"queries {old_queries} -> {new_queries}"
+                )
+                if row["regressed"]:
+                    regressions.append(row["name"])
+                    line = self.style.WARNING(f"{line} REGRESSED")
+                self.stdout.write(line)
+        if regressions and options["fail_on_regression"]:
+            raise CommandError(f"Regressed: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    def run_benchmarks(self, names: list, options: dict) -> dict:
+        dataset = None
+        email = options["email"]
+        if not options["no_seed"]:
+            try:
+                dataset = seed_school(
+                    students=options["students"], staff=options["staff"],
+                    years=options["years"], seed=options["seed"],
+                    last_year=options["last_year"]
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            email = email or dataset["admin"]
+            self.stdout.write(
+                f"Seeded {dataset['students']} students, "
+                f"{dataset['staff']} staff and {dataset['payments']} "
+                f"payments in {dataset['seconds']}s"
+            )
+            # The dashboards read the daily summaries of closed days
+            call_command("rollup_ledger", rebuild=True, stdout=StringIO())
+        admin = (
+            User.objects.filter(email=email).first() if email
+            else User.objects.filter(is_superuser=True).first()
+        )
+        if admin is None:
+            raise CommandError("No user to make the requests as, use --email")
+
+        results = {}
+        for name in names:
+            prepare, writes = BENCHMARKS[name]
+            run_once(prepare, admin, options["warm"])
+            runs = [
+                run_once(prepare, admin, options["warm"])
+                for _ in range(options["repeat"])
+            ]
+            times = [elapsed for elapsed, _, _ in runs]
+            results[name] = {
+                "writes": writes,
+                "wall_ms": {
+                    "min": round(min(times), 2),
+                    "median": round(median(times), 2),
+                    **summarise(times),
+                },
+                "queries": max(count for _, count, _ in runs),
+                "status": runs[-1][2],
+            }
+        return {
+            "commit": git_commit(),
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "dataset": dataset or {"seeded": False, "user": admin.email},
+            "repeat": options["repeat"],
+            "warm": options["warm"],
+            "results": results,
+        }
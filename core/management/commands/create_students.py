@@ -1,13 +1,14 @@
 """
 Create an initial data for students
+Generated students in the active academic year, or the students of the
+enrolment workbook with --excel
 """
 import random
 # import string
 # from faker import Faker
-from datetime import datetime
 from typing import Optional, Any
-from django.core.management.base import BaseCommand, CommandParser
-from django.db.utils import IntegrityError
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import transaction
 import openpyxl
 
 from core.models import (
@@ -17,19 +18,57 @@ from core.models import (
     Fee
     # User
 )
-from utils.utils import generate_random_string, get_initials
+from utils.db import statement_timeout
+from utils.seed import SchoolSeeder
+from utils.student_ids import next_student_id
 
 
 class Command(BaseCommand):
     help = "Create Students from initial data"
 
     def add_arguments(self, parser: CommandParser) -> None:
-        return super().add_arguments(parser)
+        parser.add_argument("--count", type=int, default=100)
+        parser.add_argument(
+            "--seed", type=int,
+            help="Seed of the generated data (default: random)"
+        )
+        parser.add_argument(
+            "--no-payments", action="store_true",
+            help="Leave every generated student owing the year's fees"
+        )
+        parser.add_argument(
+            "--email", help="User owning the payments (default: a superuser)"
+        )
+        parser.add_argument(
+            "--excel", nargs="?", const="Updated HHA Enr.xlsx",
+            help="Import the students of an enrolment workbook instead"
+        )
 
     def handle(self, *args: Any, **options: Any) -> Optional[str]:
         """Create students and Classes/levels, then add students"""
+        if options["excel"]:
+            return self.import_excel(options["excel"])
+        seeder = SchoolSeeder(
+            seed=options["seed"] or random.randrange(1, 10 ** 6)
+        )
+        try:
+            with statement_timeout(0), transaction.atomic():
+                seeder.load_school(email=options["email"])
+                seeder.add_students(
+                    options["count"], payments=not options["no_payments"]
+                )
+                seeder.finish()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully created {options["count"]} Students'
+                    )
+                )
 
-        student_dict, fee_group = extract_excel_data()
+    def import_excel(self, filename: str):
+        """Students, classes and fee groups of the enrolment workbook"""
+        student_dict, fee_group = extract_excel_data(filename)
         for class_name, students in student_dict.items():
             for row in students:
                 acad_year, _ = AcademicYear.objects.get_or_create(
@@ -45,9 +84,6 @@ class Command(BaseCommand):
                 middle_name = ""
                 if row["middle_name"] is None:
                     middle_name = ""
-                studentID = generate_random_string(length=8) + get_initials(
-                        row["first_name"], middle_name, row["last_name"]
-                )
 
                 try:
                     student = Student.objects.get(
@@ -56,31 +92,21 @@ class Command(BaseCommand):
                         middle_name=middle_name
                     )
                 except Student.DoesNotExist:
-                    try:
-                        student = Student.objects.create(
-                            student_id=studentID,
-                            gender=random.choice(["Male", "Female"]),
-                            first_name=row["first_name"],
-                            last_name=row["last_name"],
-                            middle_name=middle_name,
-                            date_of_birth=row["date_of_birth"],
-                            date_of_admission=row["date_of_admission"],
-                            blood_type=row["blood_group"]
-                        )
-                    except IntegrityError:
-                        studentID = generate_random_string(length=8) + get_initials(
-                                row["first_name"], middle_name, row["last_name"]
-                        ) + str(datetime.today().year)
-                        student = Student.objects.create(
-                            student_id=studentID,
-                            gender=random.choice(["Male", "Female"]),
-                            first_name=row["first_name"],
-                            last_name=row["last_name"],
-                            middle_name=middle_name,
-                            date_of_birth=row["date_of_birth"],
-                            date_of_admission=row["date_of_admission"],
-                            blood_type=row["blood_group"]
-                        )
+                    studentID = next_student_id(
+                        None, row["first_name"], middle_name, row["last_name"],
+                        # A date cell is a datetime, anything else is ignored
+                        year=getattr(row["date_of_admission"], "year", None)
+                    )
+                    student = Student.objects.create(
+                        student_id=studentID,
+                        gender=random.choice(["Male", "Female"]),
+                        first_name=row["first_name"],
+                        last_name=row["last_name"],
+                        middle_name=middle_name,
+                        date_of_birth=row["date_of_birth"],
+                        date_of_admission=row["date_of_admission"],
+                        blood_type=row["blood_group"]
+                    )
 
                 for item in fee_group:
                     fee_obj, _ = Fee.objects.get_or_create(
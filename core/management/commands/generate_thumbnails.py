@@ -0,0 +1,67 @@
+"""
+Render missing or stale thumbnails of student and staff photos
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection
+
+from utils.thumbnails import (
+    THUMBNAIL_FIELDS, generate_thumbnail, thumbnail_is_current
+)
+
+
+def render(model_label, pk):
+    """Render one thumbnail on a worker thread"""
+    try:
+        return generate_thumbnail(model_label, pk)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails for photos that do not have a current one"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="Thumbnails rendered in parallel"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Walk the photos and render the stale thumbnails"""
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            for model_label, (source_field, thumb_field) in \
+                    THUMBNAIL_FIELDS.items():
+                model = apps.get_model(model_label)
+                photos = model.objects.exclude(
+                    **{f"{source_field}__isnull": True}
+                ).exclude(**{source_field: ""}).only(
+                    "pk", source_field, thumb_field
+                )
+                pending = [
+                    instance.pk for instance in photos.iterator()
+                    if not thumbnail_is_current(instance)
+                ]
+                failed = 0
+                for pk, job in [
+                    (pk, executor.submit(render, model_label, pk))
+                    for pk in pending
+                ]:
+                    try:
+                        job.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stdout.write(
+                            self.style.WARNING(f"{model_label} {pk}: {e}")
+                        )
+                self.stdout.write(
+                    f"{model_label}: {len(pending) - failed} thumbnail(s) "
+                    f"generated, {failed} failed"
+                )
+        self.stdout.write(
+                self.style.SUCCESS(
+                    'Successfully generated the thumbnails'
+                    )
+                )
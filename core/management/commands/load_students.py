@@ -6,7 +6,6 @@ from pathlib import Path
 from decimal import Decimal
 from typing import Optional, Any
 from django.core.management.base import BaseCommand, CommandParser
-from django.db.utils import IntegrityError
 
 from core.models import (
     Student, Class, AcademicYear,
@@ -16,7 +15,7 @@ from core.models import (
     User,
     Payment
 )
-from utils.utils import generate_studentid
+from utils.student_ids import next_student_id
 
 _academic_year: str = "2024/2025"
 class_names = {
@@ -81,10 +80,6 @@ class Command(BaseCommand):
                     middle_name = row.get("middle_name", "")
                     if not middle_name:
                         middle_name: str = ""
-                    studentID = generate_studentid(
-                            row.get("first_name"), middle_name, row.get("last_name")
-                    )
-
                     try:
                         student = Student.objects.get(
                             first_name=row.get("first_name"),
@@ -92,25 +87,19 @@ class Command(BaseCommand):
                             middle_name=middle_name
                         )
                     except Student.DoesNotExist:
-                        try:
-                            student = Student.objects.create(
-                                student_id=studentID,
-                                gender=row.get("gender"),
-                                first_name=row.get("first_name"),
-                                last_name=row.get("last_name"),
-                                middle_name=middle_name,
-                            )
-                        except IntegrityError:
-                            studentID = generate_studentid(
-                                row.get("first_name"), middle_name, row.get("last_name")
-                                )
-                            student = Student.objects.create(
-                                student_id=studentID,
-                                gender=row["gender"],
-                                first_name=row.get("first_name"),
-                                last_name=row.get("last_name"),
-                                middle_name=middle_name,
-                            )
+                        # Numbers come from blocks reserved for the whole
+                        # import, unique without a retry
+                        studentID = next_student_id(
+                            finance_user.organization,
+                            row.get("first_name"), middle_name, row.get("last_name")
+                        )
+                        student = Student.objects.create(
+                            student_id=studentID,
+                            gender=row.get("gender"),
+                            first_name=row.get("first_name"),
+                            last_name=row.get("last_name"),
+                            middle_name=middle_name,
+                        )
                     print(row.get("class_name"))
                     fee_group: list[str] = [key for key, value in class_group_map.items() if row.get("class_name") in value]
 
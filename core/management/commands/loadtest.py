@@ -0,0 +1,106 @@
+"""
+Fire concurrent GET requests at a running server and report throughput and
+latency, to compare the sync (wsgi) and uvicorn (asgi) worker modes
+"""
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from typing import Optional, Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from utils.perf import summarise
+
+
+def fetch(url: str, token: Optional[str], timeout: float) -> tuple[int, float]:
+    """Status and latency in milliseconds of one GET"""
+    request = urllib.request.Request(url)
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            code = response.status
+    except urllib.error.HTTPError as e:
+        code = e.code
+    except (urllib.error.URLError, TimeoutError):
+        code = 0
+    return code, (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = "Load test endpoints of a running server"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--base-url", default="http://127.0.0.1:8000",
+            help="Server to test, started in the mode being measured"
+        )
+        parser.add_argument(
+            "--path", action="append", dest="paths",
+            help="Endpoint to request, repeat for a mix "
+                 "(default: dashboard and income metrics)"
+        )
+        parser.add_argument(
+            "--token", help="JWT access token sent as a Bearer token"
+        )
+        parser.add_argument(
+            "--requests", type=int, default=500,
+            help="Total number of requests"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=20,
+            help="Requests in flight at once"
+        )
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument(
+            "--label", default="",
+            help="Name of the run in the output, e.g. wsgi-2-workers"
+        )
+        parser.add_argument(
+            "--json", action="store_true",
+            help="Print the result as JSON, to keep runs side by side"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Run the requests and print the summary"""
+        paths = options["paths"] or [
+            "/api/dashboard/metrics/", "/api/finance/income/metrics/"
+        ]
+        urls = cycle(
+            options["base_url"].rstrip("/") + path for path in paths
+        )
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            jobs = [
+                pool.submit(
+                    fetch, next(urls), options["token"], options["timeout"]
+                )
+                for _ in range(options["requests"])
+            ]
+            results = [job.result() for job in jobs]
+        elapsed = time.perf_counter() - start
+
+        statuses = {}
+        for code, _ in results:
+            statuses[str(code)] = statuses.get(str(code), 0) + 1
+        report = {
+            "label": options["label"],
+            "paths": paths,
+            "requests": len(results),
+            "concurrency": options["concurrency"],
+            "seconds": round(elapsed, 2),
+            "requests_per_second": round(len(results) / elapsed, 1),
+            "latency_ms": summarise([latency for _, latency in results]),
+            "statuses": statuses,
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+        for key, value in report.items():
+            self.stdout.write(f"{key}: {value}")
+        self.stdout.write(self.style.SUCCESS("Load test complete"))
@@ -0,0 +1,145 @@
+"""
+Measure what Django startup spends its time on: wall time of setup (what
+a worker boot or a management command pays) and of loading the URLconf
+(paid by the first request), with import time per app and module from
+python -X importtime in a fresh interpreter
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Optional, Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+
+# Run in the child interpreter, prints the phase timings as JSON
+STARTUP_SCRIPT = """
+import json, os, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+if {urls}:
+    from django.conf import settings
+    from django.urls import get_resolver
+    get_resolver(settings.ROOT_URLCONF).url_patterns
+end = time.perf_counter()
+print(json.dumps({{
+    "setup_ms": round((setup - start) * 1000, 1),
+    "urls_ms": round((end - setup) * 1000, 1) if {urls} else None,
+}}))
+"""
+
+
+def parse_importtime(output: str) -> list[dict]:
+    """Rows of python -X importtime: module, self and cumulative ms, depth"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return rows
+
+
+def app_of(module: str, local_apps: set) -> str:
+    """Project app or third party distribution a module belongs to"""
+    top = module.split(".")[0]
+    if top in local_apps:
+        return top
+    if top == "django" and module.startswith("django.contrib."):
+        return ".".join(module.split(".")[:3])
+    return top
+
+
+class Command(BaseCommand):
+    help = "Report Django startup time per phase, app and module"
+    requires_system_checks = []
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--urls", action="store_true",
+            help="Also load the URLconf, views and serializers"
+        )
+        parser.add_argument(
+            "--limit", type=int, default=15,
+            help="Number of apps and modules listed"
+        )
+        parser.add_argument(
+            "--json", action="store_true",
+            help="Print the result as JSON, to keep runs side by side"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Start Django in a fresh interpreter and summarise its imports"""
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+        result = subprocess.run(
+            [
+                sys.executable, "-X", "importtime", "-c",
+                STARTUP_SCRIPT.format(urls=bool(options["urls"]))
+            ],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            self.stderr.write(result.stderr[-2000:])
+            return
+        phases = json.loads(result.stdout.strip().splitlines()[-1])
+        rows = parse_importtime(result.stderr)
+
+        local_apps = {
+            name.split(".")[0] for name in os.listdir(settings.BASE_DIR)
+            if os.path.isdir(os.path.join(settings.BASE_DIR, name))
+        }
+        apps = defaultdict(float)
+        for row in rows:
+            apps[app_of(row["module"], local_apps)] += row["self_ms"]
+        limit = options["limit"]
+        report = {
+            **phases,
+            "import_ms": round(sum(row["self_ms"] for row in rows), 1),
+            "modules_imported": len(rows),
+            "apps": [
+                {"app": app, "self_ms": round(total, 1)}
+                for app, total in sorted(
+                    apps.items(), key=lambda item: item[1], reverse=True
+                )[:limit]
+            ],
+            # Imports started by startup itself, their cumulative time is
+            # what dropping or deferring them would save
+            "modules": [
+                {
+                    "module": row["module"],
+                    "cumulative_ms": round(row["cumulative_ms"], 1),
+                }
+                for row in sorted(
+                    (row for row in rows if row["depth"] == 0),
+                    key=lambda row: row["cumulative_ms"], reverse=True
+                )[:limit]
+            ],
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(f"setup_ms: {report['setup_ms']}")
+        if report["urls_ms"] is not None:
+            self.stdout.write(f"urls_ms: {report['urls_ms']}")
+        self.stdout.write(
+            f"import_ms: {report['import_ms']} "
+            f"({report['modules_imported']} modules)"
+        )
+        self.stdout.write("apps (self ms):")
+        for row in report["apps"]:
+            self.stdout.write(f"  {row['app']}: {row['self_ms']}")
+        self.stdout.write("modules (cumulative ms):")
+        for row in report["modules"]:
+            self.stdout.write(f"  {row['module']}: {row['cumulative_ms']}")
+        self.stdout.write(self.style.SUCCESS("Startup profile complete"))
@@ -0,0 +1,23 @@
+"""
+Delete the Idempotency-Key records whose replay window has passed
+"""
+from typing import Optional, Any
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete expired idempotency keys"
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Delete every key past its expiry"""
+        deleted, _ = IdempotencyKey.objects.filter(
+            expires_at__lte=timezone.now()
+        ).delete()
+        self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully deleted {deleted} expired idempotency keys'
+                    )
+                )
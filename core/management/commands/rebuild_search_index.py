@@ -0,0 +1,40 @@
+"""
+Rebuild the student search index of utils.search, for students imported
+without signals or after a change to what is indexed
+"""
+from typing import Optional, Any
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.models import Student
+from utils.db import statement_timeout
+from utils.search import CHUNK_SIZE, refresh_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of students and their guardians"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--missing", action="store_true",
+            help="Only index students without a search row"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=CHUNK_SIZE,
+            help="Students indexed per statement"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Index the students chunk by chunk"""
+        students = Student.objects.all()
+        if options["missing"]:
+            students = students.filter(search_index__isnull=True)
+        student_ids = list(students.values_list("id", flat=True))
+        with statement_timeout(0):
+            indexed = refresh_search_index(
+                student_ids, chunk_size=options["chunk_size"]
+            )
+        self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully indexed {indexed} student(s)'
+                    )
+                )
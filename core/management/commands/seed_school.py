@@ -0,0 +1,49 @@
+"""
+Create a whole generated school for load testing and local work
+"""
+from typing import Optional, Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from utils.db import statement_timeout
+from utils.seed import seed_school
+
+
+class Command(BaseCommand):
+    help = "Seed a school of students, staff and years of payments"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--students", type=int, default=500)
+        parser.add_argument("--staff", type=int, default=50)
+        parser.add_argument(
+            "--years", type=int, default=3,
+            help="Academic years of class assignments and payments"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=1,
+            help="Seed of the generated data, same seed same school"
+        )
+        parser.add_argument(
+            "--last-year", type=int,
+            help="Start year of the active academic year (default: last year)"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Generate the school in one transaction"""
+        try:
+            # COPY of a large school outlasts the interactive timeout
+            with statement_timeout(0):
+                summary = seed_school(
+                    students=options["students"], staff=options["staff"],
+                    years=options["years"], seed=options["seed"],
+                    last_year=options["last_year"]
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
+        self.stdout.write(
+                self.style.SUCCESS(
+                    f"Seeded {summary['academic_year']}, sign in as "
+                    f"{summary['admin']} with password seed-{options['seed']}"
+                    )
+                )
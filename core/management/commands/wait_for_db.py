@@ -3,14 +3,15 @@ Django command to wait for the database to be available.
 """
 import time
 
-from psycopg2 import OperationalError as Psycopg2OpError
-
+from django.db import connections
 from django.db.utils import OperationalError
 from django.core.management.base import BaseCommand
 
 
 class Command(BaseCommand):
     """Django command to wait for database."""
+    # System checks import every URLconf and view, only the database matters
+    requires_system_checks = []
 
     def handle(self, *args, **options):
         """Entrypoint for command."""
@@ -18,9 +19,9 @@ class Command(BaseCommand):
         db_up = False
         while db_up is False:
             try:
-                self.check(databases=['default'])
+                connections['default'].ensure_connection()
                 db_up = True
-            except (Psycopg2OpError, OperationalError):
+            except OperationalError:
                 self.stdout.write('Database unavailable, waiting 1 second...')
                 time.sleep(1)
         self.stdout.write(self.style.SUCCESS('Database available!'))
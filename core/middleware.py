@@ -0,0 +1,181 @@
+"""
+Middleware for the API
+"""
+import re
+import time
+from uuid import uuid4
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from utils.log_handlers import request_id
+from utils.perf import (
+    RequestMetrics, current_metrics, install_query_timer,
+    install_serializer_timer, perf_stats
+)
+from utils.replica import pin_to_primary
+
+
+# Heroku's router and most proxies send one, keep theirs when it is sane
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,200}$")
+
+
+class RequestIdMiddleware:
+    """Tag every log record of a request with one id, echoed in X-Request-ID"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    def start(self, request):
+        incoming = request.headers.get("X-Request-ID", "")
+        current = incoming if REQUEST_ID_PATTERN.match(incoming) else uuid4().hex
+        request.request_id = current
+        return request_id.set(current)
+
+
+class PerfMiddleware:
+    """
+    Time each request: wall, DB queries, serializers and response size.
+    Adds a Server-Timing header and feeds the per view/action statistics
+    served by the dashboard perf endpoint
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        if settings.PERF_ENABLED:
+            install_serializer_timer()
+            connection_created.connect(
+                install_query_timer, dispatch_uid="perf-query-timer"
+            )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.PERF_ENABLED:
+            return self.get_response(request)
+        # Connections opened before the middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(metrics, start, response)
+
+    async def __acall__(self, request):
+        if not settings.PERF_ENABLED:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(metrics, start, response)
+
+    def finish(self, metrics, start, response):
+        wall = (time.perf_counter() - start) * 1000
+        size = 0 if response.streaming else len(response.content)
+        response["Server-Timing"] = ", ".join([
+            f"app;dur={wall:.1f}",
+            f'db;dur={metrics.db_time:.1f};desc="{metrics.db_count} queries"',
+            f"ser;dur={metrics.serializer_time:.1f}",
+        ])
+        if metrics.view:
+            perf_stats.record(metrics.view, {
+                "wall_ms": wall,
+                "db_queries": metrics.db_count,
+                "db_ms": metrics.db_time,
+                "serializer_ms": metrics.serializer_time,
+                "response_bytes": size,
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return None
+        view_class = getattr(view_func, "cls", None) or getattr(
+            view_func, "view_class", None
+            )
+        name = view_class.__name__ if view_class else view_func.__name__
+        action = (getattr(view_func, "actions", None) or {}).get(
+            request.method.lower()
+            )
+        metrics.view = f"{request.method} {name}" + (
+            f".{action}" if action else ""
+            )
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pin a user to the primary database after a successful write, so the
+    reports they open next include it while the replica catches up.
+    DRF authenticates in the view and hands the user back to the request,
+    so the JWT user is known once the response is ready
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.is_write(request, response):
+            pin_to_primary(request.user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.is_write(request, response):
+            await sync_to_async(pin_to_primary)(request.user)
+        return response
+
+    def is_write(self, request, response) -> bool:
+        return (
+            request.method not in ("GET", "HEAD", "OPTIONS")
+            and response.status_code < 400
+            and hasattr(request, "user")
+        )
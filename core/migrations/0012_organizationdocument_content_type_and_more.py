@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_studentfeegroup_academic_year'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationdocument',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='organizationdocument',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Size in bytes, set on upload', null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:53
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_organizationdocument_content_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadTicket',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('target', models.CharField(choices=[('Document', 'Document'), ('Invoice', 'Invoice'), ('StudentImage', 'StudentImage'), ('StaffPicture', 'StaffPicture')], max_length=100)),
+                ('object_id', models.UUIDField(blank=True, help_text='Expenditure/Student/Staff receiving the file', null=True)),
+                ('name', models.CharField(help_text='Storage name of the file', max_length=500, unique=True)),
+                ('content_type', models.CharField(max_length=255)),
+                ('max_size', models.PositiveBigIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('details', models.JSONField(blank=True, help_text='Name, description and type of a new document', null=True)),
+                ('status', models.CharField(choices=[('Issued', 'Issued'), ('Confirmed', 'Confirmed')], default='Issued', max_length=100)),
+                ('size', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('checksum', models.CharField(blank=True, max_length=255, null=True)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.organizationdocument')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_uploadticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='profile_picture_thumbnail',
+            field=models.ImageField(blank=True, editable=False, help_text='Resized copy of profile_picture, generated in the background', null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, help_text='Resized copy of image, generated in the background', null=True, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:37
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    pg_trgm comes with the Postgres contrib modules, which some servers do
+    not have. Without it utils.search matches words and prefixes only.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS student_search_trgm_idx "
+        "ON core_studentsearchindex USING gin (document gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS student_search_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_staff_profile_picture_thumbnail_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSearchIndex',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('names', models.TextField(blank=True, default='', help_text='Names and student id')),
+                ('guardians', models.TextField(blank=True, default='')),
+                ('phones', models.TextField(blank=True, default='')),
+                ('document', models.TextField(blank=True, default='', help_text='Names, student id and guardians, for trigram matching')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(blank=True, null=True)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_index', to='core.student')),
+            ],
+            options={
+                'verbose_name_plural': 'Student Search Index',
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='student_search_vector_idx')],
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
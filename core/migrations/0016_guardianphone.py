@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:42
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_studentsearchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GuardianPhone',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('field', models.CharField(choices=[('mobile_number', 'Mobile'), ('father_telephone', 'Father'), ('mother_telephone', 'Mother')], max_length=50)),
+                ('number', models.CharField(db_index=True, max_length=16)),
+                ('guardian', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='phones', to='core.parentorguardian')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('guardian', 'field'), name='unique_guardian_phone_field')],
+            },
+        ),
+    ]
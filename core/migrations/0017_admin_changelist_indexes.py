@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_guardianphone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='arrearpayment',
+            index=models.Index(fields=['-date_created', '-id'], name='arrear_payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feearrear',
+            index=models.Index(fields=['academic_year', '-date_created', '-id'], name='fee_arrear_year_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['-date_created', '-id'], name='payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['academic_year', '-date_created', '-id'], name='payment_year_created_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:04
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('value', models.BigIntegerField(default=0, help_text='Last number reserved')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='receipt_prefix',
+            field=models.CharField(blank=True, default='', help_text='Start of receipt numbers, the initials of the name if blank', max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:08
+
+import core.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_counter_receipt_prefix'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='student_id_pattern',
+            field=models.CharField(default='{prefix}{year}{number:05d}{check}', help_text='Fields: {prefix} (initials of the name), {initials} (of the student), {year}, {number} and {check} (digit)', max_length=100, validators=[core.utils.validate_student_id_pattern]),
+        ),
+    ]
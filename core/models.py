@@ -4,7 +4,9 @@ All database models go here
 from decimal import Decimal
 from typing import Collection, Any
 from uuid import uuid4
-from django.db import models
+from django.db import models, transaction
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 # from django.forms.models import model_to_dict
 # from django.utils.translation import gettext as _
 from django.core.exceptions import ValidationError
@@ -28,7 +30,13 @@ from .utils import (
     EmploymentType,
     ResidencyChoices,
     get_upload_path,
-    PaymentMethod
+    file_metadata,
+    PaymentMethod,
+    UploadTarget,
+    UploadStatus,
+    GuardianPhoneField,
+    DEFAULT_STUDENT_ID_PATTERN,
+    validate_student_id_pattern
 )
 
 UserTypes = tuple((item.value, item.name) for item in list(UserType))
@@ -45,6 +53,11 @@ EmploymentTypes = tuple(
 ResidencyChoices_list = tuple(
     (item.value, item.name) for item in list(ResidencyChoices))
 PaymentMethods = tuple((item.value, item.name) for item in list(PaymentMethod))
+UploadTargets = tuple((item.value, item.name) for item in list(UploadTarget))
+UploadStatuses = tuple((item.value, item.name) for item in list(UploadStatus))
+GuardianPhoneFields = tuple(
+    (item.value, item.name) for item in list(GuardianPhoneField)
+    )
 
 
 class UserManager(BaseUserManager):
@@ -117,6 +130,16 @@ class OrganizationConfig(models.Model):
         help_text="TIN for the school/church/business"
     )
     payroll_approval_required = models.BooleanField(default=False)
+    receipt_prefix = models.CharField(
+        max_length=20, blank=True, default="",
+        help_text="Start of receipt numbers, the initials of the name if blank"
+        )
+    student_id_pattern = models.CharField(
+        max_length=100, default=DEFAULT_STUDENT_ID_PATTERN,
+        validators=[validate_student_id_pattern],
+        help_text="Fields: {prefix} (initials of the name), {initials} "
+                  "(of the student), {year}, {number} and {check} (digit)"
+        )
 
     def __str__(self):
         return self.name
@@ -242,10 +265,21 @@ class OrganizationDocument(models.Model):
         max_length=300, null=True, blank=True,
         choices=DocumentTypeChoices_list
     )
+    file_size = models.PositiveBigIntegerField(
+        null=True, blank=True, help_text="Size in bytes, set on upload"
+        )
+    content_type = models.CharField(max_length=255, null=True, blank=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        file_size, content_type = file_metadata(self.file)
+        if file_size is not None:
+            self.file_size = file_size
+            self.content_type = content_type
+        super().save(*args, **kwargs)
+
 
 class Student(models.Model):
     """Student model: Studentid is dob,fn, ln combination"""
@@ -270,6 +304,10 @@ class Student(models.Model):
     blood_type = models.CharField(max_length=150, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     image = models.ImageField(upload_to="students", null=True, blank=True)
+    image_thumbnail = models.ImageField(
+        null=True, blank=True, editable=False,
+        help_text="Resized copy of image, generated in the background"
+        )
     address = models.CharField(max_length=300, null=True, blank=True)
 
     def __str__(self):
@@ -353,6 +391,10 @@ class Staff(models.Model):
     is_active = models.BooleanField(default=True)
     profile_picture = models.ImageField(
         upload_to="staff", null=True, blank=True)
+    profile_picture_thumbnail = models.ImageField(
+        null=True, blank=True, editable=False,
+        help_text="Resized copy of profile_picture, generated in the background"
+        )
     staff_type = models.CharField(
         max_length=100, choices=StaffTypes,
         default="Teaching"
@@ -516,10 +558,10 @@ class StudentClass(models.Model):
         if self.academic_year:
             if self.academic_year.previous:
                 "Check if student has an outstanding fee"
-                previous_fee = self.__class__.objects.get(
+                previous_fee = self.__class__.objects.filter(
                     student=self.student, academic_year=self.academic_year.previous
-                    )
-                if previous_fee.fee_owing:
+                    ).first()
+                if previous_fee and previous_fee.fee_owing:
                     fee_owing_from_previous_year = previous_fee.fee_owing
         if self.fee_assigned:
             total_fees_assigned = self.fee_assigned.fees.all().aggregate(
@@ -594,6 +636,16 @@ class FeeArrear(models.Model):
                 name="unique_student_arrears"
                 )
         ]
+        indexes = [
+            # Admin changelist of a year, newest first
+            models.Index(
+                fields=["academic_year", "-date_created", "-id"],
+                name="fee_arrear_year_created_idx"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.student} - {self.academic_year}"
 
     def validate_constraints(self, exclude: Collection[str] | None = ...) -> None:
         super().validate_constraints(exclude)
@@ -639,6 +691,19 @@ class Payment(models.Model):
     )
     cheque_number = models.CharField(max_length=250, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Admin changelist and date hierarchy, all years or one year,
+            # newest first
+            models.Index(
+                fields=["-date_created", "-id"], name="payment_created_idx"
+            ),
+            models.Index(
+                fields=["academic_year", "-date_created", "-id"],
+                name="payment_year_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Payment for {self.student}"
 
@@ -649,31 +714,36 @@ class Payment(models.Model):
                 message=f"Payment amount is greater than the fee amount {self.amount} {self.academic_term}",
                 code="payment_error",
             )
-        print(hasattr(self.student, "studentclass_object"))
-        totalassigned = self.student.studentclass_object.fee_assigned.fees.all(
-
-        ).aggregate(
-                models.Sum("amount")
+        with transaction.atomic():
+            # The class row of the student is the lock every payment of the
+            # student and year takes, so concurrent postings read each
+            # other's payments instead of the same stale total
+            student_class = StudentClass.objects.select_for_update().filter(
+                student_id=self.student_id,
+                academic_year_id=self.academic_year_id
+            ).first()
+            if student_class is None or student_class.fee_assigned_id is None:
+                raise ValidationError(
+                    message="The student has no fees assigned for the academic year",
+                    code="payment_error",
+                )
+            totalassigned = Fee.objects.filter(
+                studentfeegroup=student_class.fee_assigned_id
+            ).aggregate(models.Sum("amount"))
+            total_historic_payment = Payment.objects.filter(
+                student_id=self.student_id,
+                academic_year_id=self.academic_year_id
+            ).exclude(pk=self.pk).aggregate(models.Sum("amount"))
+            amount_paid = self.amount + (
+                total_historic_payment["amount__sum"] or 0
             )
-        total_historic_payment = Payment.objects.filter(
-            student=self.student, academic_year=self.academic_year
-            ).aggregate(
-                models.Sum("amount")
+            self.owing_after_payment = (
+                (totalassigned["amount__sum"] or 0) - amount_paid
             )
-        if total_historic_payment["amount__sum"]:
-            amount_paid = self.amount + total_historic_payment["amount__sum"]
-            self.owing_after_payment = totalassigned["amount__sum"] - amount_paid
-        else:
-            amount_paid = self.amount
-            self.owing_after_payment = totalassigned["amount__sum"] - amount_paid
-        # Update the current balance of the student
-        print(amount_paid)
-        self.student.studentclass_fee.fee_paid = amount_paid
-        self.student.save()
-        # self.student.studentclass_fee = amount_paid
-        self.student.studentclass_object.save()
-
-        super().save(*args, **kwargs)
+            super().save(*args, **kwargs)
+            # Update the current balance of the student, this payment
+            # included; raises and rolls back on an overpayment
+            student_class.save()
 
 
 class ArrearPayment(models.Model):
@@ -705,6 +775,14 @@ class ArrearPayment(models.Model):
     )
     cheque_number = models.CharField(max_length=250, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-date_created", "-id"],
+                name="arrear_payment_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Arrear Payment for {self.fee_arrear.student}"
 
@@ -713,17 +791,22 @@ class ArrearPayment(models.Model):
         if self.fee_arrear.amount < self.amount:
             raise ValidationError("Payment amount is greater than the arrear amount")
 
-        all_payments = self.__class__.objects.filter(
-            fee_arrear=self.fee_arrear
-            ).aggregate(models.Sum("amount"))
-        amount_paid = self.amount
-        if all_payments["amount__sum"]:
-            amount_paid = self.amount + all_payments["amount__sum"]
-        self.owing_after_payment = self.fee_arrear.amount - amount_paid
+        with transaction.atomic():
+            # Payments of an arrear are posted one at a time
+            self.fee_arrear = FeeArrear.objects.select_for_update().get(
+                pk=self.fee_arrear_id
+            )
+            all_payments = self.__class__.objects.filter(
+                fee_arrear=self.fee_arrear
+                ).exclude(pk=self.pk).aggregate(models.Sum("amount"))
+            amount_paid = self.amount
+            if all_payments["amount__sum"]:
+                amount_paid = self.amount + all_payments["amount__sum"]
+            self.owing_after_payment = self.fee_arrear.amount - amount_paid
 
-        self.fee_arrear.arrear_balance = self.owing_after_payment
-        self.fee_arrear.save()
-        super().save(*args, **kwargs)
+            self.fee_arrear.arrear_balance = self.owing_after_payment
+            self.fee_arrear.save()
+            super().save(*args, **kwargs)
 
 
 class PaymentReceipt(models.Model):
@@ -773,3 +856,170 @@ class TeacherClass(models.Model):
                 name="unique_teacher_classes"
                 )
         ]
+
+
+class UploadTicket(models.Model):
+    """Presigned direct upload to the bucket, registered on confirmation"""
+    id = models.UUIDField(
+        primary_key=True,
+        unique=True, db_index=True,
+        default=uuid4, editable=False
+    )
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    target = models.CharField(max_length=100, choices=UploadTargets)
+    object_id = models.UUIDField(
+        null=True, blank=True,
+        help_text="Expenditure/Student/Staff receiving the file"
+        )
+    name = models.CharField(
+        max_length=500, unique=True, help_text="Storage name of the file"
+        )
+    content_type = models.CharField(max_length=255)
+    max_size = models.PositiveBigIntegerField()
+    expires_at = models.DateTimeField()
+    details = models.JSONField(
+        null=True, blank=True,
+        help_text="Name, description and type of a new document"
+        )
+    status = models.CharField(
+        max_length=100, choices=UploadStatuses, default="Issued"
+        )
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    checksum = models.CharField(max_length=255, null=True, blank=True)
+    document = models.ForeignKey(
+        OrganizationDocument, on_delete=models.SET_NULL,
+        null=True, blank=True
+        )
+
+    def __str__(self):
+        return f"{self.target} upload {self.name}"
+
+
+class StudentSearchIndex(models.Model):
+    """
+    Search document of a student: names, student id and the names and
+    phones of the guardians. Kept up to date by utils.search
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        unique=True, db_index=True,
+        default=uuid4, editable=False
+    )
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    student = models.OneToOneField(
+        Student, on_delete=models.CASCADE, related_name="search_index"
+        )
+    names = models.TextField(
+        blank=True, default="", help_text="Names and student id"
+        )
+    guardians = models.TextField(blank=True, default="")
+    phones = models.TextField(blank=True, default="")
+    document = models.TextField(
+        blank=True, default="",
+        help_text="Names, student id and guardians, for trigram matching"
+        )
+    search_vector = SearchVectorField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Search index of {self.student_id}"
+
+    class Meta:
+        verbose_name_plural = "Student Search Index"
+        # The trigram index of document is made by migration 0015 only
+        # where the pg_trgm extension is available
+        indexes = [
+            GinIndex(
+                fields=["search_vector"], name="student_search_vector_idx"
+                ),
+        ]
+
+
+class GuardianPhone(models.Model):
+    """
+    Phone numbers of a guardian in E.164 form (+233241234567), one row per
+    phone field, for finding a caller. Kept up to date by utils.phones
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        unique=True, db_index=True,
+        default=uuid4, editable=False
+    )
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    guardian = models.ForeignKey(
+        ParentOrGuardian, on_delete=models.CASCADE, related_name="phones"
+        )
+    field = models.CharField(max_length=50, choices=GuardianPhoneFields)
+    number = models.CharField(max_length=16, db_index=True)
+
+    def __str__(self):
+        return self.number
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["guardian", "field"],
+                name="unique_guardian_phone_field"
+            ),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Result of a POST sent with an Idempotency-Key header, returned again
+    when the client retries the same request until expires_at
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        unique=True, db_index=True,
+        default=uuid4, editable=False
+    )
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    fingerprint = models.CharField(
+        max_length=64, help_text="SHA-256 of the request body"
+        )
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.TextField(
+        null=True, blank=True, help_text="JSON body sent the first time"
+        )
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"],
+                name="unique_user_idempotency_key"
+                )
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.key})"
+
+
+class Counter(models.Model):
+    """
+    Named counter handing out numbers in blocks, e.g. the receipt numbers
+    of an organization and year (see utils.counters)
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        unique=True, db_index=True,
+        default=uuid4, editable=False
+    )
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    name = models.CharField(max_length=255, unique=True)
+    value = models.BigIntegerField(
+        default=0, help_text="Last number reserved"
+        )
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
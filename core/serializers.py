@@ -6,6 +6,7 @@ from rest_framework import serializers
 from core.models import (
     DatabaseActionLog, OrganizationDocument,
     OrganizationConfig,
+    UploadTicket,
     AcademicTerm,
     AcademicYear
 )
@@ -22,7 +23,8 @@ from core.utils import (
     StaffType,
     UserType,
     GenderChoices,
-    PaymentMethod
+    PaymentMethod,
+    UploadTarget
     )
 
 
@@ -120,9 +122,12 @@ class OrganizationDocumentSerializer(serializers.ModelSerializer):
         fields = [
             "id", "date_created", "last_modified",
             "file", "name", "description",
-            "file_type",
+            "file_type", "file_size", "content_type",
+        ]
+        read_only_fields = [
+            "id", "date_created", "last_modified",
+            "file_size", "content_type",
         ]
-        read_only_fields = ["id", "date_created", "last_modified"]
 
     def create(self, validated_data):
         user = self.context["request"].user
@@ -130,6 +135,36 @@ class OrganizationDocumentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class UploadTicketSerializer(serializers.ModelSerializer):
+    """Serializer for the direct upload tickets"""
+    filename = serializers.CharField(write_only=True)
+    target = serializers.ChoiceField(
+        choices=[item.value for item in UploadTarget]
+    )
+    file_size = serializers.IntegerField(
+        write_only=True, required=False, min_value=1,
+        help_text="Size announced by the client in bytes"
+    )
+    description = serializers.CharField(write_only=True, required=False)
+    file_type = serializers.CharField(write_only=True, required=False)
+    document_name = serializers.CharField(write_only=True, required=False)
+
+    class Meta:
+        model = UploadTicket
+        fields = [
+            "id", "date_created", "last_modified",
+            "target", "object_id", "name", "content_type",
+            "max_size", "expires_at", "status", "size",
+            "checksum", "document", "filename", "file_size",
+            "description", "file_type", "document_name",
+        ]
+        read_only_fields = [
+            "id", "date_created", "last_modified",
+            "name", "max_size", "expires_at", "status",
+            "size", "checksum", "document",
+        ]
+
+
 class OrganizationConfigSerializer(serializers.ModelSerializer):
     """Serializer for the School config"""
     file_types = serializers.ReadOnlyField(
@@ -0,0 +1,127 @@
+"""
+Signal receivers for the core app
+"""
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from core.models import (
+    ArrearPayment, FeeArrear, ParentOrGuardian, Payment, Staff, Student,
+    StudentClass
+)
+from utils.cache import connect_invalidation
+from utils.phones import GUARDIAN_PHONE_FIELDS, refresh_guardian_phones
+from utils.search import STUDENT_SEARCH_FIELDS, refresh_search_index
+from utils.student_profile import forget_student_profile
+from utils.thumbnails import (
+    THUMBNAIL_FIELDS, schedule_thumbnail, thumbnail_is_current
+)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Staff)
+def refresh_photo_thumbnail(sender, instance, **kwargs):
+    """Render a new thumbnail when the photo changes, drop it if removed"""
+    if kwargs.get("raw") or thumbnail_is_current(instance):
+        return
+    source_field, thumb_field = THUMBNAIL_FIELDS[sender._meta.label]
+    if getattr(instance, source_field):
+        schedule_thumbnail(instance)
+    else:
+        sender.objects.filter(pk=instance.pk).update(**{thumb_field: None})
+
+
+def reindex(student_ids) -> None:
+    """
+    Refresh the search rows of students in the writing transaction, and
+    drop their cached profiles, which list their guardians
+    """
+    student_ids = list(student_ids)
+    if student_ids:
+        refresh_search_index(student_ids)
+    for student_id in student_ids:
+        forget_student_profile(student_id)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=FeeArrear)
+@receiver(post_delete, sender=FeeArrear)
+@receiver(post_save, sender=StudentClass)
+@receiver(post_delete, sender=StudentClass)
+def forget_profile(sender, instance, **kwargs):
+    """Balances of the student changed"""
+    forget_student_profile(instance.student_id)
+
+
+@receiver(post_save, sender=ArrearPayment)
+@receiver(post_delete, sender=ArrearPayment)
+def forget_arrear_payer_profile(sender, instance, **kwargs):
+    forget_student_profile(instance.fee_arrear.student_id)
+
+
+@receiver(post_delete, sender=Student)
+def forget_deleted_student(sender, instance, **kwargs):
+    forget_student_profile(instance.pk)
+
+
+@receiver(post_save, sender=Student)
+def index_student(sender, instance, update_fields=None, **kwargs):
+    if kwargs.get("raw"):
+        return
+    # Dropped at once only, a read racing a rename would show the old name
+    # until the student's next change
+    forget_student_profile(instance.pk, after_commit=False)
+    if update_fields is None or STUDENT_SEARCH_FIELDS & set(update_fields):
+        refresh_search_index([instance.pk])
+
+
+@receiver(post_save, sender=ParentOrGuardian)
+def index_guardian_students(sender, instance, **kwargs):
+    if not kwargs.get("raw"):
+        reindex(instance.students.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=ParentOrGuardian)
+def index_guardian_phones(sender, instance, update_fields=None, **kwargs):
+    if kwargs.get("raw"):
+        return
+    if update_fields is not None and not GUARDIAN_PHONE_FIELDS & set(
+        update_fields
+    ):
+        return
+    refresh_guardian_phones([instance.pk])
+
+
+@receiver(m2m_changed, sender=ParentOrGuardian.students.through)
+def index_linked_students(sender, instance, action, reverse, pk_set,
+                          **kwargs):
+    """Students gaining or losing a guardian, from either side"""
+    if reverse:
+        # instance is a student
+        if action in ("post_add", "post_remove", "post_clear"):
+            reindex([instance.pk])
+    elif action == "pre_clear":
+        instance._search_students = list(
+            instance.students.values_list("id", flat=True)
+        )
+    elif action == "post_clear":
+        reindex(getattr(instance, "_search_students", []))
+    elif action in ("post_add", "post_remove"):
+        reindex(pk_set)
+
+
+@receiver(pre_delete, sender=ParentOrGuardian)
+def remember_guardian_students(sender, instance, **kwargs):
+    instance._search_students = list(
+        instance.students.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=ParentOrGuardian)
+def index_former_students(sender, instance, **kwargs):
+    reindex(getattr(instance, "_search_students", []))
+
+
+connect_invalidation()
@@ -0,0 +1,1495 @@
+"""
+Test dashboard API flows
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+import boto3
+from PIL import Image
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.models import Sum
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.admin import (
+    ArrearPaymentAdmin, FeeArrearAdmin, PaymentAdmin, StudentClassAdmin,
+    StudentFeeGroupAdmin
+)
+from core.models import (
+    AcademicYear, AcademicTerm, ArrearPayment, Class, Counter, Fee, FeeArrear, GuardianPhone,
+    IdempotencyKey, OrganizationConfig, OrganizationDocument, ParentOrGuardian, Payment, Staff, Student,
+    StudentClass, StudentFeeGroup, StudentSearchIndex, Subject, UploadTicket
+)
+from config.routers import PrimaryReplicaRouter, read_alias
+from core.views import dashboard_metrics_view
+from curriculum.serializers import StudentSerializer
+from curriculum.views import StaffView
+from finance.models import (
+    ExpenditureType, Expenditure, LedgerDaySummary, TaxConfig
+)
+from utils.cache import CACHE_NAMESPACES, namespace_version
+from utils.cashflow import LEDGER_MODELS, summarise_days
+from utils.counters import BlockAllocator, allocator
+from utils.fee_payment import fee_breakdown
+from utils.log_handlers import (
+    AsyncLogHandler, BatchedStreamHandler, FlushingQueueListener
+)
+from utils.pagination import EstimatedCountPaginator
+from utils.receipts import receipt_numbers
+from utils.search import trigram_available
+from utils.secret_store import SecretStore
+from utils.student_ids import luhn_check_digit, student_ids
+from utils.seed import seed_school
+
+try:
+    # moto (and requests, which it pulls in) come from requirements.dev.txt
+    import requests
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+UPLOADS_URL = reverse("dashboard:uploads-list")
+
+
+def confirm_url(ticket_id):
+    """Confirm URL of an upload ticket"""
+    return reverse("dashboard:uploads-confirm", args=[ticket_id])
+
+
+def create_user(**params):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(**params)
+
+
+S3_SETTINGS = {
+    "STORAGES": {
+        "default": {"BACKEND": "storages.backends.s3.S3Storage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    "AWS_STORAGE_BUCKET_NAME": "test-bucket",
+    "AWS_S3_REGION_NAME": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "UPLOAD_MAX_SIZE": 1024,
+}
+
+
+@skipUnless(mock_aws, "moto is needed for the S3 stand-in")
+@override_settings(**S3_SETTINGS)
+class DirectUploadTests(TestCase):
+    """Test presigned uploads against a local S3 stand-in"""
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        boto3.client("s3", region_name="us-east-1").create_bucket(
+            Bucket="test-bucket"
+        )
+        organization = OrganizationConfig.objects.create(name="School")
+        self.user = create_user(
+            email="uploads@example.com", password="testpass123",
+            organization=organization
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        year = AcademicYear.objects.create(year="2023/2024")
+        term = AcademicTerm.objects.create(
+            academic_year=year, term="First Term"
+        )
+        self.expenditure = Expenditure.objects.create(
+            expenditure_type=ExpenditureType.objects.create(name="Fuel"),
+            academic_year=year, academic_term=term, user=self.user,
+            amount=Decimal("10"), purpose="Generator"
+        )
+
+    def upload(self, ticket, content):
+        """Send the file to the bucket the way a browser would"""
+        return requests.post(
+            ticket["upload"]["url"], data=ticket["upload"]["fields"],
+            files={"file": ("file", content)}
+        )
+
+    def test_invoice_upload_flow(self):
+        """Test issuing, uploading and confirming an invoice"""
+        res = self.client.post(UPLOADS_URL, {
+            "target": "Invoice", "object_id": str(self.expenditure.id),
+            "filename": "scan.pdf", "content_type": "application/pdf"
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data["status"], "Issued")
+        content = b"%PDF-1.4 invoice"
+        self.assertEqual(self.upload(res.data, content).status_code, 204)
+
+        res = self.client.post(confirm_url(res.data["id"]), {
+            "checksum": hashlib.md5(content).hexdigest()
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["status"], "Confirmed")
+        self.expenditure.refresh_from_db()
+        self.assertEqual(self.expenditure.invoice.name, res.data["name"])
+        self.assertEqual(self.expenditure.invoice_size, len(content))
+        self.assertEqual(
+            self.expenditure.invoice_content_type, "application/pdf"
+        )
+
+    def test_document_upload_flow(self):
+        """Test a confirmed upload creates the organization document"""
+        res = self.client.post(UPLOADS_URL, {
+            "target": "Document", "filename": "report.pdf",
+            "content_type": "application/pdf", "document_name": "Report",
+            "file_type": "Income"
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.upload(res.data, b"report")
+        res = self.client.post(confirm_url(res.data["id"]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        document = OrganizationDocument.objects.get(id=res.data["document"])
+        self.assertEqual(document.name, "Report")
+        self.assertEqual(document.file_size, 6)
+
+    def test_confirm_rejects_bad_uploads(self):
+        """Test missing, oversized and corrupted uploads are refused"""
+        res = self.client.post(UPLOADS_URL, {
+            "target": "Invoice", "object_id": str(self.expenditure.id),
+            "filename": "scan.pdf", "content_type": "application/pdf"
+        })
+        ticket = res.data
+        res = self.client.post(confirm_url(ticket["id"]))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.upload(ticket, b"x" * 2048)
+        res = self.client.post(confirm_url(ticket["id"]))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.upload(ticket, b"invoice")
+        res = self.client.post(confirm_url(ticket["id"]), {
+            "checksum": hashlib.md5(b"other").hexdigest()
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.expenditure.refresh_from_db()
+        self.assertFalse(self.expenditure.invoice)
+
+    def test_other_organization_is_not_found(self):
+        """Test files cannot be attached to another school's records"""
+        other = create_user(
+            email="other@example.com", password="testpass123",
+            organization=OrganizationConfig.objects.create(name="Other")
+        )
+        self.expenditure.user = other
+        self.expenditure.save()
+        res = self.client.post(UPLOADS_URL, {
+            "target": "Invoice", "object_id": str(self.expenditure.id),
+            "filename": "scan.pdf", "content_type": "application/pdf"
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("not found", res.data["error_message"])
+        self.assertFalse(UploadTicket.objects.exists())
+
+    def test_announced_size_over_limit(self):
+        """Test a ticket is refused for files over the size limit"""
+        res = self.client.post(UPLOADS_URL, {
+            "target": "Invoice", "object_id": str(self.expenditure.id),
+            "filename": "scan.pdf", "content_type": "application/pdf",
+            "file_size": 4096
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), THUMBNAIL_SYNC=True, THUMBNAIL_SIZE=64
+)
+class ThumbnailTests(TestCase):
+    """Test thumbnails of student photos"""
+
+    def photo(self, name="photo.jpg"):
+        """A large JPEG as a phone would upload it"""
+        output = BytesIO()
+        Image.new("RGB", (1200, 800), "teal").save(output, format="JPEG")
+        return SimpleUploadedFile(
+            name, output.getvalue(), content_type="image/jpeg"
+        )
+
+    def test_thumbnail_generated_on_upload(self):
+        """Test a resized thumbnail is stored under a deterministic name"""
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.create(
+                first_name="Ama", image=self.photo()
+            )
+        student.refresh_from_db()
+        digest = hashlib.sha1(student.image.name.encode()).hexdigest()
+        self.assertTrue(
+            student.image_thumbnail.name.startswith(
+                f"thumbnails/image/{digest}-64."
+            )
+        )
+        with Image.open(student.image_thumbnail) as thumbnail:
+            self.assertEqual(thumbnail.size, (64, 43))
+        data = StudentSerializer(instance=student).data
+        self.assertTrue(data["thumbnail_url"].endswith(
+            student.image_thumbnail.name
+        ))
+
+    def test_thumbnail_follows_photo(self):
+        """Test saving without a new photo keeps the thumbnail"""
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.create(
+                first_name="Ama", image=self.photo()
+            )
+        student.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            student.save()
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            student.image = None
+            student.save()
+        student.refresh_from_db()
+        self.assertFalse(student.image_thumbnail)
+
+
+class RequestIdTests(TestCase):
+    """Test the request id attached to logs and responses"""
+
+    def test_request_id_is_echoed(self):
+        """Test an incoming id is kept and a missing one is generated"""
+        client = APIClient()
+        res = client.get(UPLOADS_URL, HTTP_X_REQUEST_ID="req-123")
+        self.assertEqual(res["X-Request-ID"], "req-123")
+        res = client.get(UPLOADS_URL, HTTP_X_REQUEST_ID="bad id\n")
+        self.assertEqual(len(res["X-Request-ID"]), 32)
+
+
+class LogHandlerTests(TestCase):
+    """Test the batched log pipeline"""
+
+    def test_quiet_worker_flushes_batched_lines(self):
+        """Test buffered lines are written after the flush interval"""
+        stream = StringIO()
+        handler = BatchedStreamHandler(
+            stream=stream, batch_size=50, flush_interval=0.05
+        )
+        records = queue.Queue()
+        listener = FlushingQueueListener(
+            records, handler, flush_interval=0.05
+        )
+        listener.start()
+        try:
+            records.put(logging.makeLogRecord({"msg": "quiet", "levelno": 20}))
+            for _ in range(40):
+                if "quiet" in stream.getvalue():
+                    break
+                time.sleep(0.05)
+        finally:
+            listener.stop()
+        self.assertIn("quiet", stream.getvalue())
+
+    def test_file_is_reopened_after_rotation(self):
+        """Test records go to a new file once logrotate moved the old one"""
+        with tempfile.TemporaryDirectory() as log_dir:
+            path = os.path.join(log_dir, "school_backend.log")
+            handler = AsyncLogHandler(filename=path)
+            handler.handle(logging.makeLogRecord({"msg": "before", "levelno": 20}))
+            handler.stop()
+            os.rename(path, path + ".1")
+            handler.restart()
+            handler.handle(logging.makeLogRecord({"msg": "after", "levelno": 20}))
+            handler.stop()
+            handler.close()
+            with open(path + ".1") as f:
+                self.assertIn("before", f.read())
+            with open(path) as f:
+                content = f.read()
+            self.assertIn("after", content)
+            self.assertNotIn("before", content)
+
+
+class PerfInstrumentationTests(TestCase):
+    """Test the request performance middleware and endpoint"""
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            "admin@example.com", "testpass123"
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.client.delete(reverse("dashboard:perf"))
+
+    def test_server_timing_and_report(self):
+        """Test requests are timed per view and action"""
+        res = self.client.get(UPLOADS_URL)
+        self.assertIn("db;dur=", res["Server-Timing"])
+        res = self.client.get(reverse("dashboard:perf"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        views = {row["view"]: row for row in res.data["endpoints"]}
+        self.assertEqual(views["GET UploadTicketView.list"]["count"], 1)
+        self.assertGreater(
+            views["GET UploadTicketView.list"]["db_queries"]["max"], 0
+        )
+        self.assertIn("pooled", res.data["db_pool"])
+        self.assertIn("statement_timeout_ms", res.data["db_pool"])
+
+    def test_perf_is_admin_only(self):
+        """Test regular users cannot read the statistics"""
+        self.client.force_authenticate(user=create_user(
+            email="staff@example.com", password="testpass123"
+        ))
+        res = self.client.get(reverse("dashboard:perf"))
+        # The custom exception handler reports permission errors as 400
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn("endpoints", res.data)
+
+
+class ReferenceCacheTests(TestCase):
+    """Test the cache-aside reads of reference data"""
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        # Rolled back rows send no signals, start every test empty
+        cache.clear()
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            "admin@example.com", "testpass123"
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.client.delete(reverse("dashboard:cache-stats"))
+        Subject.objects.create(name="Mathematics", subject_id="MTH")
+
+    def test_list_is_cached_until_a_change(self):
+        """Test a repeated read skips the database and a save refreshes it"""
+        url = reverse("curriculum:subject-list")
+        res = self.client.get(url)
+        self.assertEqual(res.data["count"], 1)
+        with self.assertNumQueries(0):
+            res = self.client.get(url)
+        self.assertEqual(res.data["count"], 1)
+
+        Subject.objects.create(name="Science", subject_id="SCI")
+        res = self.client.get(url)
+        self.assertEqual(res.data["count"], 2)
+
+        res = self.client.get(reverse("dashboard:cache-stats"))
+        subjects = {
+            row["namespace"]: row for row in res.data["namespaces"]
+        }["subjects"]
+        self.assertEqual(subjects["hits"], 1)
+        self.assertEqual(subjects["misses"], 2)
+
+    def test_entries_are_kept_per_organization(self):
+        """Test organizations never see each other's cached rows"""
+        url = reverse("finance:tax-config-list")
+        for name in ["First School", "Second School"]:
+            organization = OrganizationConfig.objects.create(name=name)
+            TaxConfig.objects.create(
+                organization=organization, name=f"{name} PAYE"
+            )
+            self.client.force_authenticate(user=create_user(
+                email=f"{name.split()[0]}@example.com",
+                password="testpass123", organization=organization
+            ))
+            res = self.client.get(url)
+            self.assertEqual(
+                [row["name"] for row in res.data], [f"{name} PAYE"]
+            )
+
+
+class OrganizationConfigTests(TestCase):
+    """Test the school config follows the active year and term"""
+
+    def setUp(self):
+        cache.clear()
+        organization = OrganizationConfig.objects.create(name="School")
+        self.client = APIClient()
+        self.client.force_authenticate(user=create_user(
+            email="config@example.com", password="testpass123",
+            organization=organization
+        ))
+        year = AcademicYear.objects.create(year="2025/2026", is_active=True)
+        self.first = AcademicTerm.objects.create(
+            academic_year=year, term="First Term", order=1
+        )
+        self.second = AcademicTerm.objects.create(
+            academic_year=year, term="Second Term", order=2,
+            is_active=False
+        )
+        self.url = reverse("dashboard:school-config-list")
+
+    def test_term_rollover_changes_the_config(self):
+        """Test the cached config moves to the new term"""
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["academic_term"], "First Term")
+
+        self.first.is_active = False
+        self.first.save()
+        self.second.is_active = True
+        self.second.save()
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["academic_term"], "Second Term")
+
+    def test_term_rollover_moves_the_etag(self):
+        """Test a polling client is not answered 304 after a rollover"""
+        etag = self.client.get(self.url)["ETag"]
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.first.is_active = False
+        self.first.save()
+        self.second.is_active = True
+        self.second.save()
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["academic_term"], "Second Term")
+
+        # Activated with update(), no timestamp moves
+        etag = res["ETag"]
+        AcademicTerm.objects.filter(pk=self.second.pk).update(is_active=False)
+        AcademicTerm.objects.filter(pk=self.first.pk).update(is_active=True)
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag based 304 responses of polled endpoints"""
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=create_user(
+            email="poll@example.com", password="testpass123"
+        ))
+        self.school_class = Class.objects.create(name="Basic 1")
+
+    def test_unchanged_list_is_not_modified(self):
+        """Test a matching ETag is answered with a 304 until a change"""
+        url = reverse("curriculum:class-list")
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("Last-Modified", res)
+        etag = res["ETag"]
+
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res["ETag"], etag)
+
+        self.school_class.name = "Basic One"
+        self.school_class.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+        etag = res["ETag"]
+        Class.objects.create(name="Basic 2").delete()
+        self.school_class.delete()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_fee_changes_move_fee_group_etag(self):
+        """Test the ETag of a fee group follows its fees"""
+        year = AcademicYear.objects.create(year="2023/2024", is_active=True)
+        term = AcademicTerm.objects.create(
+            academic_year=year, term="First Term"
+        )
+        fee = Fee.objects.create(
+            academic_year=year, academic_term=term, name="Tuition",
+            amount=Decimal("100.00")
+        )
+        group = StudentFeeGroup.objects.create(
+            name="Basic", academic_year=year
+        )
+        url = reverse("curriculum:student-fee-group-detail", args=[group.id])
+        etag = self.client.get(url)["ETag"]
+        group.fees.add(fee)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["fees_obj"]), 1)
+
+        etag = res["ETag"]
+        fee.amount = Decimal("120.00")
+        fee.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class AsyncDashboardTests(TestCase):
+    """Test the async dashboard served in ASGI mode"""
+
+    def test_async_dashboard_matches_sync(self):
+        """Test both dashboards return the same body and ETag"""
+        user = create_user(
+            email="dash@example.com", password="testpass123", is_active=True
+        )
+        AcademicYear.objects.create(year="2023/2024", is_active=True)
+        Class.objects.create(name="Basic 1")
+        client = APIClient()
+        client.force_authenticate(user=user)
+        # The WSGI view runs the sync ORM, not the coroutine on a new loop
+        with mock.patch(
+                "asgiref.sync.AsyncToSync.__call__",
+                side_effect=AssertionError("async_to_sync in a WSGI view")):
+            expected = client.get(reverse("dashboard:metrics"))
+        self.assertEqual(expected.status_code, status.HTTP_200_OK)
+
+        token = RefreshToken.for_user(user).access_token
+        request = RequestFactory().get(
+            reverse("dashboard:metrics"), HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+        res = async_to_sync(dashboard_metrics_view)(request)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(res.content), expected.json())
+        self.assertEqual(res["ETag"], expected["ETag"])
+
+        request = RequestFactory().get(
+            reverse("dashboard:metrics"), HTTP_AUTHORIZATION=f"Bearer {token}",
+            HTTP_IF_NONE_MATCH=res["ETag"]
+        )
+        res = async_to_sync(dashboard_metrics_view)(request)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+@override_settings(DB_REPLICA_READS=True)
+class ReplicaRoutingTests(TestCase):
+    """Test reporting reads go to the replica with read-your-writes"""
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=create_user(
+            email="reports@example.com", password="testpass123"
+        ))
+
+    def get_metrics(self):
+        """Staff metrics and the queries each database served"""
+        with CaptureQueriesContext(connections["replica"]) as replica, \
+                CaptureQueriesContext(connections["default"]) as primary:
+            res = self.client.get(reverse("curriculum:staff-metrics"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(replica), len(primary)
+
+    def test_reports_read_from_replica(self):
+        """Test a metrics action is served by the replica"""
+        replica, primary = self.get_metrics()
+        self.assertEqual(replica, 2)
+        self.assertEqual(primary, 0)
+
+        with CaptureQueriesContext(connections["replica"]) as queries:
+            res = self.client.get(reverse("curriculum:staff-list"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 0)
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test a user reads their own writes from the primary"""
+        res = self.client.post(
+            reverse("finance:income-type-list"), {"name": "Donations"}
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        replica, primary = self.get_metrics()
+        self.assertEqual(replica, 0)
+        self.assertEqual(primary, 2)
+
+        self.client.force_authenticate(user=create_user(
+            email="other@example.com", password="testpass123"
+        ))
+        replica, primary = self.get_metrics()
+        self.assertEqual(replica, 2)
+
+    @override_settings(DB_REPLICA_READS=False)
+    def test_replica_reads_switch(self):
+        """Test every read goes to the primary when replica reads are off"""
+        replica, primary = self.get_metrics()
+        self.assertEqual(replica, 0)
+        self.assertEqual(primary, 2)
+
+    def test_failed_request_resets_the_alias(self):
+        """Test a replica view that raises leaves later reads on the primary"""
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user=create_user(
+            email="failing@example.com", password="testpass123"
+        ))
+        with mock.patch.object(
+            StaffView, "metrics", side_effect=TypeError("boom"), create=False
+        ):
+            res = client.get(reverse("curriculum:staff-metrics"))
+        self.assertEqual(
+            res.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+        self.assertIsNone(read_alias.get())
+
+    @override_settings(DB_LONG_STATEMENT_TIMEOUT=90000)
+    def test_long_timeout_on_the_replica(self):
+        """Test a long running report gets its timeout where it reads"""
+        statements = {"default": [], "replica": []}
+
+        def recorder(alias):
+            def record(execute, sql, params, many, context):
+                statements[alias].append((sql, params))
+                return execute(sql, params, many, context)
+            return record
+
+        with connections["replica"].execute_wrapper(recorder("replica")), \
+                connections["default"].execute_wrapper(recorder("default")):
+            res = self.client.get(reverse("finance:cashflow-series"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(statements["replica"][0][1], ["90000"])
+        self.assertEqual(
+            statements["replica"][-1][0], "RESET statement_timeout"
+        )
+        self.assertEqual(statements["default"], [])
+
+    def test_router_keeps_writes_on_primary(self):
+        """Test writes and migrations never target the replica"""
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_write(Subject), "default")
+        self.assertTrue(router.allow_migrate("default", "core"))
+        self.assertFalse(router.allow_migrate("replica", "core"))
+
+
+class StartupTests(TestCase):
+    """Test the lazy secret store and the startup profile"""
+
+    def test_secret_store_file_backend(self):
+        """Test secrets are read from the file once and env wins"""
+        store = SecretStore()
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump({"API_TOKEN": "from-file"}, f)
+            f.flush()
+            with mock.patch.dict(os.environ, {
+                    "SECRETS_BACKEND": "file", "SECRETS_FILE": f.name}):
+                self.assertEqual(store.get("API_TOKEN"), "from-file")
+                self.assertEqual(store.get("MISSING", "fallback"), "fallback")
+                os.environ["API_TOKEN"] = "from-env"
+                # Resolved values are cached until reset
+                self.assertEqual(store.get("API_TOKEN"), "from-file")
+                store.reset()
+                self.assertEqual(store.get("API_TOKEN"), "from-env")
+
+    def test_profile_startup(self):
+        """Test the startup profile reports phases, apps and modules"""
+        out = StringIO()
+        call_command("profile_startup", "--json", "--limit", "50", stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertGreater(report["setup_ms"], 0)
+        self.assertIsNone(report["urls_ms"])
+        self.assertIn("core", [row["app"] for row in report["apps"]])
+        self.assertNotIn(
+            "django_heroku", [row["module"] for row in report["modules"]]
+        )
+
+    def test_asgi_serves_collected_static_files(self):
+        """Test config.asgi serves STATIC_ROOT the way whitenoise does"""
+        async def django_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 204,
+                        "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        def request(app, path):
+            async def run():
+                communicator = ApplicationCommunicator(app, {
+                    "type": "http", "method": "GET", "path": path,
+                    "query_string": b"", "server": ("testserver", 80),
+                    "headers": [(b"accept-encoding", b"gzip")],
+                })
+                await communicator.send_input({"type": "http.request"})
+                start = await communicator.receive_output()
+                body = b""
+                while True:
+                    message = await communicator.receive_output()
+                    body += message.get("body", b"")
+                    if not message.get("more_body"):
+                        return start, body
+            return async_to_sync(run)()
+
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.dict(os.environ, {}), \
+                override_settings(STATIC_ROOT=root, DEBUG=False):
+            from config.asgi import WhiteNoiseASGIHandler
+            css = b"body{margin:0}" * 100
+            with open(os.path.join(root, "app.css"), "wb") as f:
+                f.write(css)
+            with gzip.open(os.path.join(root, "app.css.gz"), "wb") as f:
+                f.write(css)
+            app = WhiteNoiseASGIHandler(django_app)
+            start, body = request(app, "/static/app.css")
+            headers = dict(start["headers"])
+            self.assertEqual(start["status"], 200)
+            self.assertEqual(headers[b"Content-Encoding"], b"gzip")
+            self.assertEqual(gzip.decompress(body), css)
+            start, _ = request(app, "/static/missing.css")
+            self.assertEqual(start["status"], 404)
+            start, _ = request(app, "/api/core/")
+            self.assertEqual(start["status"], 204)
+
+
+class BenchmarkTests(TestCase):
+    """Test the bulk seeded school and the benchmark report"""
+
+    def test_seeded_balances_match_payments(self):
+        """Test the seeded class balances carry the payments and arrears"""
+        summary = seed_school(students=20, staff=3, years=2, seed=7)
+        self.assertEqual(summary["student_classes"], 40)
+        self.assertEqual(Staff.objects.count(), 3)
+        student = Student.objects.get(student_id="SD7-000001")
+        previous, current = StudentClass.objects.filter(
+            student=student
+        ).order_by("academic_year__year")
+        self.assertEqual(
+            current.fee_paid,
+            Payment.objects.filter(
+                student=student, academic_year=current.academic_year
+            ).aggregate(total=Sum("amount"))["total"] or 0
+        )
+        assigned = current.fee_assigned.fees.aggregate(
+            total=Sum("amount")
+        )["total"]
+        self.assertEqual(
+            current.fee_owing,
+            assigned - current.fee_paid + previous.fee_owing
+        )
+        with self.assertRaises(ValueError):
+            seed_school(students=1, staff=1, years=2, seed=8)
+
+    def test_benchmark_report(self):
+        """Test the report holds timings and query counts, data rolled back"""
+        versions = {
+            namespace: namespace_version(namespace)
+            for namespace in CACHE_NAMESPACES
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark", "--students", "20", "--staff", "3",
+                "--repeat", "1", "--only", "dashboard",
+                "--only", "payment_post", "--output", output, "--warm",
+                stdout=StringIO()
+            )
+            # Nothing cached from the rolled back school is read again
+            for namespace, version in versions.items():
+                self.assertNotEqual(namespace_version(namespace), version)
+            with open(output) as f:
+                report = json.load(f)
+            out = StringIO()
+            call_command(
+                "benchmark", "--students", "20", "--staff", "3",
+                "--repeat", "1", "--only", "dashboard",
+                "--output", os.path.join(directory, "next.json"),
+                "--compare", output, stdout=out
+            )
+        self.assertEqual(report["dataset"]["students"], 20)
+        self.assertEqual(report["results"]["dashboard"]["status"], 200)
+        self.assertEqual(report["results"]["payment_post"]["status"], 201)
+        self.assertGreater(report["results"]["payment_post"]["queries"], 0)
+        self.assertIn("queries", out.getvalue())
+        self.assertFalse(Student.objects.exists())
+
+
+class SeedCommandTests(TestCase):
+    """Test the seeding engine behind the seed and create commands"""
+
+    def test_same_seed_same_school(self):
+        """Test a seed always generates the same rows"""
+        schools = []
+        for _ in range(2):
+            with transaction.atomic():
+                seed_school(students=10, staff=2, years=1, seed=3)
+                schools.append(list(Student.objects.order_by(
+                    "student_id"
+                ).values_list("id", "first_name", "last_name")))
+                transaction.set_rollback(True)
+        self.assertEqual(schools[0], schools[1])
+        self.assertEqual(len(schools[0]), 10)
+
+    def test_create_commands_add_to_active_year(self):
+        """Test the create commands add to the school being used"""
+        call_command(
+            "seed_school", "--students", "5", "--staff", "1", "--years", "1",
+            stdout=StringIO()
+        )
+        active_year = AcademicYear.objects.get(is_active=True)
+        call_command(
+            "create_students", "--count", "4", "--seed", "9",
+            stdout=StringIO()
+        )
+        call_command("create_staff", "--count", "2", stdout=StringIO())
+        call_command(
+            "create_transactions", "--incomes", "2", "--expenditures", "1",
+            stdout=StringIO()
+        )
+        self.assertEqual(
+            StudentClass.objects.filter(academic_year=active_year).count(), 9
+        )
+        self.assertEqual(Staff.objects.count(), 3)
+        self.assertEqual(
+            Expenditure.objects.filter(academic_year=active_year).count(),
+            3 + 3
+        )
+
+    def test_create_commands_update_closed_days(self):
+        """Test rows added to rolled up days reach the day summaries"""
+        with self.captureOnCommitCallbacks(execute=True):
+            seed_school(students=5, staff=1, years=1, seed=4)
+        closed_until = timezone.localdate() + timedelta(days=400)
+        for source in LEDGER_MODELS:
+            summarise_days(source, date(2000, 1, 1), closed_until)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "create_students", "--count", "4", "--seed", "9",
+                stdout=StringIO()
+            )
+            call_command(
+                "create_transactions", "--incomes", "2",
+                "--expenditures", "1", stdout=StringIO()
+            )
+        for source, model in LEDGER_MODELS.items():
+            self.assertEqual(
+                LedgerDaySummary.objects.filter(source=source).aggregate(
+                    total=Sum("total_amount")
+                )["total"],
+                model.objects.aggregate(total=Sum("amount"))["total"],
+                source
+            )
+
+
+class StudentSearchTests(TestCase):
+    """Test the student search index and the endpoints using it"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=create_user(
+            email="search@example.com", password="testpass123"
+        ))
+        self.kwame = Student.objects.create(
+            first_name="Kwame", last_name="Mensah", student_id="SCH-0042"
+        )
+        self.ama = Student.objects.create(
+            first_name="Ama", last_name="Mensah", student_id="SCH-0043"
+        )
+        self.kwabena = Student.objects.create(
+            first_name="Kwabena", last_name="Owusu", student_id="SCH-0044"
+        )
+        self.guardian = ParentOrGuardian.objects.create(
+            full_name="Yaw Asante", relationship_with_student="Uncle",
+            name_of_father="Kofi Owusu", name_of_mother="Akua Owusu",
+            mobile_number="+233 24 123 4567"
+        )
+        self.guardian.students.add(self.kwabena)
+
+    def search(self, text):
+        return [
+            result["student_id"] for result in self.client.get(
+                reverse("curriculum:student-autocomplete"), {"q": text}
+            ).json()["results"]
+        ]
+
+    def test_prefixes_of_every_word(self):
+        """Test each word typed matches the start of a word"""
+        self.assertEqual(self.search("kwa men"), ["SCH-0042"])
+        self.assertEqual(
+            sorted(self.search("mensah")), ["SCH-0042", "SCH-0043"]
+        )
+        self.assertEqual(self.search("sch-0043"), ["SCH-0043"])
+
+    def test_guardian_names_and_phones(self):
+        """Test students are found by their guardians' names and phones"""
+        self.assertEqual(self.search("asante"), ["SCH-0044"])
+        self.assertEqual(self.search("024 123 4567"), ["SCH-0044"])
+        self.assertEqual(self.search("+233241234567"), ["SCH-0044"])
+
+    def test_index_follows_changes(self):
+        """Test renames and guardian links update the index"""
+        self.ama.first_name = "Abena"
+        self.ama.save()
+        self.guardian.students.add(self.ama)
+        self.assertEqual(self.search("abena asante"), ["SCH-0043"])
+        self.guardian.delete()
+        self.assertEqual(self.search("asante"), [])
+
+    def test_student_list_ranks_names_first(self):
+        """Test a name match ranks above a guardian's name"""
+        self.guardian.students.add(self.ama)
+        res = self.client.get(
+            reverse("curriculum:student-list"), {"search": "owusu"}
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [student["student_id"] for student in res.json()["results"]],
+            ["SCH-0044", "SCH-0043"]
+        )
+        res = self.client.get(
+            reverse("curriculum:parent-or-guardian-list"), {"search": "kwab"}
+        )
+        self.assertEqual(
+            [guardian["full_name"] for guardian in res.json()["results"]],
+            ["Yaw Asante"]
+        )
+
+    def test_misspelt_names(self):
+        """Test a misspelt name still finds the student"""
+        if not trigram_available():
+            self.skipTest("pg_trgm is not installed")
+        self.assertEqual(self.search("kwamee mensa")[0], "SCH-0042")
+
+    def test_rebuild_command(self):
+        """Test the command indexes students missing from the index"""
+        StudentSearchIndex.objects.all().delete()
+        call_command("rebuild_search_index", "--missing", stdout=StringIO())
+        self.assertEqual(StudentSearchIndex.objects.count(), 3)
+        self.assertEqual(self.search("kwame"), ["SCH-0042"])
+
+
+class CallerLookupTests(TestCase):
+    """Test finding the students of a calling guardian by phone"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=create_user(
+            email="lookup@example.com", password="testpass123"
+        ))
+        self.guardian = ParentOrGuardian.objects.create(
+            full_name="Yaw Asante", relationship_with_student="Father",
+            name_of_father="Yaw Asante", name_of_mother="Akua Asante",
+            mobile_number="024 123 4567", mother_telephone="+233 20 765 4321"
+        )
+
+    def test_numbers_stored_in_e164(self):
+        """Test every phone field is indexed in E.164 form"""
+        self.assertEqual(
+            sorted(self.guardian.phones.values_list("field", "number")),
+            [
+                ("mobile_number", "+233241234567"),
+                ("mother_telephone", "+233207654321"),
+            ]
+        )
+        self.guardian.mobile_number = ""
+        self.guardian.save()
+        self.assertEqual(self.guardian.phones.count(), 1)
+
+    def test_lookup_returns_students_and_balances(self):
+        """Test the lookup answers in one query with the balances"""
+        year = AcademicYear.objects.create(year="2030/2031", is_active=True)
+        ama = Student.objects.create(
+            first_name="Ama", last_name="Asante", student_id="SCH-0050"
+        )
+        StudentClass.objects.create(
+            student=ama, academic_year=year,
+            student_class=Class.objects.create(name="BASIC 2")
+        )
+        # save() works the balance out from the fees and payments
+        StudentClass.objects.filter(student=ama).update(
+            fee_paid=Decimal("300.00"), fee_owing=Decimal("200.00"),
+            owing=True
+        )
+        self.guardian.students.add(ama)
+
+        with CaptureQueriesContext(connections["default"]) as queries:
+            res = self.client.get(
+                reverse("curriculum:parent-or-guardian-lookup"),
+                {"phone": "+233-24-123-4567"}
+            )
+        lookups = [
+            query for query in queries
+            if "core_guardianphone" in query["sql"]
+        ]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["phone"], "+233241234567")
+        [guardian] = res.json()["results"]
+        self.assertEqual(guardian["full_name"], "Yaw Asante")
+        self.assertEqual(guardian["students"], [{
+            "id": str(ama.id), "student_id": "SCH-0050",
+            "first_name": "Ama", "middle_name": None, "last_name": "Asante",
+            "is_active": True, "current_class": "BASIC 2",
+            "fee_paid": "300.00", "fee_owing": "200.00", "owing": True,
+        }])
+
+    def test_lookup_rejects_non_numbers(self):
+        """Test a lookup without a phone number is refused"""
+        res = self.client.get(
+            reverse("curriculum:parent-or-guardian-lookup"), {"phone": "abc"}
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_command(self):
+        """Test the backfill indexes guardians missing from the index"""
+        GuardianPhone.objects.all().delete()
+        call_command(
+            "backfill_guardian_phones", "--missing", stdout=StringIO()
+        )
+        self.assertEqual(self.guardian.phones.count(), 2)
+
+
+class StudentProfileTests(TestCase):
+    """Test the cached student profile"""
+
+    def setUp(self):
+        cache.clear()
+        seed_school(students=10, staff=1, years=1, seed=4)
+        self.student = Student.objects.get(student_id="SD4-000001")
+        self.url = reverse("curriculum:student-profile", args=[self.student.id])
+        self.client = APIClient()
+        self.client.force_authenticate(
+            user=get_user_model().objects.get(email="admin.s4@seed.school")
+        )
+
+    def test_profile_matches_the_records(self):
+        """Test the balance and fee breakdown agree with the payments"""
+        with CaptureQueriesContext(connections["default"]) as queries:
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(queries), 12)
+        profile = res.json()
+        student_class = StudentClass.objects.get(
+            student=self.student, academic_year__is_active=True
+        )
+        self.assertEqual(
+            profile["class"]["name"], student_class.student_class.name
+        )
+        paid = Payment.objects.filter(
+            student=self.student, academic_year=student_class.academic_year
+        ).aggregate(total=Sum("amount"))["total"] or Decimal("0.00")
+        self.assertEqual(Decimal(profile["balance"]["paid"]), paid)
+        self.assertEqual(
+            Decimal(profile["balance"]["fees"]),
+            student_class.fee_assigned.fees.aggregate(
+                total=Sum("amount")
+            )["total"]
+        )
+        self.assertEqual(
+            [term["order"] for term in profile["terms"]], [1, 2, 3]
+        )
+        self.assertEqual(
+            sum(Decimal(term["amount_paid"]) for term in profile["terms"]),
+            paid
+        )
+
+    def test_cached_until_a_payment(self):
+        """Test the profile is served from the cache until a payment"""
+        before = self.client.get(self.url).json()
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.assertEqual(self.client.get(self.url).json(), before)
+        self.assertEqual(len(queries), 0)
+
+        fee = Fee.objects.filter(
+            studentfeegroup__studentclass__student=self.student,
+            academic_term__is_active=True
+        ).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(
+                student=self.student, fee=fee,
+                academic_year=fee.academic_year,
+                academic_term=fee.academic_term, amount=Decimal("1.00")
+            )
+        after = self.client.get(self.url).json()
+        self.assertEqual(
+            Decimal(after["balance"]["paid"]),
+            Decimal(before["balance"]["paid"]) + 1
+        )
+        self.assertEqual(len(after["payments"]), len(before["payments"]) + 1)
+
+    def test_unknown_student(self):
+        """Test an unknown student is not found"""
+        for pk in ["8b1e0a52-5a0e-4a3c-9a51-0c3f8c1b6d10", "not-a-uuid"]:
+            res = self.client.get(
+                reverse("curriculum:student-profile", args=[pk])
+            )
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FeeBreakdownTests(TestCase):
+    """Test the set based fee breakdown and the who owes what report"""
+
+    def setUp(self):
+        seed_school(students=12, staff=1, years=1, seed=6)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            user=get_user_model().objects.get(email="admin.s6@seed.school")
+        )
+
+    def test_breakdown_matches_payments_per_fee(self):
+        """Test every cell is the sum of the payments on that fee"""
+        student_classes = StudentClass.objects.filter(
+            academic_year__is_active=True
+        )
+        with CaptureQueriesContext(connections["default"]) as queries:
+            breakdown = fee_breakdown(student_classes)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(breakdown["students"]["id"]), 12)
+        fee_ids = breakdown["fees"]["id"]
+        for student_id, paid_row, owing in zip(
+            breakdown["students"]["id"], breakdown["paid"], breakdown["owing"]
+        ):
+            student_class = student_classes.get(student_id=student_id)
+            group_fees = set(
+                student_class.fee_assigned.fees.values_list("id", flat=True)
+            )
+            for fee_id, paid in zip(fee_ids, paid_row):
+                if fee_id not in group_fees:
+                    self.assertIsNone(paid)
+                    continue
+                self.assertEqual(paid, Payment.objects.filter(
+                    student_id=student_id, fee_id=fee_id,
+                    academic_year=student_class.academic_year
+                ).aggregate(total=Sum("amount"))["total"] or 0)
+            self.assertEqual(
+                owing,
+                student_class.fee_assigned.fees.aggregate(
+                    total=Sum("amount")
+                )["total"] - student_class.fee_paid
+            )
+
+    def test_who_owes_what(self):
+        """Test the report filters and sorts on the amount owing"""
+        url = reverse("curriculum:student-class-owing")
+        res = self.client.get(url, {"min_owing": "0", "page_size": 100})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        owing = [Decimal(amount) for amount in res.json()["results"]["owing"]]
+        self.assertEqual(res.json()["count"], 12)
+        self.assertEqual(owing, sorted(owing, reverse=True))
+
+        threshold = owing[len(owing) // 2]
+        res = self.client.get(url, {
+            "min_owing": str(threshold), "ordering": "owing",
+            "page_size": 100
+        })
+        filtered = [
+            Decimal(amount) for amount in res.json()["results"]["owing"]
+        ]
+        self.assertEqual(filtered, sorted(filtered))
+        self.assertEqual(
+            filtered, sorted(amount for amount in owing if amount >= threshold)
+        )
+        res = self.client.get(url, {"max_owing": "abc"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AdminChangelistTests(TestCase):
+    """Test the changelists of the large tables in the admin"""
+
+    def setUp(self):
+        seed_school(students=12, staff=1, years=2, seed=9)
+        self.client.force_login(
+            get_user_model().objects.get(email="admin.s9@seed.school")
+        )
+        # The seeder writes no arrears, bulk_create skips their save()
+        previous_year = AcademicYear.objects.get(is_active=False)
+        arrears = FeeArrear.objects.bulk_create([
+            FeeArrear(
+                student=student, academic_year=previous_year,
+                amount=Decimal("100"), arrear_balance=Decimal("60")
+            )
+            for student in Student.objects.all()[:6]
+        ])
+        ArrearPayment.objects.bulk_create([
+            ArrearPayment(
+                fee_arrear=arrear, amount=Decimal("40"),
+                owing_after_payment=Decimal("60")
+            )
+            for arrear in arrears
+        ])
+
+    def test_changelists_do_not_query_per_row(self):
+        """Test the queries of a changelist do not grow with the page"""
+        admins = [
+            (Payment, PaymentAdmin), (StudentClass, StudentClassAdmin),
+            (FeeArrear, FeeArrearAdmin), (ArrearPayment, ArrearPaymentAdmin),
+            (StudentFeeGroup, StudentFeeGroupAdmin),
+        ]
+        for model, model_admin in admins:
+            url = reverse(f"admin:core_{model._meta.model_name}_changelist")
+            counts = []
+            for per_page in (2, 50):
+                with mock.patch.object(model_admin, "list_per_page", per_page):
+                    with CaptureQueriesContext(connections["default"]) as queries:
+                        res = self.client.get(url)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                counts.append(len(queries))
+            self.assertEqual(counts[0], counts[1], model.__name__)
+
+    def test_fee_group_totals(self):
+        """Test fee groups list their fee count and total amount"""
+        group = StudentFeeGroup.objects.first()
+        res = self.client.get(
+            reverse("admin:core_studentfeegroup_changelist")
+        )
+        self.assertContains(res, group.name)
+        row = next(
+            row for row in res.context["cl"].result_list if row.pk == group.pk
+        )
+        self.assertEqual(row.fee_count, group.fees.count())
+        self.assertEqual(
+            row.total_amount, group.fees.aggregate(total=Sum("amount"))["total"]
+        )
+
+    def test_estimated_count(self):
+        """Test an unfiltered large table is counted from the estimate"""
+        with connections["default"].cursor() as cursor:
+            cursor.execute("ANALYZE core_payment")
+        paginator = EstimatedCountPaginator(
+            Payment.objects.order_by("-date_created"), 10
+        )
+        paginator.exact_below = 0
+        with CaptureQueriesContext(connections["default"]) as queries:
+            count = paginator.count
+        self.assertEqual(count, Payment.objects.count())
+        self.assertNotIn("COUNT", queries.captured_queries[0]["sql"])
+
+        filtered = EstimatedCountPaginator(
+            Payment.objects.filter(amount__gt=0).order_by("-date_created"), 10
+        )
+        self.assertEqual(
+            filtered.count, Payment.objects.filter(amount__gt=0).count()
+        )
+
+
+class PaymentPostingTests(TransactionTestCase):
+    """Test payments posted at the same time and retried payments"""
+
+    def setUp(self):
+        seed_school(students=4, staff=1, years=1, seed=11)
+        self.admin = get_user_model().objects.get(
+            email="admin.s11@seed.school"
+        )
+        self.student_class = StudentClass.objects.filter(
+            academic_year__is_active=True
+        ).order_by("-fee_owing").first()
+        self.fee = Fee.objects.filter(
+            studentfeegroup=self.student_class.fee_assigned
+        ).order_by("-amount").first()
+        self.url = reverse("curriculum:payment-list")
+
+    def payment(self, amount="1.00"):
+        return {
+            "student": str(self.student_class.student_id),
+            "fee": str(self.fee.id),
+            "academic_year": str(self.student_class.academic_year_id),
+            "academic_term": str(self.fee.academic_term_id),
+            "amount": amount,
+            "payment_method": "Cash",
+        }
+
+    def post(self, data, key=None):
+        """POST from a thread of its own, on a connection of its own"""
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        try:
+            return client.post(self.url, data, format="json", **headers)
+        finally:
+            connections.close_all()
+
+    def post_all(self, requests):
+        with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+            return list(pool.map(lambda args: self.post(*args), requests))
+
+    def test_concurrent_payments_see_each_other(self):
+        """Test parallel payments of a student each leave a distinct balance"""
+        owing = self.student_class.fee_owing
+        self.assertGreaterEqual(owing, 8)
+        before = set(Payment.objects.values_list("id", flat=True))
+        responses = self.post_all([(self.payment(), None)] * 8)
+        self.assertEqual(
+            [res.status_code for res in responses],
+            [status.HTTP_201_CREATED] * 8
+        )
+        new = Payment.objects.exclude(id__in=before)
+        self.assertEqual(
+            sorted(new.values_list("owing_after_payment", flat=True)),
+            [owing - paid for paid in range(8, 0, -1)]
+        )
+        self.student_class.refresh_from_db()
+        self.assertEqual(self.student_class.fee_owing, owing - 8)
+        self.assertEqual(
+            self.student_class.fee_paid,
+            Payment.objects.filter(
+                student_id=self.student_class.student_id,
+                academic_year_id=self.student_class.academic_year_id
+            ).aggregate(total=Sum("amount"))["total"]
+        )
+
+    def test_retries_with_a_key_pay_once(self):
+        """Test requests repeating a key return the first payment"""
+        count = Payment.objects.count()
+        responses = self.post_all([(self.payment(), "retry-1")] * 6)
+        self.assertEqual(Payment.objects.count(), count + 1)
+        self.assertEqual(
+            {res.status_code for res in responses}, {status.HTTP_201_CREATED}
+        )
+        self.assertEqual(len({res.data["id"] for res in responses}), 1)
+        self.assertEqual(
+            sum(res.has_header("Idempotent-Replayed") for res in responses), 5
+        )
+
+    def test_key_of_another_request(self):
+        """Test a key is refused for a different body, reusable on failure"""
+        res = self.post(self.payment("1.00"), "retry-2")
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.post(self.payment("2.00"), "retry-2")
+        self.assertEqual(
+            res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+
+        res = self.post(self.payment("999999.00"), "retry-3")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.filter(key="retry-3").exists())
+        res = self.post(self.payment("1.00"), "retry-3")
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+
+class ReceiptNumberTests(TransactionTestCase):
+    """Test receipt numbers are sequential and never issued twice"""
+
+    def setUp(self):
+        # Blocks handed out in earlier tests, whose counters were flushed
+        allocator.blocks.clear()
+        self.organization = OrganizationConfig.objects.create(
+            name="Higher Heights Academy"
+        )
+
+    def test_numbers_are_sequential_per_organization_and_year(self):
+        """Test numbers count up from 1 per organization and year"""
+        self.assertEqual(
+            receipt_numbers(self.organization, 2, year=2026),
+            ["HHA-2026-000001", "HHA-2026-000002"]
+        )
+        self.assertEqual(
+            receipt_numbers(self.organization, year=2027), ["HHA-2027-000001"]
+        )
+        self.organization.receipt_prefix = "HH"
+        self.assertEqual(
+            receipt_numbers(self.organization, year=2026), ["HH-2026-000001"]
+        )
+        with transaction.atomic():
+            # Reserved as needed inside a transaction, not by block
+            receipt_numbers(self.organization, year=2028)
+            self.assertEqual(
+                Counter.objects.get(name="receipt:HH:2028").value, 1
+            )
+
+    def test_organizations_sharing_initials(self):
+        """Test organizations printing the same prefix share its numbers"""
+        other = OrganizationConfig.objects.create(name="Happy Hills Academy")
+        numbers = [
+            *receipt_numbers(self.organization, 2, year=2026),
+            *receipt_numbers(other, 2, year=2026),
+            *receipt_numbers(None, year=2026),
+        ]
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(numbers[2], "HHA-2026-000003")
+
+    @override_settings(COUNTER_BLOCK_SIZE=5)
+    def test_workers_never_issue_a_number_twice(self):
+        """Test concurrent workers with blocks of their own get unique numbers"""
+        workers = [BlockAllocator(), BlockAllocator()]
+
+        def take(index):
+            try:
+                return workers[index % 2].take("receipt:test", 1 + index % 3)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            numbers = [n for taken in pool.map(take, range(40)) for n in taken]
+        self.assertEqual(len(numbers), len(set(numbers)))
+        # Both workers together reserved at most one spare block each
+        self.assertLessEqual(
+            Counter.objects.get(name="receipt:test").value - len(numbers), 2 * 5
+        )
+
+
+class StudentIdTests(TestCase):
+    """Test student IDs follow the pattern of the organization"""
+
+    def setUp(self):
+        self.organization = OrganizationConfig.objects.create(
+            name="Higher Heights Academy"
+        )
+        self.user = create_user(
+            email="ids@example.com", password="testpass123",
+            organization=self.organization
+        )
+
+    def test_ids_are_numbered_with_a_check_digit(self):
+        """Test the default pattern counts up per year with a Luhn digit"""
+        ids = student_ids(
+            self.organization, [("Kwame", "", "Mensah")] * 3, year=2026
+        )
+        self.assertEqual(
+            [student_id[:-1] for student_id in ids],
+            ["HHA202600001", "HHA202600002", "HHA202600003"]
+        )
+        for student_id in ids:
+            digits = student_id[3:]
+            self.assertEqual(luhn_check_digit(digits[:-1]), int(digits[-1]))
+        # A mistyped digit fails the check
+        self.assertNotEqual(luhn_check_digit("202600004"), int(ids[0][-1]))
+
+        self.organization.student_id_pattern = "{initials}-{year}-{number}"
+        self.assertEqual(
+            student_ids(self.organization, [("Ama", None, "Owusu")], 2026),
+            ["AO-2026-4"]
+        )
+
+    def test_bulk_ids_reserve_numbers_once(self):
+        """Test an import of many students reserves its numbers together"""
+        names = [(f"Student{index}", "", "Test") for index in range(200)]
+        with transaction.atomic(), CaptureQueriesContext(
+            connections["default"]
+        ) as queries:
+            ids = student_ids(self.organization, names, year=2030)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(set(ids)), 200)
+
+    def test_pattern_needs_year_and_number(self):
+        """Test patterns that could repeat an ID are refused"""
+        for pattern in ["{prefix}{number}", "{year}{name}{number}", "{year"]:
+            self.organization.student_id_pattern = pattern
+            with self.assertRaises(ValidationError):
+                self.organization.full_clean()
+        self.organization.student_id_pattern = "{prefix}/{year}/{number:04d}"
+        self.organization.full_clean()
+
+    def test_created_student_gets_an_id(self):
+        """Test a student created without an ID gets the next one"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        res = client.post(reverse("curriculum:student-list"), {
+            "first_name": "Kofi", "last_name": "Boateng",
+            "gender": "Male", "date_of_admission": "08-09-2025",
+        }, format="json")
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED, res.data)
+        student = Student.objects.get(first_name="Kofi")
+        self.assertRegex(student.student_id, r"^HHA202500001\d$")
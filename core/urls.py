@@ -1,6 +1,7 @@
 """"
 API endpoints to the dashboard requests solely
 """
+from django.conf import settings
 from django.urls import path, include
 
 from rest_framework.routers import DefaultRouter
@@ -23,8 +24,21 @@ router.register(
     basename="school-config"
 )
 
+router.register(
+    "uploads",
+    views.UploadTicketView,
+    basename="uploads"
+)
+
 
 urlpatterns = [
     path("", include(router.urls)),
-    path("metrics/", views.DashboardView.as_view(), name="metrics"),
+    path(
+        "metrics/",
+        views.dashboard_metrics_view if settings.SERVER_MODE == "asgi"
+        else views.DashboardView.as_view(),
+        name="metrics"
+        ),
+    path("perf/", views.PerfView.as_view(), name="perf"),
+    path("cache-stats/", views.CacheStatsView.as_view(), name="cache-stats"),
 ]
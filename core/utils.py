@@ -2,9 +2,16 @@
 Utilities for the core
 """
 from enum import Enum
-from psycopg2.extras import DateRange
+from string import Formatter
+from django.core.exceptions import ValidationError
+from django.db.backends.postgresql.psycopg_any import DateRange
 from datetime import date
 import calendar
+import mimetypes
+
+# Fields of a student ID pattern, see utils.student_ids
+STUDENT_ID_FIELDS = {"prefix", "initials", "year", "number", "check"}
+DEFAULT_STUDENT_ID_PATTERN = "{prefix}{year}{number:05d}{check}"
 
 
 def get_upload_path(instance, filename):
@@ -15,6 +22,41 @@ def get_upload_path(instance, filename):
     )
 
 
+def file_metadata(field_file) -> tuple:
+    """Size and content type of a freshly uploaded file, else (None, None)"""
+    if not field_file or getattr(field_file, "_committed", True):
+        return None, None
+    upload = field_file.file
+    content_type = getattr(upload, "content_type", None)
+    if not content_type:
+        content_type = mimetypes.guess_type(field_file.name)[0]
+    return upload.size, content_type
+
+
+def validate_student_id_pattern(pattern: str):
+    """
+    A pattern made of the student ID fields, with the year and number that
+    keep the IDs apart
+    """
+    try:
+        fields = {
+            name for _, name, _, _ in Formatter().parse(pattern)
+            if name is not None
+        }
+        pattern.format(prefix="", initials="", year=2000, number=1, check="")
+    except (KeyError, IndexError, ValueError):
+        raise ValidationError(
+            "Use only the fields %(fields)s, without a format for {check}",
+            params={"fields": ", ".join(sorted(STUDENT_ID_FIELDS))}
+        )
+    if not fields <= STUDENT_ID_FIELDS or not {"year", "number"} <= fields:
+        raise ValidationError(
+            "A student ID pattern needs {year} and {number} and only the "
+            "fields %(fields)s",
+            params={"fields": ", ".join(sorted(STUDENT_ID_FIELDS))}
+        )
+
+
 def get_payrun_period():
     """Return default date range to the period"""
     day_1 = date.today().replace(day=1)
@@ -127,6 +169,51 @@ class PayrollRunStatus(Enum):
     Approved = "Approved"
 
 
+class LedgerSource(Enum):
+    Income = "Income"
+    Expenditure = "Expenditure"
+    Payment = "Payment"
+
+
+class TransactionType(Enum):
+    Income = "Income"
+    Expenditure = "Expenditure"
+    Payment = "Payment"
+    ArrearPayment = "ArrearPayment"
+
+
+class AttachmentSource(Enum):
+    Invoice = "Invoice"
+    Expenditure = "Expenditure"
+    Income = "Income"
+    Document = "Document"
+
+
+class UploadTarget(Enum):
+    Document = "Document"
+    Invoice = "Invoice"
+    StudentImage = "StudentImage"
+    StaffPicture = "StaffPicture"
+
+
+class UploadStatus(Enum):
+    Issued = "Issued"
+    Confirmed = "Confirmed"
+
+
+class GuardianPhoneField(Enum):
+    """ParentOrGuardian fields holding a phone number"""
+    Mobile = "mobile_number"
+    Father = "father_telephone"
+    Mother = "mother_telephone"
+
+
+class SeriesInterval(Enum):
+    Day = "day"
+    Week = "week"
+    Month = "month"
+
+
 CUSTOM_MESSAGES = {
     ('User', 'Create'): "{} was created",
     ('User', 'Update'): "{} details were updated for {}",
@@ -2,12 +2,10 @@
 Generic views for dasboard API
 """
 import logging
-from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 # from itertools import chain
-from django.db.models import (
-    # Value, CharField,
-    Sum
-)
 # from django.forms.models import model_to_dict
 from rest_framework import (
     permissions, status, viewsets,
@@ -15,40 +13,52 @@ from rest_framework import (
     )
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.decorators import action
 from drf_spectacular.utils import extend_schema
 from django_filters.rest_framework import DjangoFilterBackend
-
 from core.models import (
-    DatabaseActionLog,
-    StudentClass,
-    Staff,
-    Class, AcademicYear,
+    AcademicTerm,
+    AcademicYear,
     OrganizationDocument,
     OrganizationConfig,
-    Payment
+    UploadTicket
 )
-from curriculum.serializers import ClassSerializer, PaymentSerializer
 from user.serializers import UserSerializer
 from core.serializers import (
-    DatabaseActionSerializer,
     # DashboardSerialaizer
     OrganizationDocumentSerializer,
-    OrganizationConfigSerializer
+    OrganizationConfigSerializer,
+    UploadTicketSerializer
     )
-from finance.models import (
-    Income, Expenditure
-)
-from finance.serializers import IncomeSerializer, ExpenditureSerializer
 from utils.pagination import StandardResultsSetPagination
-from core.utils import StaffType
+from utils.s3_upload import UploadError, confirm_ticket, issue_ticket
+from utils.perf import perf_stats
+from utils.db import pool_stats
+from utils.replica import ReplicaReadMixin
+from config.routers import REPLICA_DB_ALIAS
+from utils.cache import CachedReadMixin, cache_stats
+from utils.conditional import (
+    ConditionalGetMixin, conditional_etag, not_modified, with_validators
+)
+from utils.async_api import async_api_view, json_response
+from utils.dashboard import (
+    adashboard_metrics, dashboard_metrics, dashboard_salt, dashboard_sources,
+    serialize
+)
 
 logger = logging.getLogger(__name__)
 
 
-class DashboardView(APIView):
+class DashboardView(ReplicaReadMixin, ConditionalGetMixin, APIView):
     """Dashboard metrics view"""
     permission_classes = [permissions.IsAuthenticated]
 
+    def conditional_sources(self, request) -> list:
+        return dashboard_sources()
+
+    def conditional_salt(self, request) -> list:
+        return dashboard_salt(UserSerializer(instance=request.user).data)
+
     @extend_schema(responses={
        (200, 'application/json'): {
             'description': 'Dashboard',
@@ -91,189 +101,91 @@ class DashboardView(APIView):
     })
     def get(self, request):
         """Data for initial dashboard"""
-        # Miscellaneous
-        user = UserSerializer(instance=request.user).data
-        current_year = AcademicYear.objects.get(is_active=True)
-        # current_classes = Class.objects.filter(
-        #     academic_year=current_year
-        # )
-        current_payment = Payment.objects.filter(
-            academic_year=current_year
-        ).aggregate(Sum("amount")).get("amount__sum")
-        previous_students = 0
-        previous_payment = 0
-        previous_income = 0
-        previous_expenditure = 0
-        if current_year.previous:
-            previous_students = StudentClass.objects.filter(
-                academic_year=current_year.previous
-            ).values_list("student").count()
-            previous_income = Income.objects.filter(
-                academic_year=current_year.previous
-            ).aggregate(Sum("amount")).get("amount__sum")
-            previous_expenditure = Expenditure.objects.filter(
-                academic_year=current_year.previous
-            ).aggregate(Sum("amount")).get("amount__sum")
-            previous_payment = Payment.objects.filter(
-                academic_year=current_year.previous
-            ).aggregate(Sum("amount")).get("amount__sum")
-        # Students data
-        total_students = StudentClass.objects.filter(
-            academic_year=current_year,
-            student__is_active=True,
-        ).values_list("student").count()
-        student_percent_change = 100
-        if previous_students is not None and previous_students > 0:
-            student_percent_change = (
-                total_students-previous_students)/previous_students
-        else:
-            previous_students = 0
-        male_students_count = StudentClass.objects.filter(
-            academic_year=current_year,
-            student__is_active=True,
-            student__gender="Male",
-        ).values_list("student").count()
-        female_students_count = StudentClass.objects.filter(
-            academic_year=current_year,
-            student__is_active=True,
-            student__gender="Female",
-        ).values_list("student").count()
-        student_change_type = "increase"
-        if student_percent_change < 0:
-            student_change_type = "decrease"
-        # Teacher data
-        total_teachers = Staff.objects.filter(
-            is_active=True, staff_type=StaffType.Teaching
-            ).count()
-        total_teachers_non = Staff.objects.filter(
-            is_active=True, staff_type=StaffType.Non_Teaching
-            ).count()
-        payment_percent_change = 100
-        if previous_payment is not None and previous_payment > 0:
-            payment_percent_change = (
-                current_payment-previous_payment)/previous_payment
-        else:
-            previous_payment = 0
-        payment_change_type = "increase"
-        if payment_percent_change < 0:
-            payment_change_type = "decrease"
-        # Recent activities
-        recent_activity = DatabaseActionLog.objects.all().order_by(
-            "-timestamp"
-        )[:5]
-        recent_serialzed = DatabaseActionSerializer(
-            instance=recent_activity, many=True).data
-        # Classes data
-        class_obj = Class.objects.all()
-        class_data = ClassSerializer(instance=class_obj, many=True).data
-        # Transaction summary
-        total_expenditure = Expenditure.objects.filter(
-            academic_year__is_active=True,
-        ).values_list("amount", flat=True)
-        total_income = Income.objects.filter(
-            academic_year__is_active=True,
-        ).values_list("amount", flat=True)
-        income_percent_change = 100
-        expense_percent_change = 100
-        if previous_income is not None and previous_income > 0:
-            income_percent_change = (
-                total_income-previous_income)/previous_income
-        else:
-            previous_income = 0
-        if previous_expenditure is not None and previous_expenditure > 0:
-            expense_percent_change = (
-                total_expenditure-previous_expenditure)/previous_expenditure
-        else:
-            previous_expenditure = 0
-        income_change_type = "increase"
-        expense_change_type = "increase"
-        if income_percent_change < 0:
-            income_change_type = "decrease"
-        if expense_percent_change < 0:
-            expense_change_type = "decrease"
-        # Recent transactions
-        recent_income = Income.objects.filter(
-            academic_year__is_active=True
-        ).order_by("-date_created")[:5]
-        recent_expense = Expenditure.objects.filter(
-            academic_year__is_active=True
-        ).order_by("-date_created")[:5]
-        monthly_payment = Payment.objects.filter(
-            date_created__year=datetime.now().year,
-            date_created__month=datetime.now().month
-            ).aggregate(Sum("amount"))
-        monthly_income = Income.objects.filter(
-            date_created__year=datetime.now().year,
-            date_created__month=datetime.now().month
-            ).aggregate(Sum("amount"))
-        start_week = datetime.today() - timedelta(datetime.today().weekday())
-        end_week = start_week + timedelta(7)
-        # print(start_week, end_week)
-        weekly_income = Income.objects.filter(
-            date_created__range=[start_week, end_week]
-        ).aggregate(Sum("amount"))
-        monthly_expenditure = Expenditure.objects.filter(
-            date_created__year__gte=datetime.now().year,
-            date_created__month=datetime.now().month
-            ).aggregate(Sum("amount"))
-        weekly_expenditure = Expenditure.objects.filter(
-            date_created__range=[start_week, end_week]
-        ).aggregate(Sum("amount"))
-        weekly_payment = Payment.objects.filter(
-            date_created__range=[start_week, end_week]
-        ).aggregate(Sum("amount"))
-        dashboard_data = {
-                "user": user,
-                "students": {
-                     "total": total_students,
-                     "male": male_students_count,
-                     "female": female_students_count,
-                     "change": str(abs(student_percent_change)) + "%",
-                     "change_type": student_change_type
-                },
-                "teachers": {
-                    "total_teachers": total_teachers,
-                    "total_non_teaching_staff": total_teachers_non,
-                },
-                "transactions": {
-                    "total_expenditure": sum(total_expenditure),
-                    "expense_percent_change": str(
-                        abs(expense_percent_change)) + "%",
-                    "expense_change_type": expense_change_type,
-                    "monthly_expenditure": monthly_expenditure["amount__sum"],
-                    "weekly_expenditure": weekly_expenditure["amount__sum"],
-                    "total_income": sum(total_income),
-                    "income_percent_change": str(
-                        abs(income_percent_change)) + "%",
-                    "income_change_type": income_change_type,
-                    "monthly_income": monthly_income["amount__sum"],
-                    "weekly_income": weekly_income["amount__sum"],
-                    "total_payment": current_payment,
-                    "change": str(abs(payment_percent_change)) + "%",
-                    "change_type": payment_change_type,
-                    "monthly_payment": monthly_payment["amount__sum"],
-                    "weekly_payment": weekly_payment["amount__sum"]
-                },
-                "classes": class_data,
-                "recent_activity": recent_serialzed,
-                "recent_transactions": {
-                    "income": IncomeSerializer(
-                        instance=recent_income, many=True
-                        ).data,
-                    "expenditure": ExpenditureSerializer(
-                        recent_expense, many=True
-                        ).data,
-                    "payment": PaymentSerializer(
-                        instance=Payment.objects.filter(
-                            academic_year__is_active=True
-                        ).order_by("-date_created")[:5],
-                        many=True
-                        ).data
-                }
-            }
+        return self.conditional_response(
+            request, lambda: self.dashboard_data(request)
+        )
+
+    def dashboard_data(self, request) -> Response:
         return Response(
-            dashboard_data, status=status.HTTP_200_OK
+            dashboard_metrics(request.user),
+            status=status.HTTP_200_OK
+        )
+
+
+@async_api_view(replica=True)
+async def dashboard_metrics_view(request):
+    """DashboardView for the event loop, routed when SERVER_MODE is asgi"""
+    user_data = await serialize(UserSerializer, request.user, many=False)
+    etag, newest = await sync_to_async(conditional_etag)(
+        request, DashboardView.__name__, dashboard_sources(),
+        dashboard_salt(user_data)
+    )
+    response = not_modified(request, etag)
+    if response is None:
+        response = with_validators(
+            json_response(await adashboard_metrics(request.user)),
+            etag, newest
         )
+    return response
+
+
+class PerfView(APIView):
+    """Request timings and slow queries of this worker process"""
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses={
+        (200, 'application/json'): {
+            'description': 'Performance statistics',
+            'type': 'json',
+            'example': {
+                "process": 12,
+                "endpoints": [
+                    {
+                        "view": "GET StudentView.list",
+                        "count": 120,
+                        "wall_ms": {"p50": 80.1, "p90": 210.4, "p99": 480.0, "max": 512.3},
+                        "db_queries": {"p50": 42, "p90": 61, "p99": 61, "max": 61},
+                        "db_ms": {"p50": 30.2, "p90": 70.5, "p99": 120.1, "max": 130.0},
+                        "serializer_ms": {"p50": 40.0, "p90": 120.2, "p99": 300.4, "max": 310.0},
+                        "response_bytes": {"p50": 20480, "p90": 40960, "p99": 40960, "max": 40960}
+                    }
+                ],
+                "slow_queries": [
+                    {
+                        "view": "GET StudentView.list",
+                        "duration_ms": 130.0,
+                        "sql": "SELECT ...",
+                        "stack": ["curriculum/serializers.py:104 in get_student_class_obj"]
+                    }
+                ],
+                "db_pool": {
+                    "process": 12,
+                    "pooled": True,
+                    "conn_max_age": 0,
+                    "statement_timeout_ms": 15000,
+                    "long_statement_timeout_ms": 120000,
+                    "min_size": 1,
+                    "max_size": 4,
+                    "stats": {
+                        "pool_min": 1, "pool_max": 4, "pool_size": 2,
+                        "pool_available": 1, "requests_num": 310,
+                        "requests_waiting": 0
+                    }
+                }
+            }
+        },
+    })
+    def get(self, request):
+        report = perf_stats.report()
+        report["db_pool"] = pool_stats()
+        if REPLICA_DB_ALIAS in settings.DATABASES:
+            report["db_replica_pool"] = pool_stats(REPLICA_DB_ALIAS)
+        return Response(report, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        """Start a fresh measurement window"""
+        perf_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class OrganizationDocumentView(viewsets.ModelViewSet):
@@ -294,21 +206,146 @@ class OrganizationDocumentView(viewsets.ModelViewSet):
         ]
 
 
-class OrganizationConfigView(viewsets.ModelViewSet):
+class OrganizationConfigView(
+        ConditionalGetMixin, CachedReadMixin, viewsets.ModelViewSet):
     """School Config API views"""
     queryset = OrganizationConfig.objects.all()
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = OrganizationConfigSerializer
     http_method_names = ["get", "post", "patch", "delete"]
+    cache_namespace = "organization_config"
+    cache_scope = "user"
 
     def get_queryset(self):
         return self.queryset.filter(organizational_user=self.request.user)
 
+    def conditional_sources(self, request) -> list:
+        # The config also returns the active academic year and term
+        return super().conditional_sources(request) + [
+            (AcademicYear.objects.all(), self.conditional_fields),
+            (AcademicTerm.objects.all(), self.conditional_fields),
+        ]
+
+    def conditional_salt(self, request) -> list:
+        # Activated with update() the timestamps above would not move
+        return [
+            *AcademicYear.objects.filter(is_active=True).values_list(
+                "id", flat=True
+            ),
+            *AcademicTerm.objects.filter(is_active=True).values_list(
+                "id", flat=True
+            ),
+        ]
+
     def list(self, request, *args, **kwargs):
-        raw_data = self.queryset.get(
-            organizational_user=self.request.user
+        def read():
+            raw_data = self.queryset.get(
+                organizational_user=self.request.user
+            )
+            return Response(
+                self.serializer_class(instance=raw_data).data,
+                status=status.HTTP_200_OK
+                )
+        return self.conditional_response(
+            request, lambda: self.cached_response(request, read)
+        )
+
+
+class CacheStatsView(APIView):
+    """Reference data cache hits and misses of this worker process"""
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses={
+        (200, 'application/json'): {
+            'description': 'Cache statistics',
+            'type': 'json',
+            'example': {
+                "process": 12,
+                "backend": "django.core.cache.backends.filebased.FileBasedCache",
+                "namespaces": [
+                    {
+                        "namespace": "classes",
+                        "version": 1718000000000000001,
+                        "hits": 340,
+                        "misses": 12,
+                        "hit_ratio": 0.966
+                    }
+                ]
+            }
+        },
+    })
+    def get(self, request):
+        return Response(cache_stats.report(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        """Start counting again"""
+        cache_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadTicketView(viewsets.ModelViewSet):
+    """Presigned direct uploads to S3: issue a ticket, then confirm it"""
+    queryset = UploadTicket.objects.all().order_by("-date_created")
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = UploadTicketSerializer
+    http_method_names = ["get", "post"]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        """Issue an upload ticket with the presigned POST form"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            ticket, upload = issue_ticket(
+                request.user, data["target"], data["filename"],
+                data["content_type"], object_id=data.get("object_id"),
+                size=data.get("file_size"),
+                details={
+                    key: data[field] for key, field in [
+                        ("name", "document_name"),
+                        ("description", "description"),
+                        ("file_type", "file_type")
+                    ] if data.get(field)
+                }
+            )
+        except UploadError as e:
+            return Response(
+                {
+                    "message": "Unable to issue an upload ticket",
+                    "error_message": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            {
+                **self.serializer_class(instance=ticket).data,
+                "upload": upload
+            },
+            status=status.HTTP_201_CREATED
         )
+
+    @action(
+            detail=True, methods=["post"],
+            url_path="confirm", url_name="confirm")
+    def confirm(self, request, *args, **kwargs):
+        """Register the uploaded object with its size and checksum"""
+        try:
+            ticket = confirm_ticket(
+                self.get_object(), checksum=request.data.get("checksum")
+                )
+        except UploadError as e:
+            return Response(
+                {
+                    "message": "Unable to confirm the upload",
+                    "error_message": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(
-            self.serializer_class(instance=raw_data).data,
+            self.serializer_class(instance=ticket).data,
             status=status.HTTP_200_OK
-            )
+        )
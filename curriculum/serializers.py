@@ -31,6 +31,8 @@ from core.serializers import (
 
 # Any other local import here
 from utils.utils import generate_random_string
+from utils.student_ids import next_student_id
+from utils.thumbnails import thumbnail_url
 
 # Declare the logger for the file
 logger = logging.getLogger(__name__)
@@ -83,6 +85,7 @@ class StudentSerializer(BaseModelSerializer):
     fee_assigned = serializers.CharField(required=False, write_only=True)
     student_class_obj = serializers.SerializerMethodField()
     guardian = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     date_created = serializers.DateTimeField(
         required=False, read_only=True,
         format="%d-%m-%Y", input_formats=settings.DATE_INPUT_FORMATS
@@ -122,6 +125,10 @@ class StudentSerializer(BaseModelSerializer):
                 }
         return {}
 
+    def get_thumbnail_url(self, instance):
+        """Small copy of the student image for lists and rosters"""
+        return thumbnail_url(instance.image_thumbnail, self.context)
+
     def get_guardian(self, instance):
         """Add parent/guardian object"""
         if ParentOrGuardian.objects.filter(students=instance).exists():
@@ -139,8 +146,9 @@ class StudentSerializer(BaseModelSerializer):
             "id", 'date_created', "last_modified",
             "student_id", "first_name", "last_name", "middle_name", "gender",
             "date_of_birth", "date_of_admission",
-            "blood_type", "student_class_obj", "image", "address",
-            "guardian", "is_active", "student_class", "fee_assigned"
+            "blood_type", "student_class_obj", "image", "thumbnail_url",
+            "address", "guardian", "is_active", "student_class",
+            "fee_assigned"
         ]
         read_only_fields = ["id", "date_created", "last_modified"]
         extra_kwargs = {
@@ -153,19 +161,15 @@ class StudentSerializer(BaseModelSerializer):
         fee_assigned = validated_data.pop("fee_assigned", None)
         if std_class:
             validated_data.pop("student_class")
-        if validated_data["date_of_admission"]:
-            first_name = validated_data.get("first_name", "")
-            last_name = validated_data.get("last_name", "")
-            middle_name = validated_data.get("middle_name", "")
-            student_name = first_name + " " + middle_name + " " + last_name
-            date_of_admission = validated_data["date_of_admission"]
-            studentID = generate_random_string(length=5).join(next(zip(
-                                *student_name.split()
-                                ))).upper() + str(
-                                date_of_admission.strftime("%Y")
-                                )
-            print(studentID)
-            validated_data["student_id"] = studentID
+        if not validated_data.get("student_id"):
+            date_of_admission = validated_data.get("date_of_admission")
+            validated_data["student_id"] = next_student_id(
+                self.context["request"].user.organization,
+                validated_data.get("first_name"),
+                validated_data.get("middle_name"),
+                validated_data.get("last_name"),
+                year=date_of_admission.year if date_of_admission else None
+            )
         instance = super().create(validated_data)
         if std_class:
             sdc_serializer = StudentClassSerializer(
@@ -317,6 +321,7 @@ class StaffSerializer(BaseModelSerializer):
     teacher_class_obj = serializers.SerializerMethodField()
     subjects_assigned = serializers.ListField(required=False)
     subject_obj = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     date_created = serializers.DateTimeField(
         required=False, read_only=True,
         format="%d-%m-%Y", input_formats=settings.DATE_INPUT_FORMATS
@@ -357,6 +362,12 @@ class StaffSerializer(BaseModelSerializer):
             instance=instance.user
         ).data
 
+    def get_thumbnail_url(self, instance):
+        """Small copy of the profile picture for lists"""
+        return thumbnail_url(
+            instance.profile_picture_thumbnail, self.context
+            )
+
     class Meta:
         model = Staff
         fields = [
@@ -364,7 +375,7 @@ class StaffSerializer(BaseModelSerializer):
             "first_name", "last_name", "email", "user_type",
             "staff_id", "gender",
             "date_of_birth", "start_date", "is_active",
-            "profile_picture", "staff_type", "address",
+            "profile_picture", "thumbnail_url", "staff_type", "address",
             "role", "employment_type",
             "teacher_class_obj",
             "teacher_class", "subject_obj", "subjects_assigned",
@@ -64,5 +64,9 @@ router.register(
 
 
 urlpatterns = [
+    path(
+        "payment/<uuid:pk>/receipt/download/",
+        views.payment_receipt_download, name="payment-receipt-download"
+    ),
     path("", include(router.urls)),
 ]
@@ -2,12 +2,16 @@
 Views for the Curriculum API.
 """
 import os
+from decimal import Decimal, InvalidOperation
 from typing import Any
+from uuid import UUID
 from datetime import datetime, timedelta
 from django.core.files import File
 from django.http import Http404
 from django.core.exceptions import ValidationError
-from django.db.models import Sum, Case, When, Value, IntegerField
+from django.db.models import (
+    Sum, Case, When, Value, IntegerField, Q, OuterRef, Subquery
+)
 import logging
 from rest_framework import (
     # generics,
@@ -23,7 +27,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 
 from curriculum.serializers import (
     AcademicYearSerializer, StudentSerializer,
@@ -49,13 +53,26 @@ from utils.pdf_generate import convert_html_to_pdf
 from core.utils import StaffType
 from utils.custom_permissions import SchoolAdmin
 from utils.fee_payment import (
-    fee_payment_breakdown, payment_aggregate,
-    arrears_payment_aggregate
+    fee_breakdown, fee_payment_breakdown, money, payment_aggregate,
+    arrears_payment_aggregate, with_owing
+)
+from utils.utils import class_to_fee_group
+from utils.cache import CachedReadMixin
+from utils.conditional import ConditionalGetMixin
+from utils.idempotency import IdempotentCreateMixin
+from utils.phones import caller_lookup, to_e164
+from utils.receipts import next_receipt_number
+from utils.replica import ReplicaReadMixin
+from utils.student_profile import student_profile
+from utils.search import (
+    GuardianSearchFilter, StudentSearchFilter, search_students
 )
-from utils.utils import generate_random_receipt_number, class_to_fee_group
+from utils.async_api import async_api_view, error_response, file_download
 
 
 logger = logging.getLogger(__name__)
+# Students returned by StudentView.autocomplete
+AUTOCOMPLETE_LIMIT = 10
 
 
 class AcademicYearView(viewsets.ModelViewSet):
@@ -135,7 +152,7 @@ class AcademicTermView(viewsets.ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete"]
 
 
-class StudentView(viewsets.ModelViewSet):
+class StudentView(ReplicaReadMixin, viewsets.ModelViewSet):
     """API View for Students"""
     permissions = {
         'default': (permissions.IsAuthenticated,),
@@ -146,15 +163,12 @@ class StudentView(viewsets.ModelViewSet):
     queryset = Student.objects.all().order_by("-date_created")
     http_method_names = ["get", "post", "patch", "delete"]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, StudentSearchFilter]
     filterset_fields = [
         'date_created', 'gender',
         'is_active'
         ]
-    search_fields = [
-        'first_name', 'last_name', 'middle_name',
-        'student_id'
-        ]
+    replica_actions = {"metrics", "finance", "fees"}
 
     def get_permissions(self) -> Any:
         self.permission_classes = self.permissions.get(
@@ -227,11 +241,65 @@ class StudentView(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
+    @extend_schema(parameters=[
+        OpenApiParameter("q", str, description="Name, student id or phone")
+    ])
+    @action(
+            detail=False, methods=["get"],
+            url_path="autocomplete", url_name="autocomplete")
+    def autocomplete(self, request, *args, **kwargs) -> Response:
+        """Best matching students of a few typed letters, with their class"""
+        current_class = StudentClass.objects.filter(
+            student=OuterRef("pk"), academic_year__is_active=True
+        ).values("student_class__name")[:1]
+        matches = search_students(
+            Student.objects.all(), request.query_params.get("q", "")
+        ).annotate(
+            current_class=Subquery(current_class)
+        ).values(
+            "id", "student_id", "first_name", "middle_name", "last_name",
+            "current_class", "search_rank"
+        )[:AUTOCOMPLETE_LIMIT]
+        return Response({
+            "results": [
+                {
+                    "id": match["id"],
+                    "student_id": match["student_id"],
+                    "name": " ".join(filter(None, [
+                        match["first_name"], match["middle_name"],
+                        match["last_name"]
+                    ])),
+                    "current_class": match["current_class"],
+                    "rank": round(match["search_rank"] or 0, 4),
+                }
+                for match in matches
+            ]
+        }, status=status.HTTP_200_OK)
+
+    @action(
+            detail=True, methods=["get"],
+            url_path="profile", url_name="profile")
+    def profile(self, request, pk=None) -> Response:
+        """
+        Class, guardians, fees per term with payments, arrears and balance
+        of the student, everything the student page shows. Read from the
+        primary: the cached copy must not come from a lagging replica
+        """
+        try:
+            profile = student_profile(UUID(pk))
+        except ValueError:
+            profile = None
+        if profile is None:
+            return Response({
+                "message": "Student not found"
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response(profile, status=status.HTTP_200_OK)
+
     @action(
             detail=True, methods=["get"],
             url_path="finance", url_name="finance")
     def finance(self, request, pk=None) -> Response:
-        """Return financial data on the student"""
+        """Return financial data on the student, see profile"""
         try:
             student_class = StudentClass.objects.get(
                 student=self.get_object(),
@@ -264,7 +332,7 @@ class StudentView(viewsets.ModelViewSet):
             detail=True, methods=["get"],
             url_path="fees", url_name="fees")
     def student_fee_assigned(self, request, pk=None) -> Response:
-        """Fee assigned, paid, owing"""
+        """Fee assigned, paid, owing, see profile"""
         acad_term = AcademicTerm.objects.get(is_active=True).term,
         if not acad_term:
             acad_term = ""
@@ -445,18 +513,32 @@ class ParentOrGuardianView(viewsets.ModelViewSet):
     queryset = ParentOrGuardian.objects.all().order_by("-date_created")
     http_method_names = ["get", "post", "patch", "delete"]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, GuardianSearchFilter]
     filterset_fields = [
         'date_created'
         ]
-    search_fields = [
-        'full_name', 'home_care_giver_name', 'name_of_father',
-        'name_of_mother', 'students__first_name',
-        'students__last_name'
-        ]
+
+    @extend_schema(parameters=[
+        OpenApiParameter("phone", str, description="Number of the caller")
+    ])
+    @action(
+            detail=False, methods=["get"],
+            url_path="lookup", url_name="lookup")
+    def lookup(self, request, *args, **kwargs) -> Response:
+        """Guardians with a phone number, their students and balances"""
+        phone = to_e164(request.query_params.get("phone"))
+        if phone is None:
+            return Response({
+                "message": "Enter the phone number of the caller",
+                "error_message": "Invalid phone number"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "phone": phone,
+            "results": caller_lookup(phone)
+        }, status=status.HTTP_200_OK)
 
 
-class StaffView(viewsets.ModelViewSet):
+class StaffView(ReplicaReadMixin, viewsets.ModelViewSet):
     """API View for the Teacher """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = StaffSerializer
@@ -472,6 +554,7 @@ class StaffView(viewsets.ModelViewSet):
     search_fields: list[str] = [
         'user__first_name', 'user__last_name', 'staff_id',
         ]
+    replica_actions = {"metrics"}
 
     def get_queryset(self) -> Any:
         return self.queryset.filter(
@@ -498,8 +581,9 @@ class StaffView(viewsets.ModelViewSet):
         )
 
 
-class SubjectView(viewsets.ModelViewSet):
+class SubjectView(CachedReadMixin, viewsets.ModelViewSet):
     """API View for the Subject"""
+    cache_namespace = "subjects"
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = SubjectSerializer
     queryset = Subject.objects.all().order_by("-date_created")
@@ -529,8 +613,10 @@ class SubjectView(viewsets.ModelViewSet):
 #         ]
 
 
-class ClassView(viewsets.ModelViewSet):
+class ClassView(
+        ConditionalGetMixin, CachedReadMixin, viewsets.ModelViewSet):
     """API View for the Class View"""
+    cache_namespace = "classes"
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ClassSerializer
     queryset = Class.objects.all().order_by("-date_created")
@@ -618,8 +704,12 @@ class ClassView(viewsets.ModelViewSet):
         })
 
 
-class StudentFeeGroupView(viewsets.ModelViewSet):
+class StudentFeeGroupView(
+        ConditionalGetMixin, CachedReadMixin, viewsets.ModelViewSet):
     """API View for the student fee grup"""
+    cache_namespace = "fee_groups"
+    # fees_obj is serialized too, fee changes and m2m edits move the ETag
+    conditional_fields = ["last_modified", "fees__last_modified"]
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = StudentFeegroupSerializer
     queryset = StudentFeeGroup.objects.filter(academic_year__is_active=True)
@@ -636,7 +726,7 @@ class TeacherAssignmentView(viewsets.ModelViewSet):
     pagination_class = StandardResultsSetPagination
 
 
-class StudentClassView(viewsets.ModelViewSet):
+class StudentClassView(ReplicaReadMixin, viewsets.ModelViewSet):
     """API View for the student to class mapping"""
     permissions = {
         'default': (permissions.IsAuthenticated,),
@@ -647,6 +737,14 @@ class StudentClassView(viewsets.ModelViewSet):
     queryset = StudentClass.objects.filter(academic_year__is_active=True).order_by("-date_created")
     http_method_names = ["get", "post", "patch", "delete"]
     pagination_class = StandardResultsSetPagination
+    replica_actions = {"owing"}
+    owing_orderings = {
+        "owing": ("owing_amount", "student__last_name"),
+        "-owing": ("-owing_amount", "student__last_name"),
+        "name": ("student__last_name", "student__first_name"),
+        "-name": ("-student__last_name", "-student__first_name"),
+        "class": ("student_class__name", "student__last_name"),
+    }
 
     def get_permissions(self) -> Any:
         self.permission_classes = self.permissions.get(
@@ -661,6 +759,79 @@ class StudentClassView(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST)
         return super().handle_exception(exc)
 
+    @extend_schema(parameters=[
+        OpenApiParameter("student_class", str, description="Class id"),
+        OpenApiParameter(
+            "academic_year", str, description="e.g. 2024/2025, default active"
+        ),
+        OpenApiParameter(
+            "min_owing", float, description="Default 0.01, 0 lists everyone"
+        ),
+        OpenApiParameter("max_owing", float),
+        OpenApiParameter(
+            "ordering", str, enum=["-owing", "owing", "name", "-name", "class"]
+        ),
+    ])
+    @action(
+            detail=False, methods=["get"],
+            url_path="owing", url_name="owing")
+    def owing(self, request, *args, **kwargs) -> Response:
+        """
+        Who owes what: students with the amount paid on every fee of their
+        fee group and their total owing, columnar (see fee_breakdown)
+        """
+        params = request.query_params
+        student_classes = StudentClass.objects.all()
+        if params.get("academic_year"):
+            student_classes = student_classes.filter(
+                academic_year__year=params["academic_year"]
+            )
+        else:
+            student_classes = student_classes.filter(
+                academic_year__is_active=True
+            )
+        if params.get("student_class"):
+            student_classes = student_classes.filter(
+                student_class=params["student_class"]
+            )
+        try:
+            min_owing = Decimal(params.get("min_owing", "0.01"))
+            max_owing = (
+                Decimal(params["max_owing"]) if params.get("max_owing")
+                else None
+            )
+        except InvalidOperation:
+            return Response({
+                "message": "min_owing and max_owing must be amounts",
+                "error_message": "Invalid amount"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        ordering = self.owing_orderings.get(
+            params.get("ordering", "-owing"), self.owing_orderings["-owing"]
+        )
+        student_classes = with_owing(student_classes).filter(
+            owing_amount__gte=min_owing
+        )
+        if max_owing is not None:
+            student_classes = student_classes.filter(
+                owing_amount__lte=max_owing
+            )
+        page = self.paginate_queryset(
+            student_classes.order_by(*ordering, "id").only("id")
+        )
+        ids = [student_class.id for student_class in page]
+        breakdown = fee_breakdown(
+            StudentClass.objects.filter(id__in=ids), ordered_ids=ids
+        )
+        breakdown["fees"]["amount"] = [
+            money(amount) for amount in breakdown["fees"]["amount"]
+        ]
+        breakdown["paid"] = [
+            [None if paid is None else money(paid) for paid in row]
+            for row in breakdown["paid"]
+        ]
+        breakdown["owing"] = [money(owing) for owing in breakdown["owing"]]
+        return self.get_paginated_response(breakdown)
+
 
 class TeacherClassView(viewsets.ModelViewSet):
     """API View for the teacher to class mapping"""
@@ -671,7 +842,7 @@ class TeacherClassView(viewsets.ModelViewSet):
     pagination_class = StandardResultsSetPagination
 
 
-class FeeView(viewsets.ModelViewSet):
+class FeeView(ConditionalGetMixin, viewsets.ModelViewSet):
     """API Views for the Fee model"""
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = FeeSerializer
@@ -682,8 +853,26 @@ class FeeView(viewsets.ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete"]
 
 
-class PaymentView(viewsets.ModelViewSet):
-    """API View for Fee Payment"""
+@async_api_view()
+async def payment_receipt_download(request, pk):
+    """Download the receipt generated for a payment or arrear payment"""
+    receipt = await PaymentReceipt.objects.filter(
+        Q(payment__id=pk) | Q(arrear_payment__id=pk)
+    ).afirst()
+    if receipt is None:
+        return error_response(
+            "Receipt has not been generated, call the receipt endpoint first",
+            status.HTTP_400_BAD_REQUEST
+        )
+    return await file_download(receipt.file, "application/pdf")
+
+
+class PaymentView(IdempotentCreateMixin, ReplicaReadMixin,
+                  viewsets.ModelViewSet):
+    """
+    API View for Fee Payment. Send an Idempotency-Key header with a
+    payment to have a retry return the first result instead of paying twice
+    """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = PaymentSerializer
     queryset = Payment.objects.filter(
@@ -698,6 +887,7 @@ class PaymentView(viewsets.ModelViewSet):
         'student__first_name', 'student__last_name', 'academic_year__year',
         'academic_term__term'
         ]
+    replica_actions = {"metrics"}
 
     def handle_exception(self, exc) -> Any:
         if isinstance(exc, ValidationError):
@@ -756,7 +946,6 @@ class PaymentView(viewsets.ModelViewSet):
     def get_receipt(self, request, pk=None) -> Response:
         """Generate and retun a PDF receipt given Payment ID"""
         arrear_payment_map = []
-        receipt_number = generate_random_receipt_number()
         try:
             arrear_paid_obj = None
             payment_data = self.get_object()
@@ -813,6 +1002,7 @@ class PaymentView(viewsets.ModelViewSet):
                 )
             except PaymentReceipt.DoesNotExist:
                 try:
+                    receipt_number = next_receipt_number(org)
                     all_payments = fee_payment_breakdown(payment_data.student.id)
                     amount_assigned, amount_paid, amount_owing = payment_aggregate(
                         payment_data.student.id
@@ -824,7 +1014,7 @@ class PaymentView(viewsets.ModelViewSet):
                         "cheque_number": "" if payment_data.cheque_number is None else payment_data.cheque_number,
                         "payer": payment_data.student.__str__(),
                         "date": payment_data.date_created.strftime("%d-%m-%Y"),
-                        "receipt_number": receipt_number[:8],
+                        "receipt_number": receipt_number,
                         "client_reference": payment_data.student.__str__(),
                         "description": f"Payment for {payment_data.fee.name}",
                         "income_amount": payment_data.amount,
@@ -869,6 +1059,7 @@ class PaymentView(viewsets.ModelViewSet):
                         status=status.HTTP_200_OK
                     )
                 except PaymentReceipt.DoesNotExist:
+                    receipt_number = next_receipt_number(org)
                     purpose = f"Arrears Payment for {arrear_paid_obj.fee_arrear.student.__str__()}"
                     data_dict.update({
                             "cashier_name": arrear_paid_obj.user.__str__(),
@@ -933,8 +1124,8 @@ class FeeArrearView(viewsets.ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete"]
 
 
-class ArrearPaymentView(viewsets.ModelViewSet):
-    """API Views for the arears payment"""
+class ArrearPaymentView(IdempotentCreateMixin, viewsets.ModelViewSet):
+    """API Views for the arears payment, Idempotency-Key as for payments"""
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ArrearPaymentSerializer
     queryset = ArrearPayment.objects.filter(
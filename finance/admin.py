@@ -18,6 +18,13 @@ class ExpenditureAdmin(admin.ModelAdmin):
     list_per_page = 10
 
 
+class LedgerDaySummaryAdmin(admin.ModelAdmin):
+    """Admin view for the ledger day summaries"""
+    list_display = ["source", "day", "total_amount", "entry_count"]
+    list_filter = ["source"]
+    list_per_page = 10
+
+
 admin.site.register(models.Supplier)
 admin.site.register(models.TaxConfig)
 admin.site.register(models.Tax)
@@ -30,3 +37,4 @@ admin.site.register(models.ExpenditureType)
 admin.site.register(models.Expenditure, ExpenditureAdmin)
 admin.site.register(models.Receipt)
 admin.site.register(models.PayrollRun)
+admin.site.register(models.LedgerDaySummary, LedgerDaySummaryAdmin)
@@ -0,0 +1,66 @@
+"""
+Fill in size and content type of files uploaded before they were recorded
+"""
+import mimetypes
+from typing import Optional, Any
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.models import OrganizationDocument
+from finance.models import Expenditure
+
+
+class Command(BaseCommand):
+    help = "Record size and content type of previously uploaded attachments"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Rows written per update query"
+        )
+
+    def backfill(self, queryset, file_field, size_field, type_field, batch_size):
+        """Read the metadata from storage and write it back in batches"""
+        storage = queryset.model._meta.get_field(file_field).storage
+        batch = []
+        updated = 0
+        for obj in queryset.only("id", file_field).iterator(
+                chunk_size=batch_size):
+            name = getattr(obj, file_field).name
+            try:
+                setattr(obj, size_field, storage.size(name))
+            except (OSError, ValueError):
+                self.stdout.write(
+                    self.style.WARNING(f"Missing file {name}")
+                )
+                continue
+            setattr(obj, type_field, mimetypes.guess_type(name)[0])
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                queryset.model.objects.bulk_update(
+                    batch, [size_field, type_field]
+                )
+                updated += len(batch)
+                batch = []
+        queryset.model.objects.bulk_update(batch, [size_field, type_field])
+        return updated + len(batch)
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Backfill expenditure invoices and organization documents"""
+        invoices = self.backfill(
+            Expenditure.objects.filter(
+                invoice__isnull=False, invoice_size__isnull=True
+            ).exclude(invoice=""),
+            "invoice", "invoice_size", "invoice_content_type",
+            options["batch_size"]
+        )
+        documents = self.backfill(
+            OrganizationDocument.objects.filter(file_size__isnull=True),
+            "file", "file_size", "content_type",
+            options["batch_size"]
+        )
+        self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully backfilled {invoices} invoice(s) '
+                    f'and {documents} document(s)'
+                    )
+                )
@@ -43,7 +43,7 @@ class Command(BaseCommand):
                 }
             )
         # Create Payment Detail objects if there is none - 20
-        for staff in Staff.objects.all():
+        for staff in Staff.objects.all().iterator(chunk_size=500):
             try:
                 PaymentDetail.objects.get(
                     staff=staff,
@@ -0,0 +1,49 @@
+"""
+Roll up closed ledger days into the LedgerDaySummary table
+"""
+from datetime import timedelta
+from typing import Optional, Any
+from django.core.management.base import BaseCommand, CommandParser
+from django.db.models import Min
+from django.utils import timezone
+
+from core.utils import LedgerSource
+from utils.cashflow import (
+    LEDGER_MODELS, summarised_until, summarise_days
+)
+
+
+class Command(BaseCommand):
+    help = "Summarise income, expenditure and payments per closed day"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="Summarise every closed day again from the first entry"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        """Summarise each source up to yesterday"""
+        yesterday = timezone.localdate() - timedelta(days=1)
+        for source in LedgerSource:
+            closed_until = summarised_until(source.value)
+            if closed_until is None or options["rebuild"]:
+                first_entry = LEDGER_MODELS[source.value].objects.aggregate(
+                    Min("date_created")
+                )["date_created__min"]
+                if first_entry is None:
+                    continue
+                start = timezone.localdate(first_entry)
+            else:
+                start = closed_until + timedelta(days=1)
+            if start > yesterday:
+                continue
+            days = summarise_days(source.value, start, yesterday)
+            self.stdout.write(
+                f"{source.value}: {days} day(s) summarised from {start}"
+            )
+        self.stdout.write(
+                self.style.SUCCESS(
+                    'Successfully rolled up the ledger'
+                    )
+                )
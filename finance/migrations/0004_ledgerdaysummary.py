@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:46
+
+import django.core.validators
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0003_alter_expenditure_payment_method_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerDaySummary',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('source', models.CharField(choices=[('Income', 'Income'), ('Expenditure', 'Expenditure'), ('Payment', 'Payment')], max_length=100)),
+                ('day', models.DateField(db_index=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14, validators=[django.core.validators.MinValueValidator(0)])),
+                ('entry_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Ledger Day Summaries',
+                'constraints': [models.UniqueConstraint(fields=('source', 'day'), name='unique_ledger_day_summary')],
+            },
+        ),
+    ]
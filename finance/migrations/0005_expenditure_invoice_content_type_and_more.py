@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_organizationdocument_content_type_and_more'),
+        ('finance', '0004_ledgerdaysummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expenditure',
+            name='invoice_content_type',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='expenditure',
+            name='invoice_size',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Size in bytes, set on upload', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(condition=models.Q(('invoice__isnull', False), models.Q(('invoice', ''), _negated=True)), fields=['-date_created', '-id'], name='expenditure_invoice_idx'),
+        ),
+    ]
@@ -9,6 +9,7 @@ from django.core.validators import MinValueValidator
 
 # Django imports
 from django.db import models
+from django.db.models import Q
 from django.contrib.postgres.fields import (
     DateRangeField,
     # RangeOperators
@@ -29,7 +30,9 @@ from core.utils import (
     # payment_method,
     PaymentMethod,
     PayrollRunStatus,
-    get_payrun_period
+    LedgerSource,
+    get_payrun_period,
+    file_metadata
 )
 
 PaymentTypes = tuple((item.value, item.name) for item in list(PaymentType))
@@ -37,6 +40,7 @@ PaymentMethods = tuple((item.value, item.name) for item in list(PaymentMethod))
 PayrollRunStatuses = tuple(
     (item.value, item.name) for item in list(PayrollRunStatus)
     )
+LedgerSources = tuple((item.value, item.name) for item in list(LedgerSource))
 
 
 class TaxConfig(models.Model):
@@ -214,6 +218,12 @@ class Expenditure(models.Model):
         null=True, blank=True
         )
     invoice = models.FileField(upload_to="invoices", null=True, blank=True)
+    invoice_size = models.PositiveBigIntegerField(
+        null=True, blank=True, help_text="Size in bytes, set on upload"
+        )
+    invoice_content_type = models.CharField(
+        max_length=255, null=True, blank=True
+        )
     expense_date = models.DateField(default=date.today)
     uploaded_file = models.ManyToManyField(
         OrganizationDocument,
@@ -228,6 +238,22 @@ class Expenditure(models.Model):
         default="Bank"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-date_created", "-id"],
+                name="expenditure_invoice_idx",
+                condition=Q(invoice__isnull=False) & ~Q(invoice="")
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        invoice_size, content_type = file_metadata(self.invoice)
+        if invoice_size is not None:
+            self.invoice_size = invoice_size
+            self.invoice_content_type = content_type
+        super().save(*args, **kwargs)
+
 
 class SalaryBand(models.Model):
     """The salary divisions for the various roles"""
@@ -469,3 +495,34 @@ class Receipt(models.Model):
     file = models.FileField(upload_to="receipts")
     income = models.ForeignKey(Income, on_delete=models.CASCADE)
     receipt_number = models.CharField(max_length=100, unique=True)
+
+
+class LedgerDaySummary(models.Model):
+    """Daily totals of a ledger source for days that are already closed"""
+    id = models.UUIDField(
+        primary_key=True,
+        unique=True, db_index=True,
+        default=uuid4, editable=False
+    )
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    source = models.CharField(max_length=100, choices=LedgerSources)
+    day = models.DateField(db_index=True)
+    total_amount = models.DecimalField(
+        max_digits=14, decimal_places=2,
+        validators=[MinValueValidator(0)],
+        default=Decimal(0.00)
+    )
+    entry_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Ledger Day Summaries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "day"],
+                name="unique_ledger_day_summary"
+                )
+        ]
+
+    def __str__(self):
+        return f"{self.source} on {self.day}"
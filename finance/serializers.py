@@ -5,7 +5,6 @@ import logging
 from decimal import Decimal
 from rest_framework import serializers
 
-from core.models import Staff
 
 from finance.models import (
     TaxConfig,
@@ -32,7 +31,10 @@ from curriculum.serializers import (
 )
 
 from utils.finance import (
-    summary_tax,
+    BENEFIT_FIELDS,
+    PAYROLL_AMOUNT_FIELDS,
+    preview_payroll,
+    staff_pay_rows,
     update_chargeable,
     update_payrun_basic
     )
@@ -341,6 +343,7 @@ class ExpenditureSerializer(BaseModelSerializer):
             "amount", "expenditure_type", "expenditure_type_name",
             "expenditure_type_obj", "uploaded_file_obj",
             "user_obj", "purpose", "invoice",
+            "invoice_size", "invoice_content_type",
             "academic_year", "academic_term", "academic_term_id",
             "academic_year_id", "expense_date",
             "uploaded_file", "supplier", "payment_type", "supplier_obj"
@@ -348,6 +351,7 @@ class ExpenditureSerializer(BaseModelSerializer):
         read_only_fields = [
             "id", "date_created", "last_modified",
             "academic_year", "academic_term",
+            "invoice_size", "invoice_content_type",
         ]
 
     def create(self, validated_data):
@@ -480,31 +484,24 @@ class PayrollRunSerializer(BaseModelSerializer):
         user = self.context["request"].user
         validated_data["user"] = user
         payroll_run = super().create(validated_data)
-        ssnit_rate = user.organization.ssnit_rate
-        tier_three = user.organization.tier_three
-        all_staff = Staff.objects.filter(
-            is_active=True,
-            user__organization=user.organization
-            )
-        result = []
-        total_chargeable = 0
-        total_basic = 0
         try:
-            for staff in all_staff:
-                # print(staff)
-                payroll_calc = summary_tax(staff.id, ssnit_rate, tier_three)
-                if payroll_calc is not None:
-                    payroll_calc["payrun"] = payroll_run
-                    instance = Payroll.objects.create(
-                        staff=staff,
-                        **payroll_calc
-                    )
-                    total_chargeable += payroll_calc["chargeable_income"]
-                    total_basic += payroll_calc["basic_salary"]
-                    result.append(instance)
+            # The same computation as the previews, on fresh rows
+            run = preview_payroll(
+                staff_pay_rows(user.organization),
+                user.organization.ssnit_rate, user.organization.tier_three
+            )
+            Payroll.objects.bulk_create([
+                Payroll(
+                    payrun=payroll_run, staff_id=line["staff"],
+                    **{field: line[field] for field in PAYROLL_AMOUNT_FIELDS}
+                )
+                for line in run["payroll"]
+            ])
             created_run = PayrollRun.objects.get(id=payroll_run.id)
-            created_run.total_chargeable_income = total_chargeable
-            created_run.total_basic = total_basic
+            created_run.total_chargeable_income = (
+                run["totals"]["chargeable_income"]
+            )
+            created_run.total_basic = run["totals"]["basic_salary"]
             created_run.save()
         except Exception as e:
             try:
@@ -515,6 +512,54 @@ class PayrollRunSerializer(BaseModelSerializer):
         return created_run
 
 
+class SalaryBandChangeSerializer(serializers.Serializer):
+    """New amount or benefits of a salary band in a payroll preview"""
+    amount = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal(0.0),
+        required=False
+    )
+    benefit_package = serializers.DictField(
+        child=serializers.DecimalField(
+            max_digits=10, decimal_places=2, min_value=Decimal(0.0)
+        ),
+        required=False
+    )
+
+    def validate_benefit_package(self, value):
+        unknown = set(value) - set(BENEFIT_FIELDS)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown benefits {', '.join(sorted(unknown))}, use "
+                f"{', '.join(BENEFIT_FIELDS)}"
+            )
+        return value
+
+
+class PayrollPreviewSerializer(serializers.Serializer):
+    """
+    Changes tried in a payroll preview, the organization's rates and the
+    current salary bands otherwise
+    """
+    ssnit_rate = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal(0.0),
+        required=False
+    )
+    tier_three = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal(0.0),
+        required=False
+    )
+    salary_bands = serializers.DictField(
+        child=SalaryBandChangeSerializer(), required=False,
+        help_text="Changes by salary band id"
+    )
+    bonuses = serializers.DictField(
+        child=serializers.DecimalField(
+            max_digits=10, decimal_places=2, min_value=Decimal(0.0)
+        ),
+        required=False, help_text="Bonus income by staff id"
+    )
+
+
 class PayrollSerializer(BaseModelSerializer):
     """Payroll generation"""
     date_created = serializers.DateTimeField(
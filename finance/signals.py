@@ -0,0 +1,44 @@
+"""
+Signal receivers for the finance app
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import Payment, User
+from core.utils import LedgerSource
+from finance.models import Income, Expenditure
+from utils.cache import bump_namespace
+from utils.cashflow import summarised_until, summarise_days
+from utils.finance import PAYROLL_NAMESPACE, PAYROLL_USER_FIELDS
+
+
+@receiver(post_save, sender=Income)
+@receiver(post_delete, sender=Income)
+@receiver(post_save, sender=Expenditure)
+@receiver(post_delete, sender=Expenditure)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_ledger_day_summary(sender, instance, **kwargs):
+    """Recompute a closed day when one of its entries changes"""
+    source = LedgerSource[sender.__name__].value
+    closed_until = summarised_until(source)
+    if closed_until is None or instance.date_created is None:
+        return
+    entry_day = timezone.localdate(instance.date_created)
+    if entry_day <= closed_until:
+        summarise_days(source, entry_day, entry_day)
+
+
+@receiver(post_save, sender=User)
+def refresh_payroll_snapshot(sender, instance, update_fields=None, **kwargs):
+    """
+    Drop the payroll snapshots when a user is saved with their name or
+    organization, not on the last_login updates of every sign in
+    """
+    if update_fields is not None and \
+            not PAYROLL_USER_FIELDS.intersection(update_fields):
+        return
+    bump_namespace(PAYROLL_NAMESPACE)
+    transaction.on_commit(lambda: bump_namespace(PAYROLL_NAMESPACE))
@@ -0,0 +1,710 @@
+"""
+Test finance API flows
+"""
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+import tempfile
+from uuid import uuid4
+
+from asgiref.sync import async_to_sync
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import (
+    AcademicYear, AcademicTerm, Fee, Payment, Staff, Student,
+    OrganizationConfig, OrganizationDocument
+)
+from finance.models import (
+    IncomeType, Income, ExpenditureType, Expenditure, LedgerDaySummary,
+    PaymentDetail, Payroll, PayrollRun, Receipt, SalaryBand
+)
+from finance.views import income_metrics_view
+from utils.db import statement_timeout
+from utils.cache import namespace_version
+from utils.finance import (
+    PAYROLL_NAMESPACE, compute_payroll_line, update_chargeable,
+    update_payrun_basic
+)
+
+
+CASHFLOW_SERIES_URL = reverse("finance:cashflow-series")
+INCOME_METRICS_URL = reverse("finance:income-metrics")
+TRANSACTIONS_URL = reverse("finance:transactions")
+RECENT_TRANSACTIONS_URL = reverse("finance:recent-transactions")
+ATTACHMENTS_URL = reverse("finance:attachments")
+EXPENDITURE_FILES_URL = reverse("finance:expenditure-files")
+PAYRUN_URL = reverse("finance:payrun-list")
+PAYRUN_PREVIEW_URL = reverse("finance:payrun-preview")
+DASHBOARD_URL = reverse("finance-admin:dashboard")
+
+
+def create_user(**params):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(**params)
+
+
+class CashflowSeriesTests(TestCase):
+    """Test the cashflow series and metrics endpoints"""
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        self.client = APIClient()
+        self.user = create_user(
+            email="finance@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.year = AcademicYear.objects.create(year="2023/2024")
+        self.term = AcademicTerm.objects.create(
+            academic_year=self.year, term="First Term"
+        )
+        self.income_type = IncomeType.objects.create(name="Donations")
+        self.today = timezone.localdate()
+
+    def create_income(self, amount, days_ago=0):
+        """Create an income entry dated a number of days back"""
+        income = Income.objects.create(
+            income_type=self.income_type, academic_year=self.year,
+            academic_term=self.term, user=self.user,
+            amount=Decimal(amount), purpose="Test"
+        )
+        Income.objects.filter(id=income.id).update(
+            date_created=timezone.now() - timedelta(days=days_ago)
+        )
+        return income
+
+    def get_series(self):
+        """Daily income series over the last three days"""
+        start = self.today - timedelta(days=2)
+        res = self.client.get(CASHFLOW_SERIES_URL, {
+            "start": start.strftime("%d-%m-%Y"),
+            "end": self.today.strftime("%d-%m-%Y"),
+            "sources": "Income"
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data["series"]["Income"]
+
+    def test_series_length_is_capped(self):
+        """Test ranges beyond the bucket cap of the interval are rejected"""
+        def get(start, interval):
+            return self.client.get(CASHFLOW_SERIES_URL, {
+                "start": start.strftime("%d-%m-%Y"),
+                "end": self.today.strftime("%d-%m-%Y"),
+                "interval": interval, "sources": "Income"
+            })
+
+        year_ago = self.today - timedelta(days=365)
+        res = get(year_ago, "day")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["series"]["Income"]), 366)
+        res = get(year_ago - timedelta(days=1), "day")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("366 day buckets", res.data["error_message"])
+        res = get(self.today - timedelta(weeks=520), "week")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = get(self.today - timedelta(weeks=519), "week")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["series"]["Income"]), 520)
+        res = get(date(1900, 1, 1), "month")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_series_is_same_before_and_after_rollup(self):
+        """Test summarised days give the same buckets as the live rows"""
+        self.create_income("100", days_ago=2)
+        self.create_income("50", days_ago=2)
+        self.create_income("25", days_ago=0)
+        live = self.get_series()
+        self.assertEqual(
+            [row["total"] for row in live],
+            [Decimal("150"), Decimal("0"), Decimal("25")]
+        )
+        self.assertEqual([row["count"] for row in live], [2, 0, 1])
+
+        call_command("rollup_ledger", stdout=StringIO())
+        self.assertTrue(
+            LedgerDaySummary.objects.filter(
+                source="Income", day=self.today - timedelta(days=1)
+            ).exists()
+        )
+        self.assertEqual(self.get_series(), live)
+
+    def test_closed_day_is_refreshed_on_change(self):
+        """Test editing an entry of a summarised day updates its summary"""
+        income = self.create_income("100", days_ago=2)
+        call_command("rollup_ledger", stdout=StringIO())
+        income.refresh_from_db()
+        income.amount = Decimal("80")
+        income.save()
+        self.assertEqual(self.get_series()[0]["total"], Decimal("80"))
+
+    def test_invalid_interval(self):
+        """Test an unknown interval is rejected"""
+        res = self.client.get(CASHFLOW_SERIES_URL, {"interval": "hour"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_income_metrics(self):
+        """Test the income metrics come from a single aggregate"""
+        self.create_income("100")
+        self.create_income("40")
+        res = self.client.get(INCOME_METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["total_income"], Decimal("140"))
+        self.assertEqual(res.data["weekly_income"], Decimal("140"))
+        self.assertEqual(res.data["change"], "100%")
+
+
+class FinanceDashboardTests(TestCase):
+    """Test the server rendered finance dashboard"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user(
+            email="dashboard@example.com", password="testpass123",
+            is_active=True
+        )
+        self.client.force_login(self.user)
+        self.year = AcademicYear.objects.create(
+            year="2023/2024", is_active=True
+        )
+        self.term = AcademicTerm.objects.create(
+            academic_year=self.year, term="First Term"
+        )
+        self.income_type = IncomeType.objects.create(name="Donations")
+        self.expenditure_type = ExpenditureType.objects.create(name="Repairs")
+
+    def create_incomes(self, count, amount="10"):
+        Income.objects.bulk_create([
+            Income(
+                income_type=self.income_type, academic_year=self.year,
+                academic_term=self.term, user=self.user,
+                amount=Decimal(amount), purpose=f"Gift {number}"
+            )
+            for number in range(count)
+        ])
+
+    def test_login_required(self):
+        """Test anonymous users are sent to the login page"""
+        res = Client().get(DASHBOARD_URL)
+        self.assertEqual(res.status_code, status.HTTP_302_FOUND)
+
+    def test_totals_and_pages(self):
+        """Test the totals cover every row and the tables one page"""
+        self.create_incomes(25)
+        Expenditure.objects.create(
+            expenditure_type=self.expenditure_type, academic_year=self.year,
+            academic_term=self.term, user=self.user,
+            amount=Decimal("40"), purpose="Roof"
+        )
+        res = self.client.get(DASHBOARD_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertContains(res, "250.00")
+        self.assertContains(res, "210.00")
+        self.assertContains(res, "Page 1 of 2")
+        self.assertEqual(len(res.context["income_page"].object_list), 20)
+        self.assertContains(res, "finance/admin.css")
+        self.assertNotContains(res, "cdnjs")
+
+        res = self.client.get(DASHBOARD_URL, {"income_page": 2})
+        self.assertContains(res, "Page 2 of 2")
+        self.assertEqual(len(res.context["income_page"].object_list), 5)
+
+    def test_cached_render_is_flat(self):
+        """Test a cached render reads no ledger rows however many exist"""
+        self.create_incomes(5)
+        Income.objects.first().save()
+        self.client.get(DASHBOARD_URL)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(DASHBOARD_URL)
+
+        self.create_incomes(50)
+        Income.objects.first().save()
+        self.client.get(DASHBOARD_URL)
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(DASHBOARD_URL)
+        self.assertEqual(len(many), len(few))
+        self.assertFalse(any(
+            "finance_income" in query["sql"] for query in many.captured_queries
+        ))
+        self.assertContains(res, "Page 1 of 3")
+
+    def test_new_income_is_shown(self):
+        """Test saving an income drops the cached fragments"""
+        self.client.get(DASHBOARD_URL)
+        Income.objects.create(
+            income_type=self.income_type, academic_year=self.year,
+            academic_term=self.term, user=self.user,
+            amount=Decimal("75"), purpose="Bake sale"
+        )
+        res = self.client.get(DASHBOARD_URL)
+        self.assertContains(res, "Bake sale")
+        self.assertContains(res, "75.00")
+
+
+class TransactionFeedTests(TestCase):
+    """Test the unified transactions feed"""
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        self.client = APIClient()
+        self.user = create_user(
+            email="cashbook@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user=self.user)
+        year = AcademicYear.objects.create(year="2023/2024")
+        term = AcademicTerm.objects.create(
+            academic_year=year, term="First Term"
+        )
+        self.student = Student.objects.create(
+            first_name="Ama", last_name="Mensah"
+        )
+        fee = Fee.objects.create(
+            academic_year=year, academic_term=term,
+            amount=Decimal("500"), name="School Fees"
+        )
+        common = {
+            "academic_year": year, "academic_term": term, "user": self.user
+        }
+        now = timezone.now()
+        entries = [
+            Income.objects.create(
+                income_type=IncomeType.objects.create(name="Donations"),
+                amount=Decimal("10"), purpose="Gift", **common
+            ),
+            Expenditure.objects.create(
+                expenditure_type=ExpenditureType.objects.create(name="Fuel"),
+                amount=Decimal("20"), purpose="Generator", **common
+            ),
+            Income.objects.create(
+                income_type=IncomeType.objects.get(name="Donations"),
+                amount=Decimal("30"), purpose="Gift", student=self.student,
+                **common
+            ),
+        ]
+        # Payment.save needs a full class setup, the feed only reads rows
+        entries += Payment.objects.bulk_create([
+            Payment(
+                student=self.student, fee=fee, amount=Decimal("40"), **common
+            )
+        ])
+        for position, entry in enumerate(entries):
+            entry.__class__.objects.filter(id=entry.id).update(
+                date_created=now - timedelta(hours=len(entries) - position)
+            )
+
+    def test_feed_is_merged_by_date(self):
+        """Test all sources come back newest first across pages"""
+        res = self.client.get(TRANSACTIONS_URL, {"page_size": 3})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["amount"] for row in res.data["results"]],
+            [Decimal("40"), Decimal("30"), Decimal("20")]
+        )
+        self.assertEqual(res.data["results"][0]["purpose"], "School Fees")
+        res = self.client.get(TRANSACTIONS_URL, {
+            "page_size": 3, "cursor": res.data["next_cursor"]
+        })
+        self.assertEqual(
+            [row["amount"] for row in res.data["results"]], [Decimal("10")]
+        )
+        self.assertIsNone(res.data["next"])
+
+    def test_feed_filters(self):
+        """Test filtering the feed by type and student"""
+        res = self.client.get(TRANSACTIONS_URL, {"type": "Expenditure"})
+        self.assertEqual(
+            [row["model_type"] for row in res.data["results"]],
+            ["Expenditure"]
+        )
+        res = self.client.get(
+            TRANSACTIONS_URL, {"student": str(self.student.id)}
+        )
+        self.assertEqual(
+            [row["model_type"] for row in res.data["results"]],
+            ["Payment", "Income"]
+        )
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        res = self.client.get(TRANSACTIONS_URL, {"cursor": "not-a-cursor"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recent_transactions(self):
+        """Test recent transactions include student payments"""
+        res = self.client.get(RECENT_TRANSACTIONS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["recent_transactions"]), 4)
+        self.assertEqual(
+            res.data["recent_transactions"][0]["model_type"], "Payment"
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AttachmentIndexTests(TestCase):
+    """Test the attachments index"""
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        self.client = APIClient()
+        self.user = create_user(
+            email="files@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user=self.user)
+        year = AcademicYear.objects.create(year="2023/2024")
+        term = AcademicTerm.objects.create(
+            academic_year=year, term="First Term"
+        )
+        common = {
+            "academic_year": year, "academic_term": term, "user": self.user,
+            "amount": Decimal("10"), "purpose": "Test"
+        }
+        organization = OrganizationConfig.objects.create(name="School")
+        self.expenditure = Expenditure.objects.create(
+            expenditure_type=ExpenditureType.objects.create(name="Fuel"),
+            invoice=SimpleUploadedFile(
+                "fuel.pdf", b"%PDF-1.4 fuel", content_type="application/pdf"
+            ),
+            **common
+        )
+        Expenditure.objects.create(
+            expenditure_type=ExpenditureType.objects.get(name="Fuel"),
+            **common
+        )
+        self.receipt = OrganizationDocument.objects.create(
+            organization=organization, name="Receipt", file_type="Income",
+            file=SimpleUploadedFile(
+                "receipt.png", b"png-bytes", content_type="image/png"
+            )
+        )
+        income = Income.objects.create(
+            income_type=IncomeType.objects.create(name="Donations"), **common
+        )
+        income.uploaded_file.add(self.receipt)
+        OrganizationDocument.objects.create(
+            organization=organization, name="Policy", file_type="Invoice",
+            file=SimpleUploadedFile("policy.txt", b"policy")
+        )
+
+    def test_metadata_is_stored_on_upload(self):
+        """Test size and content type are recorded when a file is saved"""
+        self.assertEqual(self.expenditure.invoice_size, 13)
+        self.assertEqual(
+            self.expenditure.invoice_content_type, "application/pdf"
+        )
+        self.assertEqual(self.receipt.file_size, 9)
+        self.assertEqual(self.receipt.content_type, "image/png")
+
+    def test_attachment_index(self):
+        """Test every source is listed once and paged by cursor"""
+        res = self.client.get(ATTACHMENTS_URL, {"page_size": 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rows = res.data["results"]
+        res = self.client.get(ATTACHMENTS_URL, {
+            "page_size": 2, "cursor": res.data["next_cursor"]
+        })
+        rows += res.data["results"]
+        self.assertIsNone(res.data["next"])
+        self.assertEqual(
+            [row["source"] for row in rows],
+            ["Document", "Income", "Invoice"]
+        )
+        self.assertEqual(rows[1]["owner"], self.receipt.income_set.get().id)
+        self.assertEqual(rows[2]["name"], "fuel.pdf")
+        self.assertTrue(rows[2]["url"])
+
+    def test_attachment_index_by_owner(self):
+        """Test the files of a single expenditure"""
+        res = self.client.get(ATTACHMENTS_URL, {
+            "owner": str(self.expenditure.id), "urls": "false"
+        })
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertNotIn("url", res.data["results"][0])
+
+    def test_expenditure_files(self):
+        """Test only expenditures with an invoice are listed"""
+        res = self.client.get(EXPENDITURE_FILES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 1)
+
+
+class AsyncViewTests(TestCase):
+    """Test the async views served in ASGI mode"""
+
+    def setUp(self):
+        """Initial setup for test cases"""
+        self.user = create_user(
+            email="async@example.com", password="testpass123", is_active=True
+        )
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        year = AcademicYear.objects.create(year="2023/2024", is_active=True)
+        term = AcademicTerm.objects.create(
+            academic_year=year, term="First Term"
+        )
+        self.income = Income.objects.create(
+            income_type=IncomeType.objects.create(name="Donations"),
+            academic_year=year, academic_term=term, user=self.user,
+            amount=Decimal("75"), purpose="Test"
+        )
+
+    def test_async_metrics_match_sync(self):
+        """Test the async income metrics render like the DRF action"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        expected = client.get(INCOME_METRICS_URL).json()
+        request = RequestFactory().get(
+            INCOME_METRICS_URL, HTTP_AUTHORIZATION=f"Bearer {self.token}"
+        )
+        res = async_to_sync(income_metrics_view)(request)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(res.content), expected)
+
+        res = async_to_sync(income_metrics_view)(
+            RequestFactory().get(INCOME_METRICS_URL)
+        )
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_receipt_download(self):
+        """Test a generated receipt is served and a missing one explained"""
+        url = reverse(
+            "finance:income-receipt-download", args=[self.income.id]
+        )
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {self.token}"}
+        res = self.client.get(url, **auth)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            Receipt.objects.create(
+                income=self.income, receipt_number="R-1",
+                file=SimpleUploadedFile("R-1.pdf", b"%PDF-1.4 receipt")
+            )
+            res = self.client.get(url, **auth)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.content, b"%PDF-1.4 receipt")
+            self.assertIn("attachment", res["Content-Disposition"])
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_payrun_totals(self):
+        """Test the payrun totals are written from its payroll lines"""
+        run = PayrollRun.objects.create(user=self.user)
+        Payroll.objects.create(
+            payrun=run, basic_salary=Decimal("1000"),
+            chargeable_income=Decimal("800"),
+            staff=Staff.objects.create(user=self.user, staff_id="T-1")
+        )
+        self.assertEqual(update_payrun_basic(run.id), Decimal("1000"))
+        self.assertEqual(update_chargeable(run.id), Decimal("800"))
+        run.refresh_from_db()
+        self.assertEqual(run.total_basic, Decimal("1000"))
+        self.assertEqual(run.total_chargeable_income, Decimal("800"))
+
+
+class PayrollPreviewTests(TestCase):
+    """Test payroll previews are computed like payroll runs, without saving"""
+
+    def setUp(self):
+        self.organization = OrganizationConfig.objects.create(
+            name="School", ssnit_rate=Decimal("5.5"), tier_three=Decimal("5")
+        )
+        self.user = create_user(
+            email="payroll@example.com", password="testpass123",
+            organization=self.organization
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.teacher = SalaryBand.objects.create(
+            name="Teacher", amount=Decimal("2500"), user=self.user,
+            benefit_package={"cash_allowance": "200", "excess_bonus": 50}
+        )
+        self.head = SalaryBand.objects.create(
+            name="Head", amount=Decimal("6000"), user=self.user
+        )
+        self.staff = [
+            self.add_staff(index, band, residency)
+            for index, (band, residency) in enumerate([
+                (self.teacher, "Resident-Full-Time"),
+                (self.teacher, "Non-Resident"),
+                (self.head, "Resident-Full-Time"),
+            ])
+        ]
+
+    def add_staff(self, index, band, residency):
+        staff = Staff.objects.create(
+            user=create_user(
+                email=f"staff{index}@example.com", password="testpass123",
+                organization=self.organization
+            ),
+            staff_id=f"P-{index}", residency_status=residency
+        )
+        PaymentDetail.objects.create(
+            user=self.user, staff=staff, salary_band=band
+        )
+        return staff
+
+    def test_payroll_line(self):
+        """Test the PAYE bands and the rate of non residents"""
+        line = compute_payroll_line(
+            Decimal("1000"), None, "Resident-Full-Time", 0, 0
+        )
+        self.assertEqual(line["chargeable_income"], Decimal("1000.00"))
+        self.assertEqual(line["tax_deductible"], Decimal("81.15"))
+        line = compute_payroll_line(
+            Decimal("1000"), {"deductible_relief": 100}, "Non-Resident", 0, 0
+        )
+        self.assertEqual(line["tax_deductible"], Decimal("225.00"))
+
+    def test_preview_matches_the_run(self):
+        """Test a preview returns the lines a payroll run writes"""
+        res = self.client.post(PAYRUN_PREVIEW_URL, {}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["staff_count"], 3)
+        self.assertFalse(PayrollRun.objects.exists())
+        self.assertFalse(Payroll.objects.exists())
+
+        res_run = self.client.post(PAYRUN_URL, {}, format="json")
+        self.assertEqual(res_run.status_code, status.HTTP_201_CREATED)
+        run = PayrollRun.objects.get()
+        self.assertEqual(run.total_basic, res.data["totals"]["basic_salary"])
+        self.assertEqual(
+            run.total_chargeable_income,
+            res.data["totals"]["chargeable_income"]
+        )
+        for line in res.data["payroll"]:
+            payroll = Payroll.objects.get(payrun=run, staff_id=line["staff"])
+            self.assertEqual(payroll.tax_payable, line["tax_payable"])
+            self.assertEqual(payroll.ssnit_amount, line["ssnit_amount"])
+
+    def test_preview_with_changes(self):
+        """Test rates, salary bands and bonuses can be tried out"""
+        base = self.client.post(PAYRUN_PREVIEW_URL, {}, format="json").data
+        res = self.client.post(PAYRUN_PREVIEW_URL, {
+            "ssnit_rate": "0",
+            "salary_bands": {
+                str(self.head.id): {
+                    "amount": "7000",
+                    "benefit_package": {"cash_allowance": "300"}
+                }
+            },
+            "bonuses": {str(self.staff[0].id): "150"},
+        }, format="json")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["totals"]["ssnit_amount"], Decimal("0"))
+        lines = {line["staff_id"]: line for line in res.data["payroll"]}
+        self.assertEqual(lines["P-2"]["basic_salary"], Decimal("7000.00"))
+        self.assertEqual(lines["P-2"]["cash_allowance"], Decimal("300.00"))
+        self.assertEqual(lines["P-0"]["bonus_income"], Decimal("150.00"))
+        self.assertEqual(lines["P-1"]["bonus_income"], Decimal("0.00"))
+        self.assertEqual(
+            res.data["totals"]["basic_salary"]
+            - base["totals"]["basic_salary"],
+            Decimal("1000.00")
+        )
+        self.assertEqual(
+            SalaryBand.objects.get(pk=self.head.pk).amount, Decimal("6000")
+        )
+
+        res = self.client.post(PAYRUN_PREVIEW_URL, {
+            "salary_bands": {
+                str(self.head.id): {"benefit_package": {"car": "10"}}
+            },
+        }, format="json")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_previews_reuse_the_snapshot(self):
+        """Test repeated previews read the staff once, until they change"""
+        self.client.post(PAYRUN_PREVIEW_URL, {}, format="json")
+        with CaptureQueriesContext(connection) as queries:
+            for rate in range(10):
+                res = self.client.post(
+                    PAYRUN_PREVIEW_URL, {"ssnit_rate": rate}, format="json"
+                )
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse([
+            query for query in queries
+            if "finance_paymentdetail" in query["sql"]
+        ])
+
+        self.add_staff(3, self.head, "Resident-Full-Time")
+        res = self.client.post(PAYRUN_PREVIEW_URL, {}, format="json")
+        self.assertEqual(res.data["staff_count"], 4)
+
+    def test_login_keeps_the_snapshot(self):
+        """Test a sign in does not drop the snapshot, a new name does"""
+        version = namespace_version(PAYROLL_NAMESPACE)
+        Client().force_login(self.staff[0].user)
+        self.staff[0].user.refresh_from_db()
+        self.assertIsNotNone(self.staff[0].user.last_login)
+        self.assertEqual(namespace_version(PAYROLL_NAMESPACE), version)
+
+        self.staff[0].user.first_name = "Ama"
+        self.staff[0].user.save(update_fields=["first_name"])
+        self.assertNotEqual(namespace_version(PAYROLL_NAMESPACE), version)
+
+
+def current_statement_timeout():
+    """Statement timeout of the test connection"""
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW statement_timeout")
+        return cursor.fetchone()[0]
+
+
+class StatementTimeoutTests(TestCase):
+    """Test the statement timeouts of the database connection"""
+
+    def test_statement_timeout_block(self):
+        """Test a slow statement is cancelled and the default restored"""
+        default = current_statement_timeout()
+        with self.assertRaises(OperationalError), transaction.atomic():
+            with statement_timeout(50):
+                self.assertEqual(current_statement_timeout(), "50ms")
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_sleep(1)")
+        self.assertEqual(current_statement_timeout(), default)
+
+    @override_settings(DB_LONG_STATEMENT_TIMEOUT=90000)
+    def test_long_timeout_of_payroll_views(self):
+        """Test payroll requests run with the long timeout"""
+        default = current_statement_timeout()
+        client = APIClient()
+        client.force_authenticate(user=create_user(
+            email="payroll@example.com", password="testpass123"
+        ))
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            res = client.get(PAYRUN_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(["90000"], [params for _, params in statements])
+        self.assertEqual(statements[-1][0], "RESET statement_timeout")
+        self.assertEqual(current_statement_timeout(), default)
+
+    @override_settings(DB_LONG_STATEMENT_TIMEOUT=90000)
+    def test_long_timeout_reset_after_error(self):
+        """Test a payroll request that raises restores the default timeout"""
+        default = current_statement_timeout()
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user=create_user(
+            email="payroll@example.com", password="testpass123"
+        ))
+        res = client.post(
+            reverse("finance:payrun-process", args=[uuid4()])
+        )
+        self.assertEqual(
+            res.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+        self.assertEqual(current_statement_timeout(), default)
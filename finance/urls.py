@@ -1,6 +1,7 @@
 """"
 API endpoints to handle the Finance Requests
 """
+from django.conf import settings
 from django.urls import path, include
 
 from rest_framework.routers import DefaultRouter
@@ -49,10 +50,42 @@ router.register(
 
 
 urlpatterns = [
+    path(
+        "income/<uuid:pk>/receipt/download/",
+        views.income_receipt_download, name="income-receipt-download"
+    ),
     path("", include(router.urls)),
     path(
         "recent-transactions",
         views.RecentTransactions.as_view(),
         name="recent-transactions"
         ),
+    path(
+        "transactions",
+        views.TransactionFeedView.as_view(),
+        name="transactions"
+        ),
+    path(
+        "attachments",
+        views.AttachmentIndexView.as_view(),
+        name="attachments"
+        ),
+    path(
+        "cashflow-series",
+        views.CashflowSeriesView.as_view(),
+        name="cashflow-series"
+        ),
 ]
+
+if settings.SERVER_MODE == "asgi":
+    # Served from the event loop, ahead of the sync router actions
+    urlpatterns = [
+        path(
+            "income/metrics/", views.income_metrics_view,
+            name="income-metrics"
+        ),
+        path(
+            "expenditure/metrics/", views.expenditure_metrics_view,
+            name="expenditure-metrics"
+        ),
+    ] + urlpatterns
@@ -4,16 +4,14 @@ Views for the Curriculum API.
 import os
 import logging
 # import random
-from datetime import datetime, timedelta
-from itertools import chain
+from datetime import timedelta
 from typing import Any
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.conf import settings
 from django.core.files.base import File
-from django.db.models import (
-    Sum, Value, CharField, UUIDField,
-    Q
-    )
 from django.views import generic
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.contrib.auth import login, authenticate
 from django.shortcuts import render, redirect
 from rest_framework.views import APIView
@@ -28,6 +26,7 @@ from rest_framework import (
 
 # from rest_framework.settings import api_settings
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 
@@ -53,7 +52,8 @@ from finance.serializers import (
     PaymentDetailSerializer,
     PayrollSerializer,
     ReceiptSerializer,
-    PayrollRunSerializer
+    PayrollRunSerializer,
+    PayrollPreviewSerializer
 )
 from finance.models import (
     IncomeType, Income,
@@ -68,15 +68,57 @@ from finance.models import (
 )
 from finance.forms import UserLogin
 
-from utils.pagination import StandardResultsSetPagination
+from core.utils import LedgerSource, SeriesInterval
+from utils.cashflow import (
+    aperiod_totals, cashflow_series, check_series_range, parse_day,
+    period_totals
+)
+from utils.ledger import parse_types, transaction_feed
+from utils.attachments import attach_urls, attachment_index, parse_sources
+from utils.admin_dashboard import (
+    DASHBOARD_NAMESPACE, DASHBOARD_PAGE_SIZE, dashboard_summary
+)
+from utils.cache import CachedReadMixin, namespace_version
+from utils.db import StatementTimeoutMixin
+from utils.finance import payroll_snapshot, preview_payroll
+from utils.replica import ReplicaReadMixin
+from utils.async_api import (
+    async_api_view, error_response, file_download, json_response
+)
+
+from utils.pagination import (
+    CachedCountPaginator, StandardResultsSetPagination
+)
 from utils.pdf_generate import convert_html_to_pdf
+from utils.receipts import next_receipt_number
 
 
 logger = logging.getLogger(__name__)
 
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 200
+
 
-class TaxConfigView(viewsets.ModelViewSet):
+def ledger_metrics(name: str, totals: dict) -> dict:
+    """Metrics payload of the income or expenditure ledger"""
+    current = totals["year_total"]
+    previous = totals["previous_total"]
+    percent_change = 100
+    if previous is not None and previous > 0:
+        percent_change = ((current or 0) - previous) / previous
+    return {
+        f"total_{name}": current,
+        "change": str(abs(percent_change)) + "%",
+        "change_type": "decrease" if percent_change < 0 else "increase",
+        f"monthly_{name}": totals["month_total"],
+        f"weekly_{name}": totals["week_total"]
+    }
+
+
+class TaxConfigView(CachedReadMixin, viewsets.ModelViewSet):
     """Tax Config API View"""
+    cache_namespace = "tax_config"
+    cache_scope = "organization"
     queryset = TaxConfig.objects.all()
     serializer_class = TaxConfigSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -131,7 +173,7 @@ class IncomeTypeView(viewsets.ModelViewSet):
     # pagination_class = StandardResultsSetPagination
 
 
-class IncomeView(viewsets.ModelViewSet):
+class IncomeView(ReplicaReadMixin, viewsets.ModelViewSet):
     """API View for Income"""
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = IncomeSerializer
@@ -148,6 +190,7 @@ class IncomeView(viewsets.ModelViewSet):
         'student__first_name', 'student__last_name', 'tax__tax_config__name',
         'income_type__name', 'payer'
         ]
+    replica_actions = {"metrics"}
 
     @action(
             detail=False, methods=["get"],
@@ -155,41 +198,11 @@ class IncomeView(viewsets.ModelViewSet):
     def metrics(self, request, *args, **kwargs):
         """Return some metrics on Income"""
         current_year = AcademicYear.objects.get(is_active=True)
-        current_income = self.queryset.filter(
-            academic_year=current_year
-        ).aggregate(Sum("amount")).get("amount__sum")
-        previous_income = 0
-        if current_year.previous:
-            previous_income = self.queryset.filter(
-                academic_term=current_year.previous
-            ).aggregate(Sum("amount")).get("amount__sum")
-        percent_change = 100
-        if previous_income is not None and previous_income > 0:
-            percent_change = (
-                current_income-previous_income)/previous_income
-        else:
-            previous_income = 0
-        change_type = "increase"
-        if percent_change < 0:
-            change_type = "decrease"
-        monthly_income = self.queryset.filter(
-            date_created__year=datetime.now().year,
-            date_created__month=datetime.now().month
-            ).aggregate(Sum("amount"))
-        start_week = datetime.today() - timedelta(datetime.today().weekday())
-        end_week = start_week + timedelta(7)
-        print(start_week, end_week)
-        weekly_income = self.queryset.filter(
-            date_created__range=[start_week, end_week]
-        ).aggregate(Sum("amount"))
         return Response(
-            {
-                "total_income": current_income,
-                "change": str(abs(percent_change)) + "%",
-                "change_type": change_type,
-                "monthly_income": monthly_income["amount__sum"],
-                "weekly_income": weekly_income["amount__sum"]
-            },
+            ledger_metrics(
+                "income",
+                period_totals(LedgerSource.Income.value, current_year)
+            ),
             status=status.HTTP_200_OK
         )
 
@@ -213,13 +226,13 @@ class IncomeView(viewsets.ModelViewSet):
                 )
             except Receipt.DoesNotExist:
                 # income_data = Income.objects.get(id=income.id)
-                receipt_number = str(income_data.id).replace("-", "")
+                receipt_number = next_receipt_number(org)
                 data_dict = {
                     "organization_name": org.name,
                     "organization_address": org.address,
                     "payer": income_data.payer,
                     "date": income_data.income_date,
-                    "receipt_number": receipt_number[:8],
+                    "receipt_number": receipt_number,
                     "client_reference": income_data.payer,
                     "description": income_data.purpose,
                     "income_amount": income_data.amount,
@@ -233,7 +246,7 @@ class IncomeView(viewsets.ModelViewSet):
                 if pdf:
                     receipt = Receipt.objects.create(
                         income=income_data,
-                        receipt_number=receipt_number[:8],
+                        receipt_number=receipt_number,
                         purpose=income_data.purpose
                     )
                     # receipt_file = ""
@@ -279,7 +292,7 @@ class ExpenditureTypeView(viewsets.ModelViewSet):
     # pagination_class = StandardResultsSetPagination
 
 
-class ExpenditureView(viewsets.ModelViewSet):
+class ExpenditureView(ReplicaReadMixin, viewsets.ModelViewSet):
     """API View for Expenditure"""
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ExpenditureSerializer
@@ -298,6 +311,7 @@ class ExpenditureView(viewsets.ModelViewSet):
         'supplier__full_name',
         'supplier__company_name'
         ]
+    replica_actions = {"metrics"}
 
     @action(
             detail=False, methods=["get"],
@@ -305,41 +319,11 @@ class ExpenditureView(viewsets.ModelViewSet):
     def metrics(self, request, *args, **kwargs):
         """Return some metrics on Expenditure"""
         current_year = AcademicYear.objects.get(is_active=True)
-        current_expenditure = self.queryset.filter(
-            academic_year=current_year
-        ).aggregate(Sum("amount")).get("amount__sum")
-        previous_expenditure = 0
-        if current_year.previous:
-            previous_expenditure = self.queryset.filter(
-                academic_year=current_year.previous
-            ).aggregate(Sum("amount")).get("amount__sum")
-        percent_change = 100
-        if previous_expenditure is not None and previous_expenditure > 0:
-            percent_change = (
-                current_expenditure-previous_expenditure)/previous_expenditure
-        else:
-            previous_expenditure = 0
-        change_type = "increase"
-        if percent_change < 0:
-            change_type = "decrease"
-        monthly_expenditure = self.queryset.filter(
-            date_created__year=datetime.now().year,
-            date_created__month=datetime.now().month
-            ).aggregate(Sum("amount"))
-        start_week = datetime.today() - timedelta(datetime.today().weekday())
-        end_week = start_week + timedelta(7)
-        # print(start_week, end_week)
-        weekly_expenditure = self.queryset.filter(
-            date_created__range=[start_week, end_week]
-        ).aggregate(Sum("amount"))
         return Response(
-            {
-                "total_expenditure": current_expenditure,
-                "change": str(abs(percent_change)) + "%",
-                "change_type": change_type,
-                "monthly_expenditure": monthly_expenditure["amount__sum"],
-                "weekly_expenditure": weekly_expenditure["amount__sum"]
-            },
+            ledger_metrics(
+                "expenditure",
+                period_totals(LedgerSource.Expenditure.value, current_year)
+            ),
             status=status.HTTP_200_OK
         )
 
@@ -349,14 +333,9 @@ class ExpenditureView(viewsets.ModelViewSet):
     def files(self, request, *args, **kwargs):
         """Return all expenses with files"""
         file_data = self.queryset.filter(
-            Q(invoice__isnull=False)
-            )
-        allowed_ids = []
-        for res in file_data:
-            if res.invoice:
-                allowed_ids.append(res.id)
-        n_file_data = self.queryset.filter(id__in=allowed_ids)
-        results = self.paginate_queryset(n_file_data)
+            invoice__isnull=False
+        ).exclude(invoice="").order_by("-date_created", "-id")
+        results = self.paginate_queryset(file_data)
         serialized = self.serializer_class(
             results, many=True, context={"request": request}
             )
@@ -365,8 +344,10 @@ class ExpenditureView(viewsets.ModelViewSet):
                 )
 
 
-class SalaryBandView(viewsets.ModelViewSet):
+class SalaryBandView(CachedReadMixin, viewsets.ModelViewSet):
     """API View for Salary Band"""
+    cache_namespace = "salary_bands"
+    cache_scope = "organization"
     queryset = SalaryBand.objects.all()
     serializer_class = SalaryBandSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -391,7 +372,7 @@ class PaymentDetailView(viewsets.ModelViewSet):
         )
 
 
-class PayrunView(viewsets.ModelViewSet):
+class PayrunView(StatementTimeoutMixin, viewsets.ModelViewSet):
     """API views for Payrun Details"""
     queryset = PayrollRun.objects.all().order_by("-date_created")
     serializer_class = PayrollRunSerializer
@@ -446,6 +427,36 @@ class PayrunView(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(
+            detail=False, methods=["post"],
+            url_path="preview", url_name="preview")
+    def preview(self, request, *args, **kwargs):
+        """
+        Payroll run of the active staff with the changes posted, computed
+        in memory and not saved
+        """
+        organization = request.user.organization
+        if organization is None:
+            return Response(
+                {
+                    "message": "User has no organization to run payroll for",
+                    "error_message": "Validation Error"
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = PayrollPreviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changes = serializer.validated_data
+        return Response(
+            preview_payroll(
+                payroll_snapshot(organization),
+                changes.get("ssnit_rate", organization.ssnit_rate),
+                changes.get("tier_three", organization.tier_three),
+                changes.get("salary_bands"), changes.get("bonuses")
+            ),
+            status=status.HTTP_200_OK
+        )
+
     @action(
             detail=False, methods=["get"],
             url_path="approve-by-list", url_name="approve-by-list")
@@ -464,7 +475,7 @@ class PayrunView(viewsets.ModelViewSet):
         )
 
 
-class PayrollView(viewsets.ModelViewSet):
+class PayrollView(StatementTimeoutMixin, viewsets.ModelViewSet):
     """API View for payroll"""
     queryset = Payroll.objects.filter(
     ).order_by("-date_created")
@@ -490,8 +501,8 @@ class PayrollView(viewsets.ModelViewSet):
         return super().partial_update(request, *args, **kwargs)
 
 
-class RecentTransactions(APIView):
-    """Recent transactions: combine income/expenditure"""
+class RecentTransactions(ReplicaReadMixin, APIView):
+    """Recent transactions: income, expenditure and student payments"""
     @extend_schema(responses={
         (200, 'application/json'): {
                 'description': 'Recent Transactions',
@@ -505,38 +516,261 @@ class RecentTransactions(APIView):
             },
         })
     def get(self, request):
-        recent_income = Income.objects.filter(
-            academic_term__is_active=True
-        ).order_by("-date_created")[:10].values(
-            "id", "date_created", "user", "amount", "purpose",
-            "student", "student__first_name", "student__last_name"
+        recent_ten, _ = transaction_feed(limit=10)
+        return Response(
+            {
+                "recent_transactions": recent_ten
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class TransactionFeedView(APIView):
+    """Cashbook: every transaction newest first, paged by cursor"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses={
+        (200, 'application/json'): {
+                'description': 'Transaction Feed',
+                'type': 'json',
+                'example': {
+                    "next": "http://localhost/api/finance/transactions?cursor=MjAy",
+                    "next_cursor": "MjAy",
+                    "results": [
+                        {
+                            "id": "76c722b6-d844-442f-a4a6-16711713faa5",
+                            "date_created": "2023-08-28T15:03:09.095765Z",
+                            "model_type": "Payment",
+                            "amount": "75859.00",
+                            "purpose": "School Fees",
+                            "user": "13513368-e874-4188-8b51-219b51d54945",
+                            "student": "3fa85f64-5717-4562-b3fc-2c963f66afa6",
+                            "student__first_name": "Ama",
+                            "student__last_name": "Mensah",
+                            "payment_method": "Bank"
+                        }
+                    ]
+                }
+            },
+        })
+    def get(self, request):
+        params = request.query_params
+        try:
+            page_size = min(
+                int(params.get("page_size", FEED_PAGE_SIZE)), FEED_MAX_PAGE_SIZE
+                )
+            if page_size < 1:
+                raise ValueError("page_size must be positive")
+            results, next_cursor = transaction_feed(
+                types=parse_types(params.get("type")),
+                start=parse_day(params["start"]) if params.get("start") else None,
+                end=parse_day(params["end"]) if params.get("end") else None,
+                student=params.get("student"),
+                user=params.get("user"),
+                cursor=params.get("cursor"),
+                limit=page_size
+            )
+        except (ValueError, DjangoValidationError) as e:
+            return Response(
+                {
+                    "message": "Invalid query parameters",
+                    "error_message": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
             )
-        recent_expense = Expenditure.objects.filter(
-            academic_term__is_active=True
-        ).order_by("-date_created")[:10].values(
-            "id", "date_created", 'user', "amount", "purpose"
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "cursor", next_cursor
+                )
+        return Response(
+            {
+                "next": next_url,
+                "next_cursor": next_cursor,
+                "results": results
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class AttachmentIndexView(APIView):
+    """Files attached to expenditures, incomes and organization documents"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses={
+        (200, 'application/json'): {
+                'description': 'Attachments',
+                'type': 'json',
+                'example': {
+                    "next": "http://localhost/api/finance/attachments?cursor=MjAy",
+                    "next_cursor": "MjAy",
+                    "results": [
+                        {
+                            "key": "76c722b6-d844-442f-a4a6-16711713faa5:invoice",
+                            "date_created": "2023-08-28T15:03:09.095765Z",
+                            "source": "Invoice",
+                            "owner": "76c722b6-d844-442f-a4a6-16711713faa5",
+                            "document": None,
+                            "name": "invoice.pdf",
+                            "path": "invoices/invoice.pdf",
+                            "size": 48213,
+                            "content_type": "application/pdf",
+                            "url": "https://bucket.s3.amazonaws.com/media/invoices/invoice.pdf"
+                        }
+                    ]
+                }
+            },
+        })
+    def get(self, request):
+        params = request.query_params
+        try:
+            page_size = min(
+                int(params.get("page_size", FEED_PAGE_SIZE)), FEED_MAX_PAGE_SIZE
+                )
+            if page_size < 1:
+                raise ValueError("page_size must be positive")
+            results, next_cursor = attachment_index(
+                sources=parse_sources(params.get("source")),
+                start=parse_day(params["start"]) if params.get("start") else None,
+                end=parse_day(params["end"]) if params.get("end") else None,
+                owner=params.get("owner"),
+                cursor=params.get("cursor"),
+                limit=page_size
             )
-        recent_income = recent_income.annotate(
-            model_type=Value("Income", output_field=CharField())
+        except (ValueError, DjangoValidationError) as e:
+            return Response(
+                {
+                    "message": "Invalid query parameters",
+                    "error_message": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
             )
-        recent_expense = recent_expense.annotate(
-            model_type=Value("Expenditure", output_field=CharField())
+        if params.get("urls", "true").lower() != "false":
+            results = attach_urls(results)
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "cursor", next_cursor
+                )
+        return Response(
+            {
+                "next": next_url,
+                "next_cursor": next_cursor,
+                "results": results
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class CashflowSeriesView(
+        StatementTimeoutMixin, ReplicaReadMixin, APIView):
+    """Income, expenditure and fee payments bucketed by day/week/month"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses={
+        (200, 'application/json'): {
+                'description': 'Cashflow Series',
+                'type': 'json',
+                'example': {
+                    "interval": "month",
+                    "start": "01-09-2023",
+                    "end": "31-08-2024",
+                    "series": {
+                        "Income": [
+                            {
+                                "period": "01-09-2023",
+                                "total": "75859.00",
+                                "count": 12
+                            }
+                        ]
+                    }
+                }
+            },
+        })
+    def get(self, request):
+        interval = request.query_params.get(
+            "interval", SeriesInterval.Day.value
             )
-        recent_expense = recent_expense.annotate(
-                student=Value(
-                    None, output_field=UUIDField(null=True, blank=True)
+        intervals = [item.value for item in SeriesInterval]
+        sources = [item.value for item in LedgerSource]
+        requested = request.query_params.get("sources")
+        if requested:
+            requested = [source.strip() for source in requested.split(",")]
+        else:
+            requested = sources
+        try:
+            if interval not in intervals:
+                raise ValueError(
+                    f"Invalid interval {interval}, expected one of {intervals}"
                     )
+            for source in requested:
+                if source not in sources:
+                    raise ValueError(
+                        f"Invalid source {source}, expected one of {sources}"
+                        )
+            end = timezone.localdate()
+            if request.query_params.get("end"):
+                end = parse_day(request.query_params["end"])
+            start = end - timedelta(days=365)
+            if request.query_params.get("start"):
+                start = parse_day(request.query_params["start"])
+            check_series_range(start, end, interval)
+        except ValueError as e:
+            return Response(
+                {
+                    "message": "Invalid query parameters",
+                    "error_message": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
             )
-        # print(recent_expense)
-        recent_ten = list(chain(recent_income, recent_expense))
         return Response(
             {
-                "recent_transactions": recent_ten
+                "interval": interval,
+                "start": start.strftime("%d-%m-%Y"),
+                "end": end.strftime("%d-%m-%Y"),
+                "series": {
+                    source: cashflow_series(source, start, end, interval)
+                    for source in requested
+                }
             },
             status=status.HTTP_200_OK
         )
 
 
+async def ledger_metrics_response(name: str, source: str):
+    """IncomeView/ExpenditureView metrics on the event loop"""
+    current_year = await AcademicYear.objects.aget(is_active=True)
+    return json_response(
+        ledger_metrics(name, await aperiod_totals(source, current_year))
+    )
+
+
+@async_api_view(replica=True)
+async def income_metrics_view(request):
+    """Async income metrics, routed when SERVER_MODE is asgi"""
+    return await ledger_metrics_response("income", LedgerSource.Income.value)
+
+
+@async_api_view(replica=True)
+async def expenditure_metrics_view(request):
+    """Async expenditure metrics, routed when SERVER_MODE is asgi"""
+    return await ledger_metrics_response(
+        "expenditure", LedgerSource.Expenditure.value
+    )
+
+
+@async_api_view()
+async def income_receipt_download(request, pk):
+    """Download the receipt generated for an income"""
+    receipt = await Receipt.objects.filter(income__id=pk).afirst()
+    if receipt is None:
+        return error_response(
+            "Receipt has not been generated, call the receipt endpoint first",
+            status.HTTP_400_BAD_REQUEST
+        )
+    return await file_download(receipt.file, "application/pdf")
+
+
 class HomePage(generic.ListView):
     """Home page for the finance admin"""
     model = Income
@@ -550,13 +784,40 @@ class HomePage(generic.ListView):
 
 
 def dashboardview(request):
-    """Dashboard view"""
+    """
+    Finance dashboard: aggregates of the active year and a page of the
+    latest incomes and expenditures. The figures are only computed when
+    their cached fragment of the template has expired.
+    """
     if request.user.is_authenticated:
-        income = Income.objects.all()
-        expenses = Expenditure.objects.all()
+        academic_year = AcademicYear.objects.filter(is_active=True).first()
+        incomes = CachedCountPaginator(
+            Income.objects.select_related("income_type").only(
+                "id", "date_created", "income_date", "amount", "purpose",
+                "payer", "payment_method", "income_type__name"
+            ).order_by("-date_created", "-id"),
+            DASHBOARD_PAGE_SIZE, DASHBOARD_NAMESPACE
+        )
+        expenses = CachedCountPaginator(
+            Expenditure.objects.select_related("expenditure_type").only(
+                "id", "date_created", "expense_date", "amount", "purpose",
+                "payment_method", "expenditure_type__name"
+            ).order_by("-date_created", "-id"),
+            DASHBOARD_PAGE_SIZE, DASHBOARD_NAMESPACE
+        )
         ctxt = {
-            "income": income,
-            "expenses": expenses
+            "summary": SimpleLazyObject(
+                lambda: dashboard_summary(academic_year)
+            ),
+            "income_page": incomes.get_page(request.GET.get("income_page")),
+            "expense_page": expenses.get_page(
+                request.GET.get("expense_page")
+            ),
+            # Fragments are keyed by the namespace version, and the day
+            # since the month and week totals roll over with the date
+            "cache_version": namespace_version(DASHBOARD_NAMESPACE),
+            "cache_timeout": settings.CACHE_TIMEOUT,
+            "today": timezone.localdate(),
         }
         return render(request, "finance/dashboard.html", ctxt)
     return redirect("/login?next=%s" % request.path)
@@ -0,0 +1,102 @@
+"""
+Figures of the server rendered finance dashboard. Every figure is an
+aggregate, so the page does the same work however many rows the ledger
+tables hold, and the template caches the rendered fragments in the
+"finance_dashboard" namespace (see utils.cache).
+"""
+from typing import Optional
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from core.models import AcademicYear
+from core.utils import LedgerSource, SeriesInterval
+from finance.models import Expenditure, Income
+from utils.cashflow import bucket_start, cashflow_series, period_totals
+from utils.fee_payment import ZERO
+
+DASHBOARD_NAMESPACE = "finance_dashboard"
+# Rows per page of the income and expenditure tables
+DASHBOARD_PAGE_SIZE = 20
+# Months of the income against expenditure chart, this month included
+DASHBOARD_MONTHS = 6
+# Income and expenditure types listed, largest first
+DASHBOARD_TOP_TYPES = 5
+
+
+def percent(value, largest) -> int:
+    """Width of a bar, in percent of the largest bar"""
+    if not largest:
+        return 0
+    return round(100 * value / largest)
+
+
+def monthly_totals(months: int = DASHBOARD_MONTHS) -> list[dict]:
+    """Income and expenditure of the last months, from the day summaries"""
+    today = timezone.localdate()
+    start = bucket_start(today, SeriesInterval.Month.value) - relativedelta(
+        months=months - 1
+    )
+    incomes = cashflow_series(
+        LedgerSource.Income.value, start, today, SeriesInterval.Month.value
+    )
+    expenses = cashflow_series(
+        LedgerSource.Expenditure.value, start, today,
+        SeriesInterval.Month.value
+    )
+    largest = max(
+        [row["total"] for row in incomes + expenses], default=ZERO
+    )
+    period = start
+    rows = []
+    for income, expense in zip(incomes, expenses):
+        rows.append({
+            "month": period,
+            "income": income["total"],
+            "expenditure": expense["total"],
+            "income_percent": percent(income["total"], largest),
+            "expenditure_percent": percent(expense["total"], largest),
+        })
+        period += relativedelta(months=1)
+    return rows
+
+
+def type_totals(queryset, type_field: str,
+                limit: int = DASHBOARD_TOP_TYPES) -> list[dict]:
+    """Largest totals of the queryset per type"""
+    rows = list(queryset.values(
+        name=F(f"{type_field}__name")
+    ).annotate(total=Sum("amount")).order_by("-total", "name")[:limit])
+    largest = rows[0]["total"] if rows else ZERO
+    for row in rows:
+        row["percent"] = percent(row["total"], largest)
+    return rows
+
+
+def dashboard_summary(academic_year: Optional[AcademicYear]) -> dict:
+    """Totals, monthly figures and largest types of the dashboard"""
+    summary = {
+        "academic_year": academic_year,
+        "months": monthly_totals(),
+        "income": {}, "expenditure": {},
+        "income_types": [], "expenditure_types": [],
+    }
+    if academic_year is None:
+        return summary
+    summary["income"] = period_totals(LedgerSource.Income.value, academic_year)
+    summary["expenditure"] = period_totals(
+        LedgerSource.Expenditure.value, academic_year
+    )
+    summary["net"] = (
+        (summary["income"]["year_total"] or ZERO)
+        - (summary["expenditure"]["year_total"] or ZERO)
+    )
+    summary["income_types"] = type_totals(
+        Income.objects.filter(academic_year=academic_year), "income_type"
+    )
+    summary["expenditure_types"] = type_totals(
+        Expenditure.objects.filter(academic_year=academic_year),
+        "expenditure_type"
+    )
+    return summary
@@ -0,0 +1,106 @@
+"""
+Plain Django async views for the I/O bound endpoints.
+DRF views are sync only, these run the DRF authentication and permission
+classes in a worker thread and render with the DRF JSON renderer, so the
+responses match the rest of the API.
+"""
+import posixpath
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseRedirect
+from rest_framework import permissions, status
+from rest_framework.exceptions import (
+    APIException, NotAuthenticated, PermissionDenied
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from storages.backends.s3 import S3Storage
+
+from utils.replica import reads_from, replica_for
+
+
+def json_response(data, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+    """Render data like a DRF Response would"""
+    return HttpResponse(
+        JSONRenderer().render(data), status=status_code,
+        content_type="application/json"
+    )
+
+
+def error_response(detail, status_code: int) -> HttpResponse:
+    """Error body and status as core.custom_exception would produce them"""
+    if status_code not in (
+            status.HTTP_401_UNAUTHORIZED, status.HTTP_405_METHOD_NOT_ALLOWED):
+        status_code = status.HTTP_400_BAD_REQUEST
+    return json_response(
+        {"message": detail, "error_message": "An exception occured"},
+        status_code
+    )
+
+
+def _check_access(request, permission_classes):
+    """Authenticate and authorise the request the way APIView does"""
+    drf_request = Request(request, authenticators=[
+        authenticator() for authenticator
+        in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    user = drf_request.user
+    for permission_class in permission_classes:
+        if not permission_class().has_permission(drf_request, None):
+            if not user.is_authenticated:
+                raise NotAuthenticated()
+            raise PermissionDenied()
+    return user
+
+
+def async_api_view(permission_classes=(permissions.IsAuthenticated,),
+                   replica: bool = False):
+    """
+    Decorate an async view with the API's authentication and permissions.
+    replica sends its reads to the replica, like ReplicaReadMixin.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return error_response(
+                    f'Method "{request.method}" not allowed.',
+                    status.HTTP_405_METHOD_NOT_ALLOWED
+                )
+            try:
+                request.user = await sync_to_async(_check_access)(
+                    request, permission_classes
+                )
+            except APIException as e:
+                return error_response(e.detail, e.status_code)
+            if not replica:
+                return await view(request, *args, **kwargs)
+            alias = await sync_to_async(replica_for)(request.user)
+            with reads_from(alias):
+                return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def file_download(field_file, content_type: str) -> HttpResponse:
+    """
+    Send a stored file: S3 objects are redirected to their signed URL so the
+    bytes never pass through the dyno, local files are read off the loop
+    """
+    if isinstance(field_file.storage, S3Storage):
+        url = await sync_to_async(lambda: field_file.url)()
+        return HttpResponseRedirect(url)
+
+    def read():
+        with field_file.storage.open(field_file.name, "rb") as f:
+            return f.read()
+
+    response = HttpResponse(
+        await sync_to_async(read)(), content_type=content_type
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{posixpath.basename(field_file.name)}"'
+    )
+    return response
@@ -0,0 +1,211 @@
+"""
+Index of every file attached to the ledger: expenditure invoices, documents
+linked to expenditures or incomes, and standalone organization documents.
+The sources are combined with one UNION ALL and paged with the same keyset
+cursor as the transactions feed; storage URLs are only built for the page.
+"""
+import os
+from datetime import date
+from typing import Optional
+
+from django.db.models import CharField, F, Q, UUIDField, Value
+from django.db.models.functions import Cast, Concat
+from django.db.models.query import QuerySet
+
+from core.models import OrganizationDocument
+from core.utils import AttachmentSource
+from finance.models import Expenditure, Income
+from utils.cashflow import day_bounds
+from utils.ledger import encode_cursor, keyset_filter
+
+
+# Columns of every branch of the union, in select order
+ATTACHMENT_COLUMNS = [
+    "attachment_key", "attachment_date", "attachment_source", "owner_id",
+    "document_id", "attachment_name", "attachment_path", "attachment_size",
+    "attachment_type"
+]
+
+# Names the attachment rows are returned under
+ATTACHMENT_KEYS = {
+    "attachment_key": "key",
+    "attachment_date": "date_created",
+    "attachment_source": "source",
+    "owner_id": "owner",
+    "document_id": "document",
+    "attachment_name": "name",
+    "attachment_path": "path",
+    "attachment_size": "size",
+    "attachment_type": "content_type",
+}
+
+
+def _key(*parts):
+    """Text key that is unique across the branches"""
+    return Concat(
+        *[
+            Cast(part, output_field=CharField())
+            if isinstance(part, F) else Value(part)
+            for part in parts
+        ],
+        output_field=CharField()
+    )
+
+
+def _linked_documents(through, owner_field: str, source: str) -> tuple:
+    """Documents linked to an owner through a many to many table"""
+    return through.objects.all(), {
+        "attachment_key": _key(
+            F(f"{owner_field}_id"), ":", F("organizationdocument_id")
+            ),
+        "attachment_date": F("organizationdocument__date_created"),
+        "attachment_source": Value(source, output_field=CharField()),
+        "owner_id": F(f"{owner_field}_id"),
+        "document_id": F("organizationdocument_id"),
+        "attachment_name": F("organizationdocument__name"),
+        "attachment_path": F("organizationdocument__file"),
+        "attachment_size": F("organizationdocument__file_size"),
+        "attachment_type": F("organizationdocument__content_type"),
+    }
+
+
+def _branches() -> dict:
+    """Querysets and column expressions of each attachment source"""
+    return {
+        AttachmentSource.Invoice.value: (
+            Expenditure.objects.filter(
+                invoice__isnull=False
+            ).exclude(invoice=""), {
+                "attachment_key": _key(F("id"), ":invoice"),
+                "attachment_date": F("date_created"),
+                "attachment_source": Value(
+                    AttachmentSource.Invoice.value, output_field=CharField()
+                    ),
+                "owner_id": F("id"),
+                "document_id": Value(None, output_field=UUIDField()),
+                "attachment_name": Value(None, output_field=CharField()),
+                "attachment_path": F("invoice"),
+                "attachment_size": F("invoice_size"),
+                "attachment_type": F("invoice_content_type"),
+            }
+        ),
+        AttachmentSource.Expenditure.value: _linked_documents(
+            Expenditure.uploaded_file.through, "expenditure",
+            AttachmentSource.Expenditure.value
+        ),
+        AttachmentSource.Income.value: _linked_documents(
+            Income.uploaded_file.through, "income",
+            AttachmentSource.Income.value
+        ),
+        AttachmentSource.Document.value: (
+            OrganizationDocument.objects.filter(
+                expenditure__isnull=True, income__isnull=True
+            ), {
+                "attachment_key": _key(F("id"), ":document"),
+                "attachment_date": F("date_created"),
+                "attachment_source": Value(
+                    AttachmentSource.Document.value, output_field=CharField()
+                    ),
+                "owner_id": Value(None, output_field=UUIDField()),
+                "document_id": F("id"),
+                "attachment_name": F("name"),
+                "attachment_path": F("file"),
+                "attachment_size": F("file_size"),
+                "attachment_type": F("content_type"),
+            }
+        ),
+    }
+
+
+def attachment_index(
+        sources: Optional[list[str]] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        owner=None,
+        cursor: Optional[str] = None,
+        limit: int = 20) -> tuple[list[dict], Optional[str]]:
+    """
+    One page of attachments, newest first
+
+    Args:
+        sources: AttachmentSource values to include, all when empty
+        start: First upload day to include (inclusive)
+        end: Last upload day to include (inclusive)
+        owner: Only files of this expenditure or income
+        cursor: Value of the previous page's next cursor
+        limit: Page size
+    Returns:
+        The page rows and the cursor of the next page (None on the last)
+    """
+    conditions = keyset_filter(cursor, "attachment_date", "attachment_key")
+    if start:
+        conditions &= Q(attachment_date__gte=day_bounds(start, start)[0])
+    if end:
+        conditions &= Q(attachment_date__lt=day_bounds(end, end)[1])
+
+    queries = []
+    for source, (queryset, columns) in _branches().items():
+        if sources and source not in sources:
+            continue
+        branch_conditions = conditions
+        if owner:
+            if source == AttachmentSource.Document.value:
+                continue
+            branch_conditions &= Q(owner_id=owner)
+        queries.append(
+            queryset.annotate(**columns).filter(
+                branch_conditions
+            ).values(*ATTACHMENT_COLUMNS).order_by(
+                "-attachment_date", "-attachment_key"
+            )[:limit + 1]
+        )
+    if not queries:
+        return [], None
+
+    index: QuerySet = queries[0]
+    if len(queries) > 1:
+        index = queries[0].union(*queries[1:], all=True).order_by(
+            "-attachment_date", "-attachment_key"
+        )
+    rows = list(index[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(
+            rows[-1]["attachment_date"], rows[-1]["attachment_key"]
+            )
+    results = []
+    for row in rows:
+        result = {
+            ATTACHMENT_KEYS[column]: row[column]
+            for column in ATTACHMENT_COLUMNS
+        }
+        if not result["name"]:
+            result["name"] = os.path.basename(result["path"])
+        results.append(result)
+    return results, next_cursor
+
+
+def attach_urls(rows: list[dict]) -> list[dict]:
+    """Add storage URLs to a page of attachments, one per distinct path"""
+    storage = OrganizationDocument._meta.get_field("file").storage
+    urls = {}
+    for row in rows:
+        if row["path"] not in urls:
+            urls[row["path"]] = storage.url(row["path"])
+        row["url"] = urls[row["path"]]
+    return rows
+
+
+def parse_sources(value: Optional[str]) -> list[str]:
+    """Comma separated attachment sources, raises ValueError if unknown"""
+    if not value:
+        return []
+    allowed = [item.value for item in AttachmentSource]
+    sources = [source.strip() for source in value.split(",")]
+    for source in sources:
+        if source not in allowed:
+            raise ValueError(
+                f"Invalid source {source}, expected one of {allowed}"
+                )
+    return sources
@@ -1,13 +1,21 @@
 """
 Connecting to AWS Services
-Initial intention is to retrieve secrets from the Secret Manager
+Retrieves secrets from the Secret Manager for utils.secret_store, nothing
+runs at import time
 """
 import base64
-import boto3
-from botocore.exceptions import ClientError
+import logging
+
+
+logger = logging.getLogger(__name__)
 
 
 def get_secret(secret_name, region_name="us-east-1"):
+    """Value of a Secrets Manager secret, None when it cannot be read"""
+    # boto3 is slow to import, only pay for it when a secret is fetched
+    import boto3
+    from botocore.exceptions import ClientError
+
     # Create a Secrets Manager client
     session = boto3.session.Session()
     client = session.client(
@@ -30,19 +38,13 @@ def get_secret(secret_name, region_name="us-east-1"):
 
     except ClientError as e:
         if e.response["Error"]["Code"] == "ResourceNotFoundException":
-            print(f"The secret with name '{secret_name}' was not found.")
+            logger.warning(f"The secret with name '{secret_name}' was not found.")
         elif e.response["Error"]["Code"] == "InvalidRequestException":
-            print(f"Invalid request for the secret '{secret_name}'.")
+            logger.warning(f"Invalid request for the secret '{secret_name}'.")
         elif e.response["Error"]["Code"] == "InvalidParameterException":
-            print(f"Invalid parameter for the secret '{secret_name}'.")
+            logger.warning(f"Invalid parameter for the secret '{secret_name}'.")
         else:
-            print(f"Error retrieving the secret '{secret_name}': {str(e)}")
-
-
-secret_name = "your-secret-name"
-
-# Call the function to retrieve the secret
-secret_value = get_secret(secret_name)
-
-# Use the retrieved secret value in your application
-print(f"The secret value is: {secret_value}")
+            logger.warning(
+                f"Error retrieving the secret '{secret_name}': {str(e)}"
+            )
+        return None
@@ -0,0 +1,246 @@
+"""
+Cache-aside helpers for the reference data read on almost every screen.
+Every namespace has a version number stored in the cache and embedded in
+its keys. Saving or deleting any model of a namespace bumps the version, so
+stale entries are never read again and simply expire.
+Queryset .update() and bulk_create send no signals, call bump_namespace
+after using them on these models.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from rest_framework import status
+
+
+# Models whose changes make the cached data of a namespace stale
+CACHE_NAMESPACES = {
+    # The config also returns the active academic year and term
+    "organization_config": [
+        "core.OrganizationConfig", "core.AcademicYear", "core.AcademicTerm"
+    ],
+    "classes": ["core.Class", "core.AcademicYear", "core.AcademicTerm"],
+    "subjects": ["core.Subject"],
+    "fee_groups": [
+        "core.StudentFeeGroup", "core.Fee", "core.AcademicYear",
+        "core.AcademicTerm"
+    ],
+    "salary_bands": ["finance.SalaryBand"],
+    "tax_config": ["finance.TaxConfig"],
+    # Staff and salary bands of the payroll previews. Users are saved on
+    # every login, finance.signals bumps it only when a name changes
+    "payroll": [
+        "finance.SalaryBand", "finance.PaymentDetail", "core.Staff"
+    ],
+    # Entries per student, also dropped one by one by forget() when the
+    # student's payments, arrears, class or guardians change
+    "student_profiles": [
+        "core.Fee", "core.StudentFeeGroup", "core.Class",
+        "core.AcademicYear", "core.AcademicTerm"
+    ],
+    # Fragments and row counts of the finance admin dashboard
+    "finance_dashboard": [
+        "finance.Income", "finance.Expenditure", "finance.IncomeType",
+        "finance.ExpenditureType", "core.AcademicYear", "core.AcademicTerm"
+    ],
+}
+
+
+class CacheStats:
+    """Hit and miss counters per namespace of this worker process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.hits = defaultdict(int)
+            self.misses = defaultdict(int)
+
+    def record(self, namespace: str, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits[namespace] += 1
+            else:
+                self.misses[namespace] += 1
+
+    def report(self) -> dict:
+        with self.lock:
+            hits, misses = dict(self.hits), dict(self.misses)
+        namespaces = []
+        for namespace in CACHE_NAMESPACES:
+            total = hits.get(namespace, 0) + misses.get(namespace, 0)
+            namespaces.append({
+                "namespace": namespace,
+                "version": namespace_version(namespace),
+                "hits": hits.get(namespace, 0),
+                "misses": misses.get(namespace, 0),
+                "hit_ratio": round(hits.get(namespace, 0) / total, 3)
+                if total else None,
+            })
+        return {
+            "process": os.getpid(),
+            "backend": settings.CACHES["default"]["BACKEND"],
+            "namespaces": namespaces,
+        }
+
+
+cache_stats = CacheStats()
+
+
+def _version_key(namespace: str) -> str:
+    return f"version:{namespace}"
+
+
+def namespace_version(namespace: str) -> int:
+    """Current version of a namespace, starting one if it was evicted"""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Never restart from a number an evicted version may have used
+        cache.add(_version_key(namespace), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def bump_namespace(namespace: str):
+    """Make every cached entry of the namespace stale"""
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.set(_version_key(namespace), time.time_ns(), timeout=None)
+
+
+def cache_key(namespace: str, *parts) -> str:
+    """Versioned key of a namespace entry"""
+    digest = hashlib.md5(
+        "|".join(str(part) for part in parts).encode(),
+        usedforsecurity=False
+    ).hexdigest()
+    return f"{namespace}:{namespace_version(namespace)}:{digest}"
+
+
+def get_or_set(namespace: str, parts: tuple, producer: Callable):
+    """
+    Cache-aside read of a namespace entry
+
+    Args:
+        namespace: One of the CACHE_NAMESPACES keys
+        parts: Values identifying the entry within the namespace
+        producer: Called to build the value on a miss
+    """
+    key = cache_key(namespace, *parts)
+    value = cache.get(key)
+    cache_stats.record(namespace, value is not None)
+    if value is None:
+        value = producer()
+        cache.set(key, value, timeout=settings.CACHE_TIMEOUT)
+    return value
+
+
+def forget(namespace: str, *parts, after_commit: bool = True):
+    """Drop one entry of a namespace, now and once the change commits"""
+    key = cache_key(namespace, *parts)
+    cache.delete(key)
+    if after_commit:
+        # A read between the change and the commit may cache the old rows
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedReadMixin:
+    """
+    Serve list and retrieve of a viewset from the cache.
+    Views whose queryset depends on the user set cache_scope to
+    "organization" or "user" so entries are never shared across them.
+    """
+    cache_namespace = None
+    cache_scope = None
+
+    def cache_parts(self, request) -> tuple:
+        if self.cache_scope == "organization":
+            scope = request.user.organization_id
+        elif self.cache_scope == "user":
+            scope = request.user.pk
+        else:
+            scope = None
+        return (
+            self.__class__.__name__, self.action, scope,
+            request.get_full_path()
+        )
+
+    def cached_response(self, request, read: Callable):
+        # Imported here, the signal handlers of this module are connected
+        # at startup and DRF's serializers are slow to import
+        from rest_framework.response import Response
+
+        key = cache_key(self.cache_namespace, *self.cache_parts(request))
+        data = cache.get(key)
+        cache_stats.record(self.cache_namespace, data is not None)
+        if data is None:
+            response = read()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, timeout=settings.CACHE_TIMEOUT)
+        return Response(data, status=status.HTTP_200_OK)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedReadMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedReadMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+
+MODEL_NAMESPACES = defaultdict(list)
+
+
+def _invalidate(sender, **kwargs):
+    action = kwargs.get("action")
+    if action is not None and not action.startswith("post_"):
+        return
+    for namespace in MODEL_NAMESPACES.get(sender._meta.label, []):
+        bump_namespace(namespace)
+        # A read between the signal and the commit may cache the old rows
+        transaction.on_commit(
+            lambda namespace=namespace: bump_namespace(namespace)
+        )
+
+
+def connect_invalidation():
+    """Bump namespaces on save, delete and m2m changes of their models"""
+    for namespace, labels in CACHE_NAMESPACES.items():
+        for label in labels:
+            model = apps.get_model(label)
+            if namespace not in MODEL_NAMESPACES[label]:
+                MODEL_NAMESPACES[label].append(namespace)
+            post_save.connect(
+                _invalidate, sender=model, dispatch_uid=f"cache-save-{label}"
+            )
+            post_delete.connect(
+                _invalidate, sender=model,
+                dispatch_uid=f"cache-delete-{label}"
+            )
+            for field in model._meta.many_to_many:
+                through = field.remote_field.through
+                if namespace not in MODEL_NAMESPACES[through._meta.label]:
+                    MODEL_NAMESPACES[through._meta.label].append(namespace)
+                m2m_changed.connect(
+                    _invalidate, sender=through,
+                    dispatch_uid=f"cache-m2m-{through._meta.label}"
+                )
@@ -0,0 +1,227 @@
+"""
+Time bucketed cashflow figures for income, expenditure and fee payments.
+Closed days are read from the LedgerDaySummary table, open days are
+grouped straight from the ledger tables.
+"""
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import (
+    Count, DateField, Max, Q, Sum
+)
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from core.models import Payment
+from core.utils import LedgerSource, SeriesInterval
+from finance.models import Income, Expenditure, LedgerDaySummary
+
+
+LEDGER_MODELS = {
+    LedgerSource.Income.value: Income,
+    LedgerSource.Expenditure.value: Expenditure,
+    LedgerSource.Payment.value: Payment,
+}
+
+# Longest series served per interval: a year of days, ten years of weeks
+# and twenty years of months
+MAX_BUCKETS = {
+    SeriesInterval.Day.value: 366,
+    SeriesInterval.Week.value: 520,
+    SeriesInterval.Month.value: 240,
+}
+
+
+def day_bounds(start: date, end: date) -> tuple[datetime, datetime]:
+    """Aware datetimes covering the whole days from start to end"""
+    lower = timezone.make_aware(datetime.combine(start, time.min))
+    upper = timezone.make_aware(
+        datetime.combine(end + timedelta(days=1), time.min)
+        )
+    return lower, upper
+
+
+def parse_day(value: str) -> date:
+    """Parse a date from the query params, dd-mm-YYYY or ISO"""
+    for date_format in ("%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date {value}, expected dd-mm-YYYY")
+
+
+def bucket_start(day: date, interval: str) -> date:
+    """First day of the bucket the day falls into"""
+    if interval == SeriesInterval.Week.value:
+        return day - timedelta(days=day.weekday())
+    if interval == SeriesInterval.Month.value:
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day: date, interval: str) -> date:
+    """First day of the bucket after the given bucket"""
+    if interval == SeriesInterval.Week.value:
+        return day + timedelta(days=7)
+    if interval == SeriesInterval.Month.value:
+        return day + relativedelta(months=1)
+    return day + timedelta(days=1)
+
+
+def bucket_count(start: date, end: date, interval: str) -> int:
+    """Number of buckets in the series from start to end"""
+    first, last = bucket_start(start, interval), bucket_start(end, interval)
+    if interval == SeriesInterval.Week.value:
+        return (last - first).days // 7 + 1
+    if interval == SeriesInterval.Month.value:
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days + 1
+
+
+def check_series_range(start: date, end: date, interval: str) -> None:
+    """Raise ValueError when the series would exceed MAX_BUCKETS"""
+    if start > end:
+        raise ValueError("start must be on or before end")
+    if bucket_count(start, end, interval) > MAX_BUCKETS[interval]:
+        raise ValueError(
+            f"At most {MAX_BUCKETS[interval]} {interval} buckets per "
+            "request, narrow the range or use a longer interval"
+            )
+
+
+def summarised_until(source: str) -> Optional[date]:
+    """Last day of the source that has been rolled up"""
+    return LedgerDaySummary.objects.filter(
+        source=source
+    ).aggregate(Max("day"))["day__max"]
+
+
+def cashflow_series(
+        source: str, start: date, end: date,
+        interval: str = SeriesInterval.Day.value) -> list[dict]:
+    """
+    Totals and entry counts of a ledger source per bucket
+
+    Args:
+        source: One of the LedgerSource values
+        start: First day of the series (inclusive)
+        end: Last day of the series (inclusive)
+        interval: day, week or month buckets
+    """
+    check_series_range(start, end, interval)
+    buckets = OrderedDict()
+    period = bucket_start(start, interval)
+    while period <= end:
+        buckets[period] = {"total": Decimal(0), "count": 0}
+        period = next_bucket(period, interval)
+
+    live_start = start
+    closed_until = summarised_until(source)
+    if closed_until is not None and closed_until >= start:
+        summary_rows = LedgerDaySummary.objects.filter(
+            source=source, day__range=(start, min(closed_until, end))
+        ).annotate(
+            period=Trunc("day", interval, output_field=DateField())
+        ).values("period").annotate(
+            total=Sum("total_amount"), count=Sum("entry_count")
+        ).order_by()
+        for row in summary_rows:
+            buckets[row["period"]]["total"] += row["total"]
+            buckets[row["period"]]["count"] += row["count"]
+        live_start = closed_until + timedelta(days=1)
+
+    if live_start <= end:
+        lower, upper = day_bounds(live_start, end)
+        live_rows = LEDGER_MODELS[source].objects.filter(
+            date_created__gte=lower, date_created__lt=upper
+        ).annotate(
+            period=Trunc("date_created", interval, output_field=DateField())
+        ).values("period").annotate(
+            total=Sum("amount"), count=Count("id")
+        ).order_by()
+        for row in live_rows:
+            buckets[row["period"]]["total"] += row["total"]
+            buckets[row["period"]]["count"] += row["count"]
+
+    return [
+        {
+            "period": period.strftime("%d-%m-%Y"),
+            "total": values["total"],
+            "count": values["count"]
+        }
+        for period, values in buckets.items()
+    ]
+
+
+def _period_aggregates(academic_year) -> dict:
+    """Sum expressions behind period_totals"""
+    today = timezone.localdate()
+    month_lower, _ = day_bounds(bucket_start(today, "month"), today)
+    week_lower, week_upper = day_bounds(
+        bucket_start(today, "week"),
+        bucket_start(today, "week") + timedelta(days=6)
+    )
+    return {
+        "year_total": Sum("amount", filter=Q(academic_year=academic_year)),
+        "previous_total": Sum(
+            "amount", filter=Q(academic_year_id=academic_year.previous_id)
+            ),
+        "month_total": Sum("amount", filter=Q(date_created__gte=month_lower)),
+        "week_total": Sum(
+            "amount",
+            filter=Q(date_created__gte=week_lower, date_created__lt=week_upper)
+            ),
+    }
+
+
+def period_totals(source: str, academic_year) -> dict:
+    """
+    Totals used by the metrics endpoints in a single aggregate query:
+    current academic year, previous academic year, this month and this week
+    """
+    return LEDGER_MODELS[source].objects.aggregate(
+        **_period_aggregates(academic_year)
+    )
+
+
+async def aperiod_totals(source: str, academic_year) -> dict:
+    """Async version of period_totals"""
+    return await LEDGER_MODELS[source].objects.aaggregate(
+        **_period_aggregates(academic_year)
+    )
+
+
+def summarise_days(source: str, start: date, end: date) -> int:
+    """Write the LedgerDaySummary rows of a source from start to end"""
+    lower, upper = day_bounds(start, end)
+    rows = LEDGER_MODELS[source].objects.filter(
+        date_created__gte=lower, date_created__lt=upper
+    ).annotate(
+        day=Trunc("date_created", "day", output_field=DateField())
+    ).values("day").annotate(
+        total=Sum("amount"), count=Count("id")
+    ).order_by()
+    summaries = [
+        LedgerDaySummary(
+            source=source, day=row["day"],
+            total_amount=row["total"], entry_count=row["count"]
+        )
+        for row in rows
+    ]
+    if end not in [row.day for row in summaries]:
+        # Keep a row for the last day so quiet days still move the cutoff
+        summaries.append(LedgerDaySummary(source=source, day=end))
+    LedgerDaySummary.objects.filter(
+        source=source, day__range=(start, end)
+    ).exclude(day__in=[row.day for row in summaries]).delete()
+    LedgerDaySummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=["source", "day"],
+        update_fields=["total_amount", "entry_count", "last_modified"]
+    )
+    return len(summaries)
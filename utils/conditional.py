@@ -0,0 +1,119 @@
+"""
+Conditional GET support for polled endpoints.
+The ETag is a digest of the newest timestamp and the row count of every
+queryset behind a response, so a poll that changed nothing is answered with
+a 304 before anything is serialized.
+"""
+import hashlib
+from typing import Callable, Optional
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+
+def change_state(sources: list) -> tuple[list, Optional[object]]:
+    """
+    Newest timestamps and row counts of querysets
+
+    Args:
+        sources: (queryset, timestamp fields) pairs
+    Returns:
+        One string per source and the newest timestamp of all of them
+    """
+    parts, newest = [], None
+    for queryset, fields in sources:
+        row = queryset.order_by().aggregate(
+            count=Count("pk"),
+            **{f"max_{index}": Max(field) for index, field in enumerate(fields)}
+        )
+        parts.append("|".join(str(value) for value in row.values()))
+        for index in range(len(fields)):
+            value = row[f"max_{index}"]
+            if value is not None and (newest is None or value > newest):
+                newest = value
+    return parts, newest
+
+
+def conditional_etag(
+        request, name: str, sources: list, salt: list) -> tuple[str, object]:
+    """ETag of a response and the newest timestamp behind it"""
+    parts, newest = change_state(sources)
+    digest = hashlib.sha1(
+        "\n".join([
+            name, request.get_full_path(), str(request.user.pk),
+            *map(str, salt), *parts
+        ]).encode(),
+        usedforsecurity=False
+    ).hexdigest()
+    return quote_etag(digest), newest
+
+
+def not_modified(request, etag: str):
+    """A 304 when If-None-Match matches the ETag, otherwise None"""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response["ETag"] = etag
+    return response
+
+
+def with_validators(response, etag: str, newest):
+    """Add ETag and Last-Modified to a successful response"""
+    if response.status_code == status.HTTP_200_OK:
+        response["ETag"] = etag
+        if newest is not None:
+            response["Last-Modified"] = http_date(newest.timestamp())
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer list and retrieve with a 304 when If-None-Match matches.
+    Last-Modified is sent for caches but If-Modified-Since alone is not
+    trusted, the newest timestamp does not move when a row is deleted.
+    """
+    conditional_fields = ["last_modified"]
+
+    def conditional_sources(self, request) -> list:
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            queryset = queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        return [(queryset, self.conditional_fields)]
+
+    def conditional_salt(self, request) -> list:
+        """Anything else the response depends on"""
+        return []
+
+    def conditional_response(self, request, read: Callable):
+        try:
+            etag, newest = conditional_etag(
+                request, self.__class__.__name__,
+                self.conditional_sources(request),
+                self.conditional_salt(request)
+            )
+        except (TypeError, ValueError, DjangoValidationError):
+            # Malformed lookups get their usual error from the view
+            return read()
+        response = not_modified(request, etag)
+        if response is None:
+            response = with_validators(read(), etag, newest)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
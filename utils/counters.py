@@ -0,0 +1,70 @@
+"""
+Gap tolerant, collision free numbering from the Counter table. A number is
+reserved with one upsert that adds to the counter row and returns the new
+value, so concurrent reservations queue on the row instead of colliding.
+
+Outside a transaction every worker reserves COUNTER_BLOCK_SIZE numbers at a
+time and hands them out from memory, so a busy counter costs one round trip
+per block. Inside a transaction the numbers are reserved as needed: they
+roll back with it and leave no gap, and the row stays locked until the
+transaction ends.
+"""
+import threading
+from typing import Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connections
+
+from core.models import Counter
+
+
+def reserve(name: str, count: int = 1, using: str = "default") -> range:
+    """Reserve the next count numbers of a counter, starting at 1"""
+    if count < 1:
+        raise ValueError("At least one number must be reserved")
+    table = Counter._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (id, date_created, last_modified, name, value)
+            VALUES (%s, now(), now(), %s, %s)
+            ON CONFLICT (name) DO UPDATE
+            SET value = {table}.value + EXCLUDED.value,
+                last_modified = EXCLUDED.last_modified
+            RETURNING value
+            """,
+            [uuid4(), name, count]
+        )
+        last = cursor.fetchone()[0]
+    return range(last - count + 1, last + 1)
+
+
+class BlockAllocator:
+    """Numbers of the counters reserved by this worker and not used yet"""
+
+    def __init__(self, block_size: Optional[int] = None,
+                 using: str = "default"):
+        self.block_size = block_size
+        self.using = using
+        self.lock = threading.Lock()
+        self.blocks = {}
+
+    def take(self, name: str, count: int = 1) -> list[int]:
+        """The next count numbers of a counter, ascending"""
+        if connections[self.using].in_atomic_block:
+            # A block reserved here would be rolled back with the caller
+            # while this worker still handed its numbers out
+            return list(reserve(name, count, self.using))
+        block_size = self.block_size or settings.COUNTER_BLOCK_SIZE
+        with self.lock:
+            block = self.blocks.get(name, [])
+            if len(block) < count:
+                block += list(reserve(
+                    name, max(count - len(block), block_size), self.using
+                ))
+            numbers, self.blocks[name] = block[:count], block[count:]
+        return numbers
+
+
+allocator = BlockAllocator()
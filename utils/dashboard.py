@@ -0,0 +1,230 @@
+"""
+Figures of the dashboard. dashboard_metrics runs the queries with the sync
+ORM for DashboardView under WSGI, adashboard_metrics runs the same queries
+with the async ORM so the ASGI view does not hold a worker thread. Both
+hand the results to metrics_payload.
+"""
+from asgiref.sync import sync_to_async
+
+from django.utils import timezone
+
+from core.models import (
+    AcademicYear, Class, DatabaseActionLog, Payment, Staff, Student,
+    StudentClass
+)
+from core.serializers import DatabaseActionSerializer
+from core.utils import LedgerSource, StaffType
+from curriculum.serializers import ClassSerializer, PaymentSerializer
+from finance.models import Expenditure, Income
+from finance.serializers import ExpenditureSerializer, IncomeSerializer
+from user.serializers import UserSerializer
+from utils.cashflow import aperiod_totals, period_totals
+
+
+def percent_change(current, previous) -> tuple[float, str]:
+    """Change against the previous period and its direction"""
+    change = 100
+    if previous is not None and previous > 0:
+        change = ((current or 0) - previous) / previous
+    return change, "decrease" if change < 0 else "increase"
+
+
+async def serialize(serializer_class, instance, many: bool = True):
+    """Serializer data, related rows are loaded off the event loop"""
+    return await sync_to_async(
+        lambda: serializer_class(instance=instance, many=many).data
+    )()
+
+
+def dashboard_sources() -> list:
+    """Querysets whose changes move the dashboard ETag"""
+    return [
+        (AcademicYear.objects.all(), ["last_modified"]),
+        (Payment.objects.all(), ["last_modified"]),
+        (Income.objects.all(), ["last_modified"]),
+        (Expenditure.objects.all(), ["last_modified"]),
+        (StudentClass.objects.all(), ["last_modified"]),
+        (Student.objects.all(), ["last_modified"]),
+        (Staff.objects.all(), ["last_modified"]),
+        (Class.objects.all(), ["last_modified"]),
+        (DatabaseActionLog.objects.all(), ["timestamp"]),
+    ]
+
+
+def dashboard_salt(user_data: dict) -> list:
+    """
+    Month and week totals roll over with the date, and the user has no
+    last_modified of its own
+    """
+    return [timezone.localdate(), user_data]
+
+
+def active_students(current_year):
+    """Students of the active year, one row per student class"""
+    return StudentClass.objects.filter(
+        academic_year=current_year, student__is_active=True,
+    ).values_list("student")
+
+
+def recent_rows() -> dict:
+    """Querysets of the recent activity, classes and transactions"""
+    return {
+        "recent_activity": DatabaseActionLog.objects.order_by(
+            "-timestamp"
+        )[:5],
+        "classes": Class.objects.all(),
+        "income": Income.objects.filter(
+            academic_year__is_active=True
+        ).order_by("-date_created")[:5],
+        "expenditure": Expenditure.objects.filter(
+            academic_year__is_active=True
+        ).order_by("-date_created")[:5],
+        "payment": Payment.objects.filter(
+            academic_year__is_active=True
+        ).order_by("-date_created")[:5],
+    }
+
+
+SERIALIZERS = {
+    "recent_activity": DatabaseActionSerializer,
+    "classes": ClassSerializer,
+    "income": IncomeSerializer,
+    "expenditure": ExpenditureSerializer,
+    "payment": PaymentSerializer,
+}
+
+
+def metrics_payload(totals: dict, counts: dict, data: dict) -> dict:
+    """
+    Dashboard payload from the fetched figures
+
+    Args:
+        totals: period_totals of every LedgerSource
+        counts: student and staff counts
+        data: serialized user and recent_rows
+    """
+    payment_totals = totals[LedgerSource.Payment.value]
+    income_totals = totals[LedgerSource.Income.value]
+    expense_totals = totals[LedgerSource.Expenditure.value]
+    student_percent_change, student_change_type = percent_change(
+        counts["students"], counts["previous_students"]
+    )
+    # Transaction summary
+    current_payment = payment_totals["year_total"]
+    total_expenditure = expense_totals["year_total"] or 0
+    total_income = income_totals["year_total"] or 0
+    payment_percent_change, payment_change_type = percent_change(
+        current_payment, payment_totals["previous_total"]
+    )
+    income_percent_change, income_change_type = percent_change(
+        total_income, income_totals["previous_total"]
+    )
+    expense_percent_change, expense_change_type = percent_change(
+        total_expenditure, expense_totals["previous_total"]
+    )
+    return {
+        "user": data["user"],
+        "students": {
+            "total": counts["students"],
+            "male": counts["male"],
+            "female": counts["female"],
+            "change": str(abs(student_percent_change)) + "%",
+            "change_type": student_change_type
+        },
+        "teachers": {
+            "total_teachers": counts["teachers"],
+            "total_non_teaching_staff": counts["non_teaching"],
+        },
+        "transactions": {
+            "total_expenditure": total_expenditure,
+            "expense_percent_change": str(abs(expense_percent_change)) + "%",
+            "expense_change_type": expense_change_type,
+            "monthly_expenditure": expense_totals["month_total"],
+            "weekly_expenditure": expense_totals["week_total"],
+            "total_income": total_income,
+            "income_percent_change": str(abs(income_percent_change)) + "%",
+            "income_change_type": income_change_type,
+            "monthly_income": income_totals["month_total"],
+            "weekly_income": income_totals["week_total"],
+            "total_payment": current_payment,
+            "change": str(abs(payment_percent_change)) + "%",
+            "change_type": payment_change_type,
+            "monthly_payment": payment_totals["month_total"],
+            "weekly_payment": payment_totals["week_total"]
+        },
+        "classes": data["classes"],
+        "recent_activity": data["recent_activity"],
+        "recent_transactions": {
+            "income": data["income"],
+            "expenditure": data["expenditure"],
+            "payment": data["payment"],
+        }
+    }
+
+
+def dashboard_metrics(user) -> dict:
+    """Data for the initial dashboard of a user"""
+    current_year = AcademicYear.objects.get(is_active=True)
+    totals = {
+        source.value: period_totals(source.value, current_year)
+        for source in LedgerSource
+    }
+    previous_students = 0
+    if current_year.previous_id:
+        previous_students = StudentClass.objects.filter(
+            academic_year_id=current_year.previous_id
+        ).values_list("student").count()
+    students = active_students(current_year)
+    staff = Staff.objects.filter(is_active=True)
+    counts = {
+        "previous_students": previous_students,
+        "students": students.count(),
+        "male": students.filter(student__gender="Male").count(),
+        "female": students.filter(student__gender="Female").count(),
+        "teachers": staff.filter(staff_type=StaffType.Teaching).count(),
+        "non_teaching": staff.filter(
+            staff_type=StaffType.Non_Teaching
+        ).count(),
+    }
+    data = {
+        name: SERIALIZERS[name](instance=rows, many=True).data
+        for name, rows in recent_rows().items()
+    }
+    data["user"] = UserSerializer(instance=user).data
+    return metrics_payload(totals, counts, data)
+
+
+async def adashboard_metrics(user) -> dict:
+    """Async version of dashboard_metrics"""
+    current_year = await AcademicYear.objects.aget(is_active=True)
+    totals = {
+        source.value: await aperiod_totals(source.value, current_year)
+        for source in LedgerSource
+    }
+    previous_students = 0
+    if current_year.previous_id:
+        previous_students = await StudentClass.objects.filter(
+            academic_year_id=current_year.previous_id
+        ).values_list("student").acount()
+    students = active_students(current_year)
+    staff = Staff.objects.filter(is_active=True)
+    counts = {
+        "previous_students": previous_students,
+        "students": await students.acount(),
+        "male": await students.filter(student__gender="Male").acount(),
+        "female": await students.filter(student__gender="Female").acount(),
+        "teachers": await staff.filter(
+            staff_type=StaffType.Teaching
+        ).acount(),
+        "non_teaching": await staff.filter(
+            staff_type=StaffType.Non_Teaching
+        ).acount(),
+    }
+    data = {}
+    for name, rows in recent_rows().items():
+        # Evaluate on the loop, related rows are loaded in serialize
+        data[name] = await serialize(
+            SERIALIZERS[name], [row async for row in rows]
+        )
+    data["user"] = await serialize(UserSerializer, user, many=False)
+    return metrics_payload(totals, counts, data)
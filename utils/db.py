@@ -0,0 +1,143 @@
+"""
+Statement timeouts and pool statistics of the Postgres connections.
+Every connection starts with the short DB_STATEMENT_TIMEOUT of the
+settings, so a slow interactive query is cancelled instead of holding a
+pooled connection. Payroll and report endpoints raise it for the length of
+the request with StatementTimeoutMixin.
+Also holds copy_rows, the COPY based insert of the bulk seeding.
+"""
+import os
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+
+from config.routers import read_alias
+
+
+def set_statement_timeout(milliseconds: Optional[int],
+                          using: str = DEFAULT_DB_ALIAS):
+    """
+    Set the statement timeout of the current connection, None goes back to
+    the default of the connection
+    """
+    with connections[using].cursor() as cursor:
+        if milliseconds is None:
+            cursor.execute("RESET statement_timeout")
+        else:
+            # SET takes no bind parameters
+            cursor.execute(
+                "SELECT set_config('statement_timeout', %s, false)",
+                [str(int(milliseconds))]
+            )
+
+
+def reset_statement_timeout(using: str = DEFAULT_DB_ALIAS):
+    """Go back to the default timeout before the connection is reused"""
+    if connections[using].connection is None:
+        return
+    try:
+        set_statement_timeout(None, using)
+    except DatabaseError:
+        # A failed transaction: the timeout was set inside it, so its
+        # rollback restores the default
+        pass
+
+
+@contextmanager
+def statement_timeout(milliseconds: int, using: str = DEFAULT_DB_ALIAS):
+    """Run a block with another statement timeout"""
+    set_statement_timeout(milliseconds, using)
+    try:
+        yield
+    finally:
+        reset_statement_timeout(using)
+
+
+class StatementTimeoutMixin:
+    """
+    Run every action of a view with the long statement timeout.
+    Set on the connection the request reads from, the replica when
+    ReplicaReadMixin routed it there (list this mixin before it), once the
+    user is authenticated, and reset when the request ends, failed or not,
+    before the connection goes back to the pool.
+    """
+    statement_timeout = None
+
+    def get_statement_timeout(self) -> int:
+        if self.statement_timeout is None:
+            return settings.DB_LONG_STATEMENT_TIMEOUT
+        return self.statement_timeout
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = read_alias.get() or DEFAULT_DB_ALIAS
+        set_statement_timeout(self.get_statement_timeout(), alias)
+        self._statement_timeout_alias = alias
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Also after an exception DRF re-raises, the pool does not
+            # reset the connection
+            alias = getattr(self, "_statement_timeout_alias", None)
+            if alias is not None:
+                self._statement_timeout_alias = None
+                reset_statement_timeout(alias)
+
+
+def pool_stats(using: str = DEFAULT_DB_ALIAS) -> dict:
+    """Pool configuration and counters of this worker process"""
+    connection = connections[using]
+    pool = getattr(connection, "pool", None)
+    report = {
+        "process": os.getpid(),
+        "pooled": pool is not None,
+        "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+        "statement_timeout_ms": settings.DB_STATEMENT_TIMEOUT,
+        "long_statement_timeout_ms": settings.DB_LONG_STATEMENT_TIMEOUT,
+    }
+    if pool is not None:
+        report.update({
+            "min_size": pool.min_size,
+            "max_size": pool.max_size,
+            "stats": pool.get_stats(),
+        })
+    return report
+
+
+def copy_rows(model, rows: Iterable[dict],
+              using: str = DEFAULT_DB_ALIAS) -> int:
+    """
+    Insert rows with COPY, several times faster than bulk_create for tens
+    of thousands of rows as no model instance is built.
+    Rows map attnames (student_id, not student) to values; missing fields
+    take their default, auto_now fields the current time. No save(),
+    validation or signal runs.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not getattr(field, "db_returning", False)
+    ]
+    now = timezone.now()
+    quote = connections[using].ops.quote_name
+    sql = "COPY {} ({}) FROM STDIN".format(
+        quote(model._meta.db_table),
+        ", ".join(quote(field.column) for field in fields)
+    )
+    count = 0
+    with connections[using].cursor() as cursor:
+        with cursor.cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row([
+                    row[field.attname] if field.attname in row
+                    else now if getattr(field, "auto_now", False)
+                    or getattr(field, "auto_now_add", False)
+                    else field.get_default()
+                    for field in fields
+                ])
+                count += 1
+    return count
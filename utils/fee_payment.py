@@ -3,44 +3,163 @@ Helper functions for fee payment
 """
 from uuid import uuid4
 from decimal import Decimal
-from django.db.models import Sum
+from typing import Optional
+from django.db.models import (
+    F, FilteredRelation, OuterRef, Q, QuerySet, Subquery, Sum, Value
+)
+from django.db.models.functions import Coalesce
 from core.models import (
     # Student,
+    Fee,
     StudentClass,
     Payment,
     FeeArrear,
     ArrearPayment
 )
 
+ZERO = Decimal("0.00")
+
+
+def money(amount: Optional[Decimal]) -> str:
+    """Amounts as strings, as the serializers send them"""
+    return str((amount or ZERO).quantize(ZERO))
+
+
+def fee_breakdown(student_classes: QuerySet,
+                  ordered_ids: Optional[list] = None) -> dict:
+    """
+    Amount paid on every fee of the fee groups of some student classes
+    (a class, a year, the whole school) in one grouped query: the classes
+    joined to the fees of their group, and to the payments of the same
+    student, fee and year.
+
+    Columnar result: "fees" and "students" hold one list per column, "paid"
+    one row per student with one amount per fee (None where the fee is not
+    in the student's group) and "owing" the total still owed per student.
+    Students come in the order of ordered_ids (StudentClass ids) if given,
+    else by class and name.
+    """
+    rows = student_classes.annotate(
+        fee_payments=FilteredRelation(
+            "student__payment",
+            condition=Q(
+                student__payment__fee=F("fee_assigned__fees"),
+                student__payment__academic_year=F("academic_year"),
+            )
+        )
+    ).values(
+        "id", "student_id", "student__student_id", "student__first_name",
+        "student__last_name", "student_class__name",
+        "fee_assigned__fees", "fee_assigned__fees__name",
+        "fee_assigned__fees__amount",
+        "fee_assigned__fees__academic_term__term",
+        "fee_assigned__fees__academic_term__order",
+    ).annotate(
+        paid=Coalesce(Sum("fee_payments__amount"), ZERO)
+    ).order_by()
+
+    fees = {}
+    students = {}
+    for row in rows:
+        student = students.setdefault(row["id"], {
+            "student": row["student_id"],
+            "student_id": row["student__student_id"],
+            "name": " ".join(filter(None, [
+                row["student__first_name"], row["student__last_name"]
+            ])),
+            "class": row["student_class__name"],
+            "paid": {},
+        })
+        if row["fee_assigned__fees"] is None:
+            # No fee group, or an empty one
+            continue
+        fees.setdefault(row["fee_assigned__fees"], (
+            row["fee_assigned__fees__academic_term__order"] or 0,
+            row["fee_assigned__fees__name"],
+            row["fee_assigned__fees__academic_term__term"],
+            row["fee_assigned__fees__amount"],
+        ))
+        student["paid"][row["fee_assigned__fees"]] = row["paid"]
+
+    fee_ids = sorted(fees, key=lambda fee_id: fees[fee_id][:2])
+    if ordered_ids is None:
+        ordered_ids = sorted(
+            students,
+            key=lambda pk: (students[pk]["class"], students[pk]["name"])
+        )
+    result = {
+        "fees": {
+            "id": fee_ids,
+            "name": [fees[fee_id][1] for fee_id in fee_ids],
+            "academic_term": [fees[fee_id][2] for fee_id in fee_ids],
+            "amount": [fees[fee_id][3] for fee_id in fee_ids],
+        },
+        "students": {
+            "id": [], "student_id": [], "name": [], "class": [],
+        },
+        "paid": [],
+        "owing": [],
+    }
+    for pk in ordered_ids:
+        student = students.get(pk)
+        if student is None:
+            continue
+        result["students"]["id"].append(student["student"])
+        result["students"]["student_id"].append(student["student_id"])
+        result["students"]["name"].append(student["name"])
+        result["students"]["class"].append(student["class"])
+        result["paid"].append([
+            student["paid"].get(fee_id) for fee_id in fee_ids
+        ])
+        result["owing"].append(sum(
+            (fees[fee_id][3] - paid for fee_id, paid in
+             student["paid"].items()),
+            ZERO
+        ))
+    return result
+
+
+def with_owing(student_classes: QuerySet) -> QuerySet:
+    """
+    Student classes annotated with fees_assigned, fees_paid and
+    owing_amount (assigned less paid) of their year, to filter and sort on
+    before running fee_breakdown on a page of them
+    """
+    assigned = Fee.objects.filter(
+        studentfeegroup=OuterRef("fee_assigned")
+    ).order_by().values("studentfeegroup").annotate(
+        total=Sum("amount")
+    ).values("total")
+    return student_classes.annotate(
+        year_payments=FilteredRelation(
+            "student__payment",
+            condition=Q(student__payment__academic_year=F("academic_year"))
+        ),
+        fees_assigned=Coalesce(Subquery(assigned), Value(ZERO)),
+        fees_paid=Coalesce(Sum("year_payments__amount"), Value(ZERO)),
+    ).annotate(owing_amount=F("fees_assigned") - F("fees_paid"))
+
 
 def fee_payment_breakdown(student_id: uuid4) -> list:
     """Find payment and owing per fee in fee group for student"""
-    student_class = StudentClass.objects.get(
+    breakdown = fee_breakdown(StudentClass.objects.filter(
         student__id=student_id,
         academic_year__is_active=True
-    )
-    all_fees = student_class.fee_assigned.fees.all()
-    fee_breakdown_list = []
-    for fee in all_fees:
-        paid_amount = 0
-        fee_payment = Payment.objects.filter(
-            academic_year__is_active=True,
-            student__id=student_id,
-            fee=fee
+    ))
+    if not breakdown["paid"]:
+        return []
+    fees = breakdown["fees"]
+    return [
+        {
+            "fee_name": name,
+            "fee_amount": amount,
+            "amount_paid": paid,
+            "amount_owing": amount - paid
+        }
+        for name, amount, paid in zip(
+            fees["name"], fees["amount"], breakdown["paid"][0]
         )
-        if fee_payment:
-            paid_amount = fee_payment.aggregate(Sum("amount"))["amount__sum"]
-        target_index = fee.academic_term.order - 1
-        while len(fee_breakdown_list) <= target_index:
-            fee_breakdown_list.append(None)
-        fee_breakdown_list[target_index] = {
-                "fee_name": fee.name,
-                "fee_amount": fee.amount,
-                "amount_paid": paid_amount,
-                "amount_owing": fee.amount - paid_amount
-            }
-    print(fee_breakdown_list)
-    return fee_breakdown_list
+    ]
 
 
 def payment_aggregate(student_id: uuid4) -> tuple[Decimal, Decimal, Decimal]:
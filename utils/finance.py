@@ -2,18 +2,18 @@
 All helper functions relating the finance model
 including tax calculation, payroll, etc
 """
-from typing import Union
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional, Union
 from uuid import uuid4
 
-from django.db.models import Sum
-from core.models import Staff
+from django.db.models import F, Sum
 
 from finance.models import (
-    SalaryBand,
     PaymentDetail,
-    # PayrollRun,
+    PayrollRun,
     Payroll
     )
+from utils.cache import get_or_set
 
 
 residency_rate = {
@@ -24,71 +24,124 @@ residency_rate = {
 }
 
 
-def summary_tax(staff_id, ssnit_rate, tier_three) -> dict:
+# Monthly PAYE of resident full time staff: width of each band of the
+# chargeable income and its rate in percent, the last band unbounded
+PAYE_BANDS = [
+    (Decimal("402"), Decimal("0")),
+    (Decimal("110"), Decimal("5")),
+    (Decimal("130"), Decimal("10")),
+    (Decimal("3000"), Decimal("17.5")),
+    (Decimal("16395"), Decimal("25")),
+    (Decimal("29963"), Decimal("30")),
+    (None, Decimal("35")),
+]
+
+# Amounts of a salary band's benefit package used by the payroll
+BENEFIT_FIELDS = [
+    "cash_allowance", "excess_bonus", "bonus_income", "vehicle_elements",
+    "non_cash_benefits", "deductible_relief",
+]
+
+# Amounts of a payroll line summed into the totals of a run
+PAYROLL_AMOUNT_FIELDS = [
+    "basic_salary", "total_cash_amolument", "ssnit_amount", "tier_three",
+    "cash_allowance", "bonus_income", "excess_bonus", "vehicle_elements",
+    "non_cash_benefits", "accessible_income", "deductible_relief",
+    "total_relief", "chargeable_income", "tax_deductible", "tax_payable",
+]
+
+PAYROLL_NAMESPACE = "payroll"
+# User fields read into the payroll snapshot
+PAYROLL_USER_FIELDS = {"first_name", "last_name", "organization"}
+CENT = Decimal("0.01")
+
+
+def as_decimal(value) -> Decimal:
+    """An amount of a JSON benefit package or an override as a Decimal"""
+    return Decimal(str(value or 0))
+
+
+def compute_payroll_line(basic, benefits: Optional[dict], residency_status,
+                         ssnit_rate, tier_three) -> dict:
     """
-    Parent function to return the dict
+    Payroll line of a staff member, computed without touching the database
 
     Args:
-        staff_id: Primary key (UUID) for staff model
+        basic: Basic salary of the salary band
+        benefits: Benefit package of the salary band
+        residency_status: Residency status of the staff member
         ssnit_rate: Rate of SSNIT without tier_three on the org
         tier_three: SSNIT Tier three if it exists
     """
-    try:
-        pay_details = PaymentDetail.objects.get(staff__id=staff_id).salary_band
-        salary_band = SalaryBand.objects.get(id=pay_details.id)
-        benefits = salary_band.benefit_package
-        employeessnit = employee_ssnit(salary_band.amount, ssnit_rate)
-        cash_allowance = 0
-        excess_bonus = 0
-        bonus_income = 0
-        vehicle_elements = 0
-        non_cash_benefits = 0
-        deductible_relief = 0
-        if benefits is not None:
-            cash_allowance = float(benefits.get("cash_allowance", 0))
-            excess_bonus = float(benefits.get("excess_bonus", 0))
-            bonus_income = float(benefits.get("bonus_income", 0))
-            vehicle_elements = float(benefits.get("vehicle_elements", 0))
-            non_cash_benefits = float(benefits.get("non_cash_benefits", 0))
-            deductible_relief = float(benefits.get("deductible_relief", 0))
-        totalcashamolument = total_cash_amolument(
-            salary_band.amount, cash_allowance, excess_bonus
-            )
-        tier_threecontribute = tier_three_contribution(
-            salary_band.amount, tier_three
+    basic = as_decimal(basic)
+    amounts = {
+        field: as_decimal((benefits or {}).get(field))
+        for field in BENEFIT_FIELDS
+    }
+    employeessnit = employee_ssnit(basic, as_decimal(ssnit_rate))
+    totalcashamolument = total_cash_amolument(
+        basic, amounts["cash_allowance"], amounts["excess_bonus"]
         )
-        accessible_income = totalcashamolument+vehicle_elements+non_cash_benefits
-        total_relief = employeessnit + tier_threecontribute + deductible_relief
-        chargeable_income = accessible_income - total_relief - cash_allowance
+    tier_threecontribute = tier_three_contribution(
+        basic, as_decimal(tier_three)
+    )
+    accessible_income = (
+        totalcashamolument + amounts["vehicle_elements"]
+        + amounts["non_cash_benefits"]
+    )
+    total_relief = (
+        employeessnit + tier_threecontribute + amounts["deductible_relief"]
+    )
+    chargeable_income = (
+        accessible_income - total_relief - amounts["cash_allowance"]
+    )
+    tax_deductible = income_tax(residency_status, chargeable_income)
+    overtime_tax = 0
+    tax_payable_to_gra = amounts["bonus_income"] + tax_deductible + overtime_tax
 
-        tax_deductible = calculate_tax_deductible(
-            staff_id, chargeable_income
-        )
-        overtime_tax = 0
-        tax_payable_to_gra = bonus_income + tax_deductible + overtime_tax
-
-        result = {
-            "basic_salary": salary_band.amount,
-            "total_cash_amolument": totalcashamolument,
-            "ssnit_amount": employeessnit,
-            "tier_three": tier_threecontribute,
-            "cash_allowance": cash_allowance,
-            "bonus_income": bonus_income,
-            "excess_bonus": excess_bonus,
-            "vehicle_elements": vehicle_elements,
-            "non_cash_benefits": non_cash_benefits,
-            "accessible_income": accessible_income,
-            "deductible_relief": deductible_relief,
-            "total_relief": total_relief,
-            "chargeable_income": chargeable_income,
-            "tax_deductible": tax_deductible,
-            "tax_payable": tax_payable_to_gra,
-        }
-        return result
+    result = {
+        "basic_salary": basic,
+        "total_cash_amolument": totalcashamolument,
+        "ssnit_amount": employeessnit,
+        "tier_three": tier_threecontribute,
+        "cash_allowance": amounts["cash_allowance"],
+        "bonus_income": amounts["bonus_income"],
+        "excess_bonus": amounts["excess_bonus"],
+        "vehicle_elements": amounts["vehicle_elements"],
+        "non_cash_benefits": amounts["non_cash_benefits"],
+        "accessible_income": accessible_income,
+        "deductible_relief": amounts["deductible_relief"],
+        "total_relief": total_relief,
+        "chargeable_income": chargeable_income,
+        "tax_deductible": tax_deductible,
+        "tax_payable": tax_payable_to_gra,
+    }
+    return {
+        field: amount.quantize(CENT, rounding=ROUND_HALF_UP)
+        for field, amount in result.items()
+    }
+
+
+def summary_tax(staff_id, ssnit_rate, tier_three) -> Optional[dict]:
+    """
+    Payroll line of a staff member, None without payment details
+
+    Args:
+        staff_id: Primary key (UUID) for staff model
+        ssnit_rate: Rate of SSNIT without tier_three on the org
+        tier_three: SSNIT Tier three if it exists
+    """
+    try:
+        pay_details = PaymentDetail.objects.select_related(
+            "salary_band", "staff"
+        ).get(staff__id=staff_id)
     except PaymentDetail.DoesNotExist:
         return None
-    except SalaryBand.DoesNotExist:
-        return None
+    salary_band = pay_details.salary_band
+    return compute_payroll_line(
+        salary_band.amount, salary_band.benefit_package,
+        pay_details.staff.residency_status, ssnit_rate, tier_three
+    )
 
 
 def total_cash_amolument(basic, cash_allowance, excess_bonus):
@@ -102,18 +155,14 @@ def total_cash_amolument(basic, cash_allowance, excess_bonus):
         else:
             return basic
     else:
-        return 0
+        return Decimal(0)
 
 
-def employee_ssnit(basic: float, ssnit: float):
+def employee_ssnit(basic: Decimal, ssnit: Decimal):
     """Get the rate from org config to calculate on basic"""
-    if basic:
-        if ssnit:
-            return (ssnit/100) * basic
-        else:
-            return basic
-    else:
-        return 0
+    if basic and ssnit:
+        return (ssnit/100) * basic
+    return Decimal(0)
 
 
 def tier_three_contribution(basic, tier_three_rate):
@@ -121,44 +170,111 @@ def tier_three_contribution(basic, tier_three_rate):
     return (tier_three_rate/100) * basic
 
 
-def calculate_tax_deductible(staff_id, chargeable):
+def income_tax(residency_status, chargeable: Decimal) -> Decimal:
     """Calculation for the tax deductible"""
-    staff_residency = Staff.objects.get(id=staff_id).residency_status
-
-    res_rate = residency_rate.get(staff_residency)
-    if res_rate:
-        if res_rate == "Resident-Full-Time":
-            level_1, level_2, level_3, level_4, level_5 = 0, 0, 0, 0, 0
-            level_6 = 0
-            if chargeable - 402 > 0:
-                level_1 = min(chargeable-402, 110) * 0.05
-            if chargeable - 512 > 0:
-                level_2 = min(chargeable - 512, 130) * 0.1
-            if chargeable - 642 > 0:
-                level_3 = min(chargeable - 642, 3000) * 0.175
-            if chargeable - 3642 > 0:
-                level_4 = min(chargeable - 3642, 16395) * 0.25
-            if chargeable - 20037 > 0:
-                level_5 = min(chargeable - 20037, 29963) * 0.3
-            if chargeable - 50000 > 0:
-                level_6 = chargeable - 50000
-            tax_deduc = level_1 + level_2 + level_3 + level_4 + level_5+level_6
-        else:
-            tax_deduc = res_rate * chargeable
-    else:
-        tax_deduc = 0
+    res_rate = residency_rate.get(residency_status)
+    if not res_rate:
+        return Decimal(0)
+    if res_rate != "Resident-Full-Time":
+        return max(chargeable, Decimal(0)) * res_rate / 100
+    tax_deduc = Decimal(0)
+    band_start = Decimal(0)
+    for width, rate in PAYE_BANDS:
+        if chargeable <= band_start:
+            break
+        taxed = chargeable - band_start
+        if width is not None:
+            taxed = min(taxed, width)
+            band_start += width
+        tax_deduc += taxed * rate / 100
     return tax_deduc
 
 
+def staff_pay_rows(organization) -> list[dict]:
+    """Active staff of the organization with their salary band, one query"""
+    return list(PaymentDetail.objects.filter(
+        staff__is_active=True,
+        staff__user__organization=organization
+    ).order_by("staff__staff_id", "staff_id").values(
+        "salary_band_id",
+        staff_pk=F("staff_id"),
+        staff_number=F("staff__staff_id"),
+        first_name=F("staff__user__first_name"),
+        last_name=F("staff__user__last_name"),
+        residency_status=F("staff__residency_status"),
+        band_name=F("salary_band__name"),
+        amount=F("salary_band__amount"),
+        benefit_package=F("salary_band__benefit_package"),
+    ))
+
+
+def payroll_snapshot(organization) -> list[dict]:
+    """
+    staff_pay_rows of the organization, cached until a salary band, payment
+    detail or staff changes
+    """
+    return get_or_set(
+        PAYROLL_NAMESPACE, ("snapshot", organization.pk),
+        lambda: staff_pay_rows(organization)
+    )
+
+
+def preview_payroll(snapshot: list[dict], ssnit_rate, tier_three,
+                    salary_bands: Optional[dict] = None,
+                    bonuses: Optional[dict] = None) -> dict:
+    """
+    Payroll run of a snapshot, with changes to salary bands (amount and
+    benefit package by band id) and bonuses (by staff id) applied
+
+    Returns:
+        The totals of the run and its payroll lines
+    """
+    salary_bands = salary_bands or {}
+    bonuses = bonuses or {}
+    totals = dict.fromkeys(PAYROLL_AMOUNT_FIELDS, Decimal("0.00"))
+    lines = []
+    for row in snapshot:
+        band = salary_bands.get(str(row["salary_band_id"]), {})
+        benefits = {**(row["benefit_package"] or {}),
+                    **band.get("benefit_package", {})}
+        bonus = bonuses.get(str(row["staff_pk"]))
+        if bonus is not None:
+            benefits["bonus_income"] = (
+                as_decimal(benefits.get("bonus_income")) + as_decimal(bonus)
+            )
+        line = compute_payroll_line(
+            band.get("amount", row["amount"]), benefits,
+            row["residency_status"], ssnit_rate, tier_three
+        )
+        for field in PAYROLL_AMOUNT_FIELDS:
+            totals[field] += line[field]
+        lines.append({
+            "staff": row["staff_pk"],
+            "staff_id": row["staff_number"],
+            "name": f"{row['first_name'] or ''} {row['last_name'] or ''}".strip(),
+            "salary_band": row["salary_band_id"],
+            "salary_band_name": row["band_name"],
+            **line
+        })
+    return {
+        "ssnit_rate": as_decimal(ssnit_rate),
+        "tier_three": as_decimal(tier_three),
+        "staff_count": len(lines),
+        "totals": totals,
+        "payroll": lines,
+    }
+
+
 def update_payrun_basic(payrun_id: Union[str, uuid4]) -> Union[float, int]:
     """
     A function that updates total basic salary on payrun
     """
     result = Payroll.objects.filter(
         payrun__id=payrun_id
-        ).aaggregate(total_sum=Sum("basic_salary"))
-
-    return result.get("total_sum", 0)
+        ).aggregate(total_sum=Sum("basic_salary"))
+    total = result["total_sum"] or 0
+    PayrollRun.objects.filter(id=payrun_id).update(total_basic=total)
+    return total
 
 
 def update_chargeable(payrun_id: Union[str, uuid4]) -> Union[float, int]:
@@ -167,6 +283,7 @@ def update_chargeable(payrun_id: Union[str, uuid4]) -> Union[float, int]:
     """
     result = Payroll.objects.filter(
         payrun__id=payrun_id
-        ).aaggregate(total_sum=Sum("chargeable_income"))
-
-    return result.get("total_sum", 0)
+        ).aggregate(total_sum=Sum("chargeable_income"))
+    total = result["total_sum"] or 0
+    PayrollRun.objects.filter(id=payrun_id).update(total_chargeable_income=total)
+    return total
@@ -0,0 +1,102 @@
+"""
+Idempotency-Key support for the POSTs that move money. The first request
+with a key runs in a transaction together with the IdempotencyKey row that
+records its response, so a retry of the same request, sent before or after
+the first one finished, gets that response again instead of posting twice.
+A failed request stores nothing and may be retried with the same key.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request) -> str:
+    """SHA-256 of the method, path and body of a request"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(
+        f"{request.method} {request.path}\n{body}".encode()
+    ).hexdigest()
+
+
+def replay(record: IdempotencyKey) -> Response:
+    return Response(
+        json.loads(record.response), status=record.status_code,
+        headers={REPLAYED_HEADER: "true"}
+    )
+
+
+class IdempotentCreateMixin:
+    """
+    Make create of a viewset idempotent for requests carrying an
+    Idempotency-Key header. Keys are scoped to the user and kept for
+    IDEMPOTENCY_KEY_TTL seconds.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {
+                    "message": f"{IDEMPOTENCY_HEADER} is longer than "
+                               f"{MAX_KEY_LENGTH} characters",
+                    "error_message": "Validation Error"
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        fingerprint = request_fingerprint(request)
+        now = timezone.now()
+        with transaction.atomic():
+            IdempotencyKey.objects.filter(
+                user=request.user, key=key, expires_at__lte=now
+            ).delete()
+            # A concurrent request with the key waits here on the unique
+            # index until the first one commits or rolls back
+            record, created = IdempotencyKey.objects.get_or_create(
+                user=request.user, key=key,
+                defaults={
+                    "method": request.method,
+                    "path": request.path,
+                    "fingerprint": fingerprint,
+                    "expires_at": now + timedelta(
+                        seconds=settings.IDEMPOTENCY_KEY_TTL
+                    ),
+                }
+            )
+            if not created:
+                if record.fingerprint != fingerprint:
+                    return Response(
+                        {
+                            "message": f"{IDEMPOTENCY_HEADER} was used for "
+                                       "a different request",
+                            "error_message": "Idempotency Error"
+                        },
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                return replay(record)
+            response = super().create(request, *args, **kwargs)
+            if not status.is_success(response.status_code):
+                # Nothing to replay, let the client retry with the key
+                transaction.set_rollback(True)
+                return response
+            record.status_code = response.status_code
+            # The body as the client received it, Decimals as strings
+            record.response = JSONRenderer().render(response.data).decode()
+            record.save(update_fields=[
+                "status_code", "response", "last_modified"
+            ])
+        return response
@@ -0,0 +1,207 @@
+"""
+Unified cashbook feed over income, expenditure, fee and arrear payments.
+The ledger tables are combined with a single UNION ALL and paged with a
+keyset cursor on (date_created, id), newest first.
+"""
+import base64
+from datetime import date, datetime
+from typing import Optional
+
+from django.db.models import (
+    CharField, F, Q, UUIDField, Value
+)
+from django.db.models.query import QuerySet
+
+from core.models import ArrearPayment, Payment
+from core.utils import TransactionType
+from finance.models import Expenditure, Income
+from utils.cashflow import day_bounds
+
+
+# Columns of every branch of the union, in select order
+FEED_COLUMNS = [
+    "entry_id", "entry_date", "entry_type", "entry_amount", "entry_purpose",
+    "entry_user", "entry_student", "entry_first_name", "entry_last_name",
+    "entry_method"
+]
+
+# Names the feed rows are returned under
+FEED_KEYS = {
+    "entry_id": "id",
+    "entry_date": "date_created",
+    "entry_type": "model_type",
+    "entry_amount": "amount",
+    "entry_purpose": "purpose",
+    "entry_user": "user",
+    "entry_student": "student",
+    "entry_first_name": "student__first_name",
+    "entry_last_name": "student__last_name",
+    "entry_method": "payment_method",
+}
+
+
+def _text(value):
+    return Value(value, output_field=CharField())
+
+
+def _branches() -> dict:
+    """Querysets and column expressions of each transaction type"""
+    no_student = Value(None, output_field=UUIDField())
+    no_name = Value(None, output_field=CharField())
+    return {
+        TransactionType.Income.value: (
+            Income.objects.all(), {
+                "entry_purpose": F("purpose"),
+                "entry_student": F("student_id"),
+                "entry_first_name": F("student__first_name"),
+                "entry_last_name": F("student__last_name"),
+                "student_path": "student_id",
+            }
+        ),
+        TransactionType.Expenditure.value: (
+            Expenditure.objects.all(), {
+                "entry_purpose": F("purpose"),
+                "entry_student": no_student,
+                "entry_first_name": no_name,
+                "entry_last_name": no_name,
+                "student_path": None,
+            }
+        ),
+        TransactionType.Payment.value: (
+            Payment.objects.all(), {
+                "entry_purpose": F("fee__name"),
+                "entry_student": F("student_id"),
+                "entry_first_name": F("student__first_name"),
+                "entry_last_name": F("student__last_name"),
+                "student_path": "student_id",
+            }
+        ),
+        TransactionType.ArrearPayment.value: (
+            ArrearPayment.objects.all(), {
+                "entry_purpose": _text("Fee arrears"),
+                "entry_student": F("fee_arrear__student_id"),
+                "entry_first_name": F("fee_arrear__student__first_name"),
+                "entry_last_name": F("fee_arrear__student__last_name"),
+                "student_path": "fee_arrear__student_id",
+            }
+        ),
+    }
+
+
+def encode_cursor(date_created: datetime, entry_id) -> str:
+    """Opaque cursor pointing after the given row"""
+    raw = f"{date_created.isoformat()}|{entry_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """Inverse of encode_cursor, raises ValueError on a bad cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_created, entry_id = raw.split("|")
+        return datetime.fromisoformat(date_created), entry_id
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor {cursor}") from e
+
+
+def keyset_filter(
+        cursor: Optional[str], date_field: str = "date_created",
+        id_field: str = "id") -> Q:
+    """Rows strictly after the cursor in (date, id) descending order"""
+    if not cursor:
+        return Q()
+    date_created, entry_id = decode_cursor(cursor)
+    return Q(**{f"{date_field}__lt": date_created}) | Q(
+        **{date_field: date_created, f"{id_field}__lt": entry_id}
+    )
+
+
+def transaction_feed(
+        types: Optional[list[str]] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        student=None, user=None,
+        cursor: Optional[str] = None,
+        limit: int = 20) -> tuple[list[dict], Optional[str]]:
+    """
+    One page of the cashbook, newest first
+
+    Args:
+        types: TransactionType values to include, all when empty
+        start: First day to include (inclusive)
+        end: Last day to include (inclusive)
+        student: Only transactions of this student
+        user: Only transactions recorded by this user
+        cursor: Value of the previous page's next cursor
+        limit: Page size
+    Returns:
+        The page rows and the cursor of the next page (None on the last)
+    """
+    conditions = keyset_filter(cursor)
+    if start:
+        conditions &= Q(date_created__gte=day_bounds(start, start)[0])
+    if end:
+        conditions &= Q(date_created__lt=day_bounds(end, end)[1])
+    if user:
+        conditions &= Q(user_id=user)
+
+    queries = []
+    for entry_type, (queryset, columns) in _branches().items():
+        if types and entry_type not in types:
+            continue
+        branch_conditions = conditions
+        if student:
+            if columns["student_path"] is None:
+                continue
+            branch_conditions &= Q(**{columns["student_path"]: student})
+        # Each branch is limited on its own so it can walk date_created
+        # from its index instead of the union sorting every row
+        queries.append(
+            queryset.filter(branch_conditions).annotate(
+                entry_id=F("id"),
+                entry_date=F("date_created"),
+                entry_type=_text(entry_type),
+                entry_amount=F("amount"),
+                entry_purpose=columns["entry_purpose"],
+                entry_user=F("user_id"),
+                entry_student=columns["entry_student"],
+                entry_first_name=columns["entry_first_name"],
+                entry_last_name=columns["entry_last_name"],
+                entry_method=F("payment_method"),
+            ).values(*FEED_COLUMNS).order_by(
+                "-date_created", "-id"
+            )[:limit + 1]
+        )
+    if not queries:
+        return [], None
+
+    feed: QuerySet = queries[0]
+    if len(queries) > 1:
+        feed = queries[0].union(*queries[1:], all=True).order_by(
+            "-entry_date", "-entry_id"
+        )
+    rows = list(feed[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(
+            rows[-1]["entry_date"], rows[-1]["entry_id"]
+            )
+    return [
+        {FEED_KEYS[column]: row[column] for column in FEED_COLUMNS}
+        for row in rows
+    ], next_cursor
+
+
+def parse_types(value: Optional[str]) -> list[str]:
+    """Comma separated transaction types, raises ValueError if unknown"""
+    if not value:
+        return []
+    allowed = [item.value for item in TransactionType]
+    types = [entry_type.strip() for entry_type in value.split(",")]
+    for entry_type in types:
+        if entry_type not in allowed:
+            raise ValueError(
+                f"Invalid type {entry_type}, expected one of {allowed}"
+                )
+    return types
@@ -0,0 +1,200 @@
+"""
+Logging pieces for a non blocking, structured log pipeline.
+Request threads only put records on a queue; a listener thread formats them
+as JSON and writes them to a file and/or batched stdout. Every gunicorn
+worker appends to the same file, so none of them rotates it: logrotate (or
+the platform) moves it aside and the workers reopen it on their next write.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from typing import Optional
+
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has, anything else was passed through extra=
+RECORD_ATTRIBUTES = set(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the id of the request being served"""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class DebugSampleFilter(logging.Filter):
+    """Keep every INFO and above record but only a sample of DEBUG ones"""
+
+    def __init__(self, rate: float = 1.0, name: str = ""):
+        super().__init__(name)
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "process": record.process,
+            "thread": record.thread,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                payload[key] = value
+        return json.dumps(payload, default=str)
+
+
+class BatchedStreamHandler(logging.Handler):
+    """Write formatted records to a stream in batches of lines"""
+
+    def __init__(
+            self, stream=None, batch_size: int = 50,
+            flush_interval: float = 1.0):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.buffer) >= self.batch_size or \
+                time.monotonic() - self.last_flush >= self.flush_interval or \
+                record.levelno >= logging.ERROR:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                self.stream.write("\n".join(self.buffer) + "\n")
+                self.stream.flush()
+                self.buffer = []
+            self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class FlushingQueueListener(QueueListener):
+    """
+    Queue listener that also flushes its handlers once the queue stayed
+    empty for flush_interval seconds, so the batched lines of a quiet
+    worker are not held until the next record
+    """
+
+    def __init__(self, queue_, *handlers, flush_interval: float = 1.0,
+                 respect_handler_level: bool = False):
+        super().__init__(
+            queue_, *handlers, respect_handler_level=respect_handler_level
+        )
+        self.flush_interval = float(flush_interval)
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+
+class AsyncLogHandler(QueueHandler):
+    """
+    Queue records from the calling thread and write them on a listener
+    thread to a file and/or batched stdout, both as JSON
+    """
+
+    def __init__(
+            self, filename: Optional[str] = None, stdout: bool = False, batch_size: int = 50,
+            flush_interval: float = 1.0, queue_size: int = 10000):
+        super().__init__(queue.Queue(maxsize=int(queue_size)))
+        self.addFilter(RequestIdFilter())
+        targets = []
+        if filename:
+            # Reopened once rotated away, see the module docstring
+            targets.append(WatchedFileHandler(filename, delay=True))
+        if stdout:
+            targets.append(BatchedStreamHandler(
+                batch_size=batch_size, flush_interval=flush_interval
+            ))
+        for target in targets:
+            target.setFormatter(JsonFormatter())
+        self.listener = FlushingQueueListener(
+            self.queue, *targets, flush_interval=flush_interval,
+            respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.stop)
+        # Threads do not survive a fork (gunicorn --preload), restart it
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.restart)
+
+    def prepare(self, record):
+        # Merge the message and render the traceback here, the originals
+        # may not be safe to use from the listener thread
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Drop rather than block the request when the writer lags
+            pass
+
+    def stop(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def restart(self):
+        self.listener._thread = None
+        self.queue = self.listener.queue = queue.Queue(
+            maxsize=self.queue.maxsize
+        )
+        self.listener.start()
@@ -1,8 +1,13 @@
 """
 Define the base pagination to use for views here
 """
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from rest_framework.pagination import PageNumberPagination
 
+from utils.cache import get_or_set
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
@@ -14,3 +19,50 @@ class ClassResultPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 1000
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator of the server rendered pages whose row count is kept in a
+    cache namespace, so only the rows of the page are read from the table
+    until the namespace is bumped
+    """
+
+    def __init__(self, object_list, per_page, namespace: str, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.namespace = namespace
+
+    @cached_property
+    def count(self) -> int:
+        return get_or_set(
+            self.namespace,
+            ("count", str(self.object_list.query)),
+            self.object_list.count
+        )
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator of the admin changelists of large tables. An unfiltered
+    changelist is counted from the planner's row estimate of the table
+    instead of a COUNT(*) over every row; filtered changelists and small
+    tables are counted exactly.
+    """
+    # Tables estimated below this many rows are counted exactly
+    exact_below = 10000
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if queryset.query.where or queryset.query.distinct:
+            return super().count
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table is first vacuumed or analyzed
+        if row is None or row[0] < self.exact_below:
+            return super().count
+        return row[0]
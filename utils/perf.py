@@ -0,0 +1,171 @@
+"""
+In memory request performance statistics.
+Each worker process keeps its own rolling window of samples per view and
+action, plus a sample of slow SQL statements with the stack that ran them.
+"""
+import os
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from rest_framework.serializers import BaseSerializer
+
+
+class RequestMetrics:
+    """Counters of the request being served"""
+
+    def __init__(self):
+        self.view = None
+        self.db_count = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+current_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar(
+    "current_metrics", default=None
+)
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest rank percentile of a list of numbers"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarise(values: list) -> dict:
+    """p50/p90/p99/max of a series, rounded for display"""
+    return {
+        "p50": round(percentile(values, 0.5), 2),
+        "p90": round(percentile(values, 0.9), 2),
+        "p99": round(percentile(values, 0.99), 2),
+        "max": round(max(values, default=0), 2),
+    }
+
+
+class PerfStats:
+    """Rolling samples per (view, action) and the slowest SQL seen"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = defaultdict(
+                lambda: deque(maxlen=settings.PERF_SAMPLE_SIZE)
+            )
+            self.slow_queries = deque(maxlen=settings.PERF_SLOW_QUERY_SAMPLES)
+
+    def record(self, view: str, sample: dict):
+        with self.lock:
+            self.samples[view].append(sample)
+
+    def record_slow_query(self, query: dict):
+        with self.lock:
+            self.slow_queries.append(query)
+
+    def report(self) -> dict:
+        with self.lock:
+            samples = {view: list(rows) for view, rows in self.samples.items()}
+            slow_queries = list(self.slow_queries)
+        endpoints = []
+        for view, rows in samples.items():
+            endpoints.append({
+                "view": view,
+                "count": len(rows),
+                "wall_ms": summarise([row["wall_ms"] for row in rows]),
+                "db_queries": summarise([row["db_queries"] for row in rows]),
+                "db_ms": summarise([row["db_ms"] for row in rows]),
+                "serializer_ms": summarise(
+                    [row["serializer_ms"] for row in rows]
+                ),
+                "response_bytes": summarise(
+                    [row["response_bytes"] for row in rows]
+                ),
+            })
+        endpoints.sort(key=lambda row: row["wall_ms"]["p90"], reverse=True)
+        return {
+            "process": os.getpid(),
+            "endpoints": endpoints,
+            "slow_queries": sorted(
+                slow_queries, key=lambda row: row["duration_ms"], reverse=True
+            ),
+        }
+
+
+perf_stats = PerfStats()
+
+
+def project_stack(limit: int = 10) -> list[str]:
+    """Frames of our own code that led to the current call"""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(base_dir)
+        and "site-packages" not in frame.filename
+    ]
+    return [
+        f"{frame.filename[len(base_dir) + 1:]}:{frame.lineno} in {frame.name}"
+        for frame in frames[-limit:]
+    ]
+
+
+def query_timer(execute, sql, params, many, context):
+    """connection.execute_wrapper counting queries and sampling slow ones"""
+    metrics = current_metrics.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        if metrics is not None:
+            metrics.db_count += 1
+            metrics.db_time += duration
+            if duration >= settings.PERF_SLOW_QUERY_MS:
+                perf_stats.record_slow_query({
+                    "view": metrics.view,
+                    "duration_ms": round(duration, 2),
+                    "sql": sql,
+                    "stack": project_stack(),
+                })
+
+
+def install_query_timer(connection, **kwargs):
+    """
+    Keep query_timer on a connection for its whole life. Connections are
+    per thread and async views query from executor threads, so wrapping
+    them per request would miss those queries; query_timer only counts
+    while a request's metrics are set in the context
+    """
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def install_serializer_timer():
+    """Time BaseSerializer.data, counting only the outermost serializer"""
+    original = BaseSerializer.data
+    if getattr(original.fget, "perf_timed", False):
+        return
+
+    def timed_data(self):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializer_depth:
+            return original.fget(self)
+        metrics.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_time += (time.perf_counter() - start) * 1000
+
+    timed_data.perf_timed = True
+    BaseSerializer.data = property(timed_data)
@@ -0,0 +1,124 @@
+"""
+Guardian phone numbers in E.164 form, for finding the children of a
+caller. The free form phone fields of ParentOrGuardian are copied to
+GuardianPhone rows ("024 123 4567" -> "+233241234567") when a guardian is
+saved, or in bulk by the backfill_guardian_phones command, and a caller is
+looked up by the indexed number.
+"""
+import re
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import transaction
+from django.db.models import CharField, OuterRef, Subquery
+from django.db.models.functions import Cast, JSONObject
+
+from core.models import GuardianPhone, ParentOrGuardian, Student, StudentClass
+from core.utils import GuardianPhoneField
+
+GUARDIAN_PHONE_FIELDS = {field.value for field in GuardianPhoneField}
+CHUNK_SIZE = 1000
+# Digits of an E.164 number, country code included
+MIN_DIGITS = 7
+MAX_DIGITS = 15
+# Longest number dialled within the country, leading 0 included
+NATIONAL_DIGITS = 10
+
+
+def to_e164(number: Optional[str]) -> Optional[str]:
+    """
+    The number in E.164 form, local numbers taken to be of
+    PHONE_COUNTRY_CODE, or None when it is not a phone number
+    """
+    if not number:
+        return None
+    number = number.strip()
+    digits = re.sub(r"\D", "", number)
+    country = settings.PHONE_COUNTRY_CODE
+    if number.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        digits = country + digits[1:]
+    elif not digits.startswith(country) or len(digits) <= NATIONAL_DIGITS:
+        # 241234567, a local number without its leading 0
+        digits = country + digits
+    if not MIN_DIGITS <= len(digits) <= MAX_DIGITS:
+        return None
+    return f"+{digits}"
+
+
+def refresh_guardian_phones(guardian_ids: Iterable,
+                            chunk_size: int = CHUNK_SIZE) -> int:
+    """Rebuild the phone rows of guardians, returns the rows written"""
+    ids = list(dict.fromkeys(guardian_ids))
+    fields = sorted(GUARDIAN_PHONE_FIELDS)
+    written = 0
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        rows = [
+            GuardianPhone(
+                guardian_id=guardian["id"], field=field, number=number
+            )
+            for guardian in ParentOrGuardian.objects.filter(
+                id__in=chunk
+            ).values("id", *fields)
+            for field in fields
+            if (number := to_e164(guardian[field]))
+        ]
+        with transaction.atomic():
+            GuardianPhone.objects.filter(guardian_id__in=chunk).delete()
+            GuardianPhone.objects.bulk_create(rows)
+        written += len(rows)
+    return written
+
+
+def caller_lookup(number: str) -> list[dict]:
+    """
+    Guardians with the phone number, each with their students and the
+    students' class and balance of the active year, in one query
+    """
+    e164 = to_e164(number)
+    if e164 is None:
+        return []
+    current = StudentClass.objects.filter(
+        student=OuterRef("pk"), academic_year__is_active=True
+    )
+    students = Student.objects.filter(
+        parentorguardian=OuterRef("pk")
+    ).order_by("first_name", "last_name").values(
+        json=JSONObject(
+            id="id",
+            student_id="student_id",
+            first_name="first_name",
+            middle_name="middle_name",
+            last_name="last_name",
+            is_active="is_active",
+            current_class=Subquery(current.values("student_class__name")[:1]),
+            # money as strings, as the serializers send it
+            fee_paid=Subquery(
+                current.values(text=Cast("fee_paid", CharField()))[:1]
+            ),
+            fee_owing=Subquery(
+                current.values(text=Cast("fee_owing", CharField()))[:1]
+            ),
+            owing=Subquery(current.values("owing")[:1]),
+        )
+    )
+    guardians = list(ParentOrGuardian.objects.filter(
+        id__in=GuardianPhone.objects.filter(
+            number=e164
+        ).values("guardian_id")
+    ).annotate(
+        linked_students=ArraySubquery(students)
+    ).order_by("full_name").values(
+        "id", "full_name", "relationship_with_student", "email",
+        "mobile_number", "home_care_giver_name", "name_of_father",
+        "father_telephone", "name_of_mother", "mother_telephone",
+        "address", "linked_students"
+    ))
+    for guardian in guardians:
+        guardian["students"] = guardian.pop("linked_students")
+    return guardians
@@ -0,0 +1,86 @@
+"""
+Read-your-writes stickiness for the replica reads of config.routers.
+A user who wrote something reads from the primary for
+REPLICA_STICKY_SECONDS afterwards, longer than the replica usually lags,
+so a cashier never sees a report without the payment just posted. The pin
+is kept in the shared cache so every worker and dyno honours it.
+"""
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from config.routers import REPLICA_DB_ALIAS, read_alias
+
+
+def _pin_key(user_pk) -> str:
+    return f"replica-pin:{user_pk}"
+
+
+def replica_enabled() -> bool:
+    """Whether a replica is configured and reads may use it"""
+    return (
+        settings.DB_REPLICA_READS and REPLICA_DB_ALIAS in settings.DATABASES
+    )
+
+
+def pin_to_primary(user):
+    """Send the reads of a user to the primary for a while after a write"""
+    if replica_enabled() and user.is_authenticated:
+        cache.set(
+            _pin_key(user.pk), 1, timeout=settings.REPLICA_STICKY_SECONDS
+        )
+
+
+def replica_for(user) -> Optional[str]:
+    """Alias the reporting reads of a user go to, None for the primary"""
+    if not replica_enabled():
+        return None
+    if user.is_authenticated and cache.get(_pin_key(user.pk)):
+        return None
+    return REPLICA_DB_ALIAS
+
+
+@contextmanager
+def reads_from(alias: Optional[str]):
+    """Route the reads of a block to an alias, None for the primary"""
+    token = read_alias.set(alias)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+class ReplicaReadMixin:
+    """
+    Serve the safe requests of a view from the replica.
+    replica_actions limits it to some viewset actions, e.g. {"metrics"};
+    None sends every GET of the view there.
+    """
+    replica_actions = None
+
+    def use_replica(self, request) -> bool:
+        if request.method not in SAFE_METHODS:
+            return False
+        if self.replica_actions is None:
+            return True
+        return getattr(self, "action", None) in self.replica_actions
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication and permission checks read from the primary
+        super().initial(request, *args, **kwargs)
+        if self.use_replica(request):
+            self._read_alias_token = read_alias.set(replica_for(request.user))
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Also after an exception DRF re-raises, else the alias would
+            # stay set for the next requests of the worker
+            token = getattr(self, "_read_alias_token", None)
+            if token is not None:
+                self._read_alias_token = None
+                read_alias.reset(token)
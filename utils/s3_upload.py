@@ -0,0 +1,208 @@
+"""
+Direct to S3 uploads with presigned POSTs.
+The API issues an UploadTicket with a presigned form, the client sends the
+file straight to the bucket, and the confirm call checks the object with a
+HEAD request before attaching it to its document, invoice or picture.
+"""
+import posixpath
+from datetime import timedelta
+from typing import Optional
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.files.storage import storages
+from django.db import transaction
+from django.utils import timezone
+from storages.backends.s3 import S3Storage
+
+from core.models import OrganizationDocument, Staff, Student, UploadTicket
+from core.utils import DocumentTypeChoices, UploadStatus, UploadTarget
+from finance.models import Expenditure
+
+
+# Model, file field, size field and content type field of each target
+UPLOAD_FIELDS = {
+    UploadTarget.Document.value: (
+        OrganizationDocument, "file", "file_size", "content_type"
+    ),
+    UploadTarget.Invoice.value: (
+        Expenditure, "invoice", "invoice_size", "invoice_content_type"
+    ),
+    UploadTarget.StudentImage.value: (Student, "image", None, None),
+    UploadTarget.StaffPicture.value: (Staff, "profile_picture", None, None),
+}
+
+# Lookup from the target to its organization, as the list views filter them.
+# Students are not linked to an organization
+ORGANIZATION_LOOKUPS = {
+    UploadTarget.Invoice.value: "user__organization",
+    UploadTarget.StaffPicture.value: "user__organization",
+}
+
+IMAGE_TARGETS = [
+    UploadTarget.StudentImage.value, UploadTarget.StaffPicture.value
+]
+
+
+class UploadError(Exception):
+    """Raised when a ticket cannot be issued or confirmed"""
+
+
+def s3_storage() -> S3Storage:
+    """The default storage, which must be S3 for direct uploads"""
+    storage = storages["default"]
+    if not isinstance(storage, S3Storage):
+        raise UploadError("Direct uploads need the S3 storage (USE_S3)")
+    return storage
+
+
+def object_key(storage: S3Storage, name: str) -> str:
+    """Bucket key of a storage name"""
+    if storage.location:
+        return posixpath.join(storage.location, name)
+    return name
+
+
+def _target_instance(user, target: str, object_id, details: dict):
+    """Object the file is uploaded for, unsaved for a new document"""
+    model = UPLOAD_FIELDS[target][0]
+    if user.organization is None:
+        raise UploadError("User does not belong to an organization")
+    if target == UploadTarget.Document.value:
+        file_types = [item.value for item in DocumentTypeChoices]
+        if not details.get("name"):
+            raise UploadError("A document needs a name")
+        if details.get("file_type") not in file_types:
+            raise UploadError(f"file_type must be one of {file_types}")
+        return model(
+            organization=user.organization,
+            name=details["name"], file_type=details["file_type"],
+            description=details.get("description")
+        )
+    queryset = model.objects.all()
+    if target in ORGANIZATION_LOOKUPS:
+        queryset = queryset.filter(
+            **{ORGANIZATION_LOOKUPS[target]: user.organization}
+        )
+    try:
+        return queryset.get(id=object_id)
+    except model.DoesNotExist as e:
+        raise UploadError(f"{model.__name__} {object_id} not found") from e
+
+
+def issue_ticket(
+        user, target: str, filename: str, content_type: str,
+        object_id=None, size: Optional[int] = None,
+        details: Optional[dict] = None) -> tuple[UploadTicket, dict]:
+    """
+    Create an upload ticket and the presigned POST for it
+
+    Args:
+        user: User uploading the file
+        target: One of the UploadTarget values
+        filename: Original name of the file
+        content_type: MIME type the upload is restricted to
+        object_id: Expenditure, Student or Staff receiving the file
+        size: Size announced by the client, checked against the limit
+        details: name, description and file_type of a new document
+    Returns:
+        The ticket and the url/fields of the presigned POST
+    """
+    storage = s3_storage()
+    if target in IMAGE_TARGETS and not content_type.startswith("image/"):
+        raise UploadError("Pictures must have an image content type")
+    if size is not None and size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError(
+            f"File is larger than {settings.UPLOAD_MAX_SIZE} bytes"
+            )
+    details = details or {}
+    instance = _target_instance(user, target, object_id, details)
+    field = instance._meta.get_field(UPLOAD_FIELDS[target][1])
+    name = field.generate_filename(
+        instance, f"{uuid4().hex[:12]}-{posixpath.basename(filename)}"
+        )
+    ticket = UploadTicket.objects.create(
+        user=user, target=target,
+        object_id=None if target == UploadTarget.Document.value else instance.id,
+        name=name, content_type=content_type,
+        max_size=settings.UPLOAD_MAX_SIZE,
+        expires_at=timezone.now() + timedelta(
+            seconds=settings.UPLOAD_TICKET_TTL
+            ),
+        details=details or None
+    )
+    upload = storage.connection.meta.client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=object_key(storage, name),
+        Fields={"Content-Type": content_type},
+        Conditions=[
+            {"Content-Type": content_type},
+            ["content-length-range", 1, ticket.max_size],
+        ],
+        ExpiresIn=settings.UPLOAD_TICKET_TTL
+    )
+    return ticket, upload
+
+
+def confirm_ticket(
+        ticket: UploadTicket, checksum: Optional[str] = None) -> UploadTicket:
+    """
+    Check the uploaded object and attach it to the ticket's target
+
+    Args:
+        ticket: Ticket returned by issue_ticket
+        checksum: Optional MD5 hex digest of the file sent by the client
+    """
+    if ticket.status == UploadStatus.Confirmed.value:
+        return ticket
+    if ticket.expires_at < timezone.now():
+        raise UploadError("Upload ticket has expired")
+    storage = s3_storage()
+    client = storage.connection.meta.client
+    key = object_key(storage, ticket.name)
+    try:
+        head = client.head_object(Bucket=storage.bucket_name, Key=key)
+    except ClientError as e:
+        raise UploadError("File has not been uploaded") from e
+    etag = head["ETag"].strip('"')
+    if head["ContentLength"] > ticket.max_size:
+        client.delete_object(Bucket=storage.bucket_name, Key=key)
+        raise UploadError(f"File is larger than {ticket.max_size} bytes")
+    # Multipart ETags are not an MD5 of the content, only compare plain ones
+    if checksum and "-" not in etag and checksum.lower() != etag:
+        raise UploadError("Checksum does not match the uploaded file")
+
+    model, file_field, size_field, type_field = UPLOAD_FIELDS[ticket.target]
+    with transaction.atomic():
+        # A concurrent confirm of the same ticket may have won the race
+        ticket = UploadTicket.objects.select_for_update().get(id=ticket.id)
+        if ticket.status == UploadStatus.Confirmed.value:
+            return ticket
+        if ticket.target == UploadTarget.Document.value:
+            instance = model(
+                organization=ticket.user.organization,
+                name=ticket.details["name"],
+                file_type=ticket.details["file_type"],
+                description=ticket.details.get("description")
+            )
+            update_fields = None
+        else:
+            instance = model.objects.select_for_update().get(
+                id=ticket.object_id
+                )
+            update_fields = [file_field, "last_modified"]
+        setattr(instance, file_field, ticket.name)
+        if size_field:
+            setattr(instance, size_field, head["ContentLength"])
+            setattr(instance, type_field, head.get("ContentType"))
+            if update_fields:
+                update_fields += [size_field, type_field]
+        instance.save(update_fields=update_fields)
+        if ticket.target == UploadTarget.Document.value:
+            ticket.document = instance
+        ticket.status = UploadStatus.Confirmed.value
+        ticket.size = head["ContentLength"]
+        ticket.checksum = etag
+        ticket.save()
+    return ticket
@@ -0,0 +1,193 @@
+"""
+Ranked, typo tolerant search of students and their guardians.
+Every student has a StudentSearchIndex row holding their names and
+student id, the names and phone numbers of their guardians and a weighted
+tsvector of the three. Word and prefix matches use the tsvector's GIN
+index, misspellings the trigram GIN index of the document, and both add
+to the rank. Where the database lacks pg_trgm (see migration core 0015)
+only words and prefixes match. The rows are refreshed by the signals of
+core.signals, and rebuilt in bulk by the rebuild_search_index command.
+"""
+import re
+from typing import Iterable
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+)
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from rest_framework import filters
+
+from core.models import ParentOrGuardian, Student, StudentSearchIndex
+from utils.phones import to_e164
+
+# Names are not words of a language, so no stemming or stop words
+SEARCH_CONFIG = "simple"
+STUDENT_SEARCH_FIELDS = {
+    "first_name", "middle_name", "last_name", "student_id"
+}
+GUARDIAN_NAME_FIELDS = [
+    "full_name", "home_care_giver_name", "name_of_father", "name_of_mother"
+]
+PHONE_FIELDS = ["mobile_number", "father_telephone", "mother_telephone"]
+# Words of a query used, the rest is ignored
+MAX_TERMS = 8
+CHUNK_SIZE = 1000
+
+SEARCH_VECTOR = (
+    SearchVector("names", weight="A", config=SEARCH_CONFIG)
+    + SearchVector("guardians", weight="C", config=SEARCH_CONFIG)
+    + SearchVector("phones", weight="D", config=SEARCH_CONFIG)
+)
+
+# alias -> whether pg_trgm is installed there
+_trigram_installed = {}
+
+
+def trigram_available(using: str = "default") -> bool:
+    """Whether the database has pg_trgm, asked once per process"""
+    if using not in _trigram_installed:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            _trigram_installed[using] = cursor.fetchone() is not None
+    return _trigram_installed[using]
+
+
+def words(values: Iterable) -> str:
+    """
+    Words of the values split as query_terms splits a query, the Postgres
+    parser would keep "SD7-000006" as "sd7" and "-000006"
+    """
+    return " ".join(
+        word for value in values if value
+        for word in re.findall(r"\w+", value.lower())
+    )
+
+
+def phone_variants(number: str) -> list[str]:
+    """Digits of a phone number, international and local, e.g.
+    233241234567 and 0241234567 for +233 24 123 4567"""
+    e164 = to_e164(number)
+    if e164 is None:
+        return []
+    digits = e164[1:]
+    country = settings.PHONE_COUNTRY_CODE
+    if digits.startswith(country):
+        return [digits, "0" + digits[len(country):]]
+    return [digits]
+
+
+def index_row(student: Student) -> StudentSearchIndex:
+    """Search row of a student, their guardians prefetched"""
+    guardians = list(student.parentorguardian_set.all())
+    student_id = student.student_id or ""
+    names = words([
+        student.first_name, student.middle_name, student.last_name,
+        # also whole, for ids typed without their dashes
+        student_id, re.sub(r"\W", "", student_id)
+    ])
+    guardian_names = words(
+        getattr(guardian, field)
+        for guardian in guardians for field in GUARDIAN_NAME_FIELDS
+    )
+    phones = " ".join(dict.fromkeys(
+        variant
+        for guardian in guardians for field in PHONE_FIELDS
+        for variant in phone_variants(getattr(guardian, field))
+    ))
+    return StudentSearchIndex(
+        student=student, names=names, guardians=guardian_names,
+        phones=phones, document=f"{names} {guardian_names}".strip()
+    )
+
+
+def refresh_search_index(student_ids: Iterable,
+                         chunk_size: int = CHUNK_SIZE) -> int:
+    """Rebuild the search rows of students, returns the rows written"""
+    ids = list(dict.fromkeys(student_ids))
+    written = 0
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        rows = [
+            index_row(student)
+            for student in Student.objects.filter(
+                id__in=chunk
+            ).prefetch_related("parentorguardian_set")
+        ]
+        StudentSearchIndex.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=["student"],
+            update_fields=[
+                "names", "guardians", "phones", "document", "last_modified"
+            ]
+        )
+        StudentSearchIndex.objects.filter(
+            student_id__in=chunk
+        ).update(search_vector=SEARCH_VECTOR)
+        written += len(rows)
+    return written
+
+
+def query_terms(text: str) -> list[str]:
+    text = (text or "").strip()
+    # A phone number typed in groups, "024 123 4567", is one term
+    if re.fullmatch(r"\+?[\d\s()-]+", text):
+        return [re.sub(r"\D", "", text)]
+    return re.findall(r"\w+", text.lower())[:MAX_TERMS]
+
+
+def search_students(queryset: QuerySet, text: str) -> QuerySet:
+    """
+    Students of the queryset matching the text, best first with their
+    score in search_rank. Every word must start a word of the index
+    ("kwa men" finds Kwame Mensah), or the whole text be close to a run of
+    words of the document ("kwamee mensa").
+    """
+    terms = query_terms(text)
+    if not terms:
+        return queryset.none()
+    # Terms are \w+ only, safe to use as a raw tsquery
+    query = SearchQuery(
+        " & ".join(f"{term}:*" for term in terms),
+        search_type="raw", config=SEARCH_CONFIG
+    )
+    matches = Q(search_index__search_vector=query)
+    rank = SearchRank(F("search_index__search_vector"), query)
+    if trigram_available(queryset.db):
+        phrase = " ".join(terms)
+        matches |= Q(search_index__document__trigram_word_similar=phrase)
+        rank += TrigramWordSimilarity(phrase, "search_index__document")
+    return queryset.filter(matches).annotate(
+        search_rank=rank
+    ).order_by("-search_rank", "student_id")
+
+
+def search_guardians(queryset: QuerySet, text: str) -> QuerySet:
+    """Guardians of the students matching the text"""
+    students = search_students(Student.objects.all(), text)
+    links = ParentOrGuardian.students.through.objects.filter(
+        student__in=students.values("id")
+    )
+    return queryset.filter(id__in=links.values("parentorguardian_id"))
+
+
+class StudentSearchFilter(filters.SearchFilter):
+    """?search= over the search index, best matches first"""
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, "")
+        if not query_terms(text):
+            return queryset
+        return search_students(queryset, text)
+
+
+class GuardianSearchFilter(filters.SearchFilter):
+    """?search= of guardians by their or their students' names and phones"""
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, "")
+        if not query_terms(text):
+            return queryset
+        return search_guardians(queryset, text)
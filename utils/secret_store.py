@@ -0,0 +1,85 @@
+"""
+Secrets resolved on first use and cached for the life of the process.
+An environment variable of the same name always wins, otherwise
+SECRETS_BACKEND picks the source:
+    env   only the environment (default)
+    file  a JSON object at SECRETS_FILE, the local stand-in for the store
+    aws   AWS Secrets Manager, SECRETS_PREFIX is put before each name
+Nothing is read and no AWS client is created until a secret is asked for,
+so importing this module costs nothing at startup.
+"""
+import json
+import os
+import threading
+from typing import Optional
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import lazy
+
+
+SECRETS_BACKENDS = ("env", "file", "aws")
+
+
+class SecretStore:
+    """Lazy, cached lookups of named secrets"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.file_values = None
+
+    def reset(self):
+        """Forget resolved values, e.g. after a rotation"""
+        with self.lock:
+            self.values = {}
+            self.file_values = None
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        with self.lock:
+            if name not in self.values:
+                # Misses are cached too, a missing secret is not looked up
+                # over the network on every call
+                self.values[name] = self.resolve(name)
+            value = self.values[name]
+        return default if value is None else value
+
+    def resolve(self, name: str) -> Optional[str]:
+        if name in os.environ:
+            return os.environ[name]
+        backend = os.environ.get("SECRETS_BACKEND", "env")
+        if backend not in SECRETS_BACKENDS:
+            raise ImproperlyConfigured(
+                f"SECRETS_BACKEND must be one of {', '.join(SECRETS_BACKENDS)}"
+            )
+        if backend == "file":
+            return self.read_file().get(name)
+        if backend == "aws":
+            # boto3 is only imported when the store is really used
+            from utils.aws_client import get_secret
+            return get_secret(
+                os.environ.get("SECRETS_PREFIX", "") + name,
+                region_name=os.environ.get("AWS_SECRETS_REGION", "us-east-1")
+            )
+        return None
+
+    def read_file(self) -> dict:
+        if self.file_values is None:
+            path = os.environ.get("SECRETS_FILE", "secrets.json")
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.file_values = json.load(f)
+            except FileNotFoundError:
+                self.file_values = {}
+        return self.file_values
+
+
+secret_store = SecretStore()
+
+
+def secret(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Value of a secret, default when no source has it"""
+    return secret_store.get(name, default)
+
+
+# For settings read only when used, e.g. EMAIL_HOST_PASSWORD
+lazy_secret = lazy(secret, str)
@@ -0,0 +1,650 @@
+"""
+Bulk seeding of a school, for benchmarks, load testing and local data.
+SchoolSeeder generates every column from one seeded random.Random and
+Faker (tw_GH names and phone numbers), drawing each batch of values at
+once from pools, so the same seed always gives the same school. Rows are
+written with COPY (utils.db.copy_rows) in dependency order: users, staff,
+students, class assignments, payments, incomes and expenditures. Model
+save() methods and signals are skipped, the balances they would maintain
+(fee_paid, fee_owing, owing_after_payment) are computed here instead.
+"""
+import random
+import time as timer
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from core.models import (
+    AcademicTerm,
+    AcademicYear,
+    Class,
+    Fee,
+    OrganizationConfig,
+    Payment,
+    Staff,
+    Student,
+    StudentClass,
+    StudentFeeGroup,
+    User,
+)
+from core.utils import (
+    LedgerSource, PaymentMethod, ResidencyChoices, StaffType
+)
+from finance.models import (
+    Expenditure,
+    ExpenditureType,
+    Income,
+    IncomeType,
+    PaymentDetail,
+    SalaryBand,
+)
+from utils.cache import CACHE_NAMESPACES, bump_namespace
+from utils.cashflow import LEDGER_MODELS, summarised_until, summarise_days
+from utils.db import copy_rows
+from utils.search import refresh_search_index
+from utils.utils import class_to_fee_group
+
+
+FAKER_LOCALE = "tw_GH"
+# Distinct values drawn from Faker for each column, rows sample from them
+POOL_SIZE = 500
+# From the first class of pre school to the last of JHS, students move one
+# class up every year
+CLASS_ORDER = [
+    "CRECHE", "NURSERY 1", "NURSERY 2", "KINDERGARTEN 1", "KINDERGARTEN 2",
+    "BASIC 1", "BASIC 2", "BASIC 3", "BASIC 4", "BASIC 5", "BASIC 6",
+    "JHS1", "JHS 2", "JHS3",
+]
+FEE_GROUP_OF_CLASS = {
+    name: group
+    for group, class_names in class_to_fee_group.items()
+    for name in class_names
+}
+TERMS = ["First Term", "Second Term", "Third Term"]
+# (year offset, first month, last month) of each term, the academic year
+# starts in September
+TERM_MONTHS = [(0, 9, 12), (1, 1, 4), (1, 5, 7)]
+# Per term amounts of each fee group
+TERM_FEES = {
+    "Pre School": {"Tuition": 800, "Feeding": 300},
+    "Primary": {"Tuition": 1000, "Feeding": 300},
+    "JHS": {"Tuition": 1200, "Feeding": 300},
+}
+SALARY_BANDS = {
+    "Seed Band A": 1800, "Seed Band B": 2600,
+    "Seed Band C": 3500, "Seed Band D": 5200,
+}
+INCOME_TYPES = ["Canteen", "Uniform Sales", "PTA Dues", "Donation"]
+EXPENDITURE_TYPES = ["Utilities", "Stationery", "Maintenance", "Transport"]
+BLOOD_TYPES = ["O+", "O-", "A+", "A-", "B+", "B-", "AB+"]
+
+
+def year_label(start_year: int) -> str:
+    return f"{start_year}/{start_year + 1}"
+
+
+def start_year_of(academic_year: AcademicYear) -> int:
+    """Calendar year an academic year starts in, from its label"""
+    try:
+        return int(academic_year.year.strip()[:4])
+    except ValueError:
+        return academic_year.date_created.year
+
+
+def term_dates(start_year: int, order: int) -> tuple[date, date]:
+    """First and last day of a term of the year starting in start_year"""
+    offset, first_month, last_month = TERM_MONTHS[order - 1]
+    start = date(start_year + offset, first_month, 1)
+    end = date(start_year + offset, last_month, 28)
+    return start, end
+
+
+class SchoolSeeder:
+    """
+    Generates a school in stages. Start with create_school, or load_school
+    to add to the active year of an existing one, then add students, staff
+    and transactions. Run it inside transaction.atomic().
+    """
+
+    def __init__(self, seed: int = 1, locale: str = FAKER_LOCALE):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.fake = Faker(locale)
+        self.fake.seed_instance(seed)
+        self.now = timezone.now()
+        self.tz = timezone.get_current_timezone()
+        self.password = make_password(f"seed-{seed}")
+        self.pools = {}
+        self.counts = defaultdict(int)
+        # First and last day of the ledger rows copied, by LedgerSource
+        self.ledger_days = {}
+        self.organization = None
+        self.admin = None
+        # Seeded or loaded years, oldest first, with their terms by order,
+        # fees by fee group and fee groups by name
+        self.academic_years = []
+        self.terms = {}
+        self.fees = {}
+        self.groups = {}
+        self.classes = {}
+        self.students = []
+
+    def new_id(self) -> uuid.UUID:
+        """Primary key drawn from the seeded generator"""
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def pick(self, column: str, count: int) -> list:
+        """count values of a Faker column, e.g. first_name"""
+        if column not in self.pools:
+            provider = getattr(self.fake, column)
+            self.pools[column] = [provider() for _ in range(POOL_SIZE)]
+        return self.rng.choices(self.pools[column], k=count)
+
+    def moment(self, start: date, end: date) -> datetime:
+        """Aware datetime within the days from start to end, never future"""
+        day = start + timedelta(days=self.rng.randrange((end - start).days + 1))
+        # zoneinfo zones are attached directly, make_aware costs more than
+        # the rest of a row
+        moment = datetime.combine(day, time(
+            hour=self.rng.randrange(7, 17), minute=self.rng.randrange(60),
+            tzinfo=self.tz
+        ))
+        return min(moment, self.now)
+
+    def copy(self, model, rows: list) -> list:
+        copy_rows(model, rows)
+        self.counts[model._meta.model_name] += len(rows)
+        if model in LEDGER_MODELS.values() and rows:
+            source = LedgerSource[model.__name__].value
+            days = [timezone.localdate(row["date_created"]) for row in rows]
+            days += self.ledger_days.get(source, ())
+            self.ledger_days[source] = (min(days), max(days))
+        return rows
+
+    def stamps(self, moment: datetime) -> dict:
+        return {"date_created": moment, "last_modified": moment}
+
+    def next_index(self, model, field: str, prefix: str) -> int:
+        """First free number of the seeded ids of a model"""
+        return model.objects.filter(
+            **{f"{field}__startswith": prefix}
+        ).count() + 1
+
+    # Reference data
+
+    def create_school(self, years: int = 3,
+                      last_year: Optional[int] = None):
+        """
+        An organization with its admin, years academic years of three
+        terms, the classes, and fees and fee groups of every year. The last
+        year and its third term are left active.
+
+        Args:
+            years: Number of academic years, at most the number of classes
+            last_year: Start year of the active academic year, by default
+                the year before the current one, so a rollover has room
+        """
+        if not 1 <= years <= len(CLASS_ORDER):
+            raise ValueError(f"years must be from 1 to {len(CLASS_ORDER)}")
+        last_year = last_year or timezone.localdate().year - 1
+        start_years = list(range(last_year - years + 1, last_year + 1))
+        labels = [year_label(start_year) for start_year in start_years]
+        existing = AcademicYear.objects.filter(year__in=labels).first()
+        if existing is not None:
+            raise ValueError(
+                f"Academic year {existing.year} already exists, seed an empty "
+                "database or choose another last_year"
+            )
+        self.organization = OrganizationConfig.objects.create(
+            name=f"Seed Academy {self.seed}",
+            address=self.fake.address(),
+            contact_number=self.fake.phone_number(),
+            ssnit_rate=Decimal("5.50"), tier_three=Decimal("5.00")
+        )
+        self.admin = self.create_admin()
+
+        AcademicYear.objects.filter(is_active=True).update(is_active=False)
+        AcademicTerm.objects.filter(is_active=True).update(is_active=False)
+        previous_year = previous_term = None
+        for start_year, label in zip(start_years, labels):
+            is_last = label == labels[-1]
+            opened = timezone.make_aware(
+                datetime.combine(term_dates(start_year, 1)[0], time(hour=8))
+            )
+            academic_year = AcademicYear(
+                year=label, is_active=is_last, previous=previous_year
+            )
+            # Saved one by one, each points to the one before
+            self.save_dated(academic_year, opened)
+            self.academic_years.append(academic_year)
+            for order, name in enumerate(TERMS, start=1):
+                previous_term = AcademicTerm(
+                    academic_year=academic_year, term=name, order=order,
+                    is_active=is_last and order == len(TERMS),
+                    previous=previous_term
+                )
+                self.save_dated(previous_term, opened)
+                self.terms[(academic_year.id, order)] = previous_term
+            previous_year = academic_year
+        self.load_classes()
+        for academic_year in self.academic_years:
+            self.create_fees(academic_year)
+
+    def load_school(self, email: Optional[str] = None):
+        """
+        Add to the active year of the school in the database. Fee groups
+        missing from it are created, email picks the user owning the rows.
+        """
+        academic_year = AcademicYear.objects.filter(is_active=True).first()
+        if academic_year is None:
+            raise ValueError("There is no active academic year to add to")
+        if email:
+            self.admin = User.objects.filter(email=email).first()
+            if self.admin is None:
+                raise ValueError(f"There is no user {email}")
+        else:
+            self.admin = User.objects.filter(
+                is_superuser=True
+            ).order_by("email").first()
+        self.organization = (
+            self.admin.organization if self.admin
+            else OrganizationConfig.objects.order_by("date_created").first()
+        )
+        if self.organization is None:
+            self.organization = OrganizationConfig.objects.create(
+                name=f"Seed Academy {self.seed}"
+            )
+        if self.admin is None:
+            self.admin = self.create_admin()
+
+        self.academic_years = [academic_year]
+        terms = AcademicTerm.objects.filter(academic_year=academic_year)
+        for term in terms:
+            order = term.order or (
+                TERMS.index(term.term) + 1 if term.term in TERMS else None
+            )
+            if order:
+                self.terms[(academic_year.id, order)] = term
+        for order, name in enumerate(TERMS, start=1):
+            if (academic_year.id, order) not in self.terms:
+                self.terms[(academic_year.id, order)] = (
+                    AcademicTerm.objects.create(
+                        academic_year=academic_year, term=name,
+                        order=order, is_active=False
+                    )
+                )
+        self.load_classes()
+        for group in StudentFeeGroup.objects.filter(
+                academic_year=academic_year, name__in=TERM_FEES
+                ).prefetch_related("fees__academic_term"):
+            self.groups[(academic_year.id, group.name)] = group
+            self.fees[(academic_year.id, group.name)] = list(group.fees.all())
+        if len(self.groups) < len(TERM_FEES):
+            self.create_fees(academic_year)
+
+    def create_admin(self) -> User:
+        return User.objects.create(
+            email=f"admin.s{self.seed}@seed.school", password=self.password,
+            first_name="Seed", last_name="Admin", user_type="Admin",
+            is_active=True, is_staff=True, is_superuser=True,
+            organization=self.organization
+        )
+
+    def save_dated(self, instance, moment: datetime):
+        """Save one row with its timestamps, which auto_now would replace"""
+        instance.id = self.new_id()
+        instance.save()
+        type(instance).objects.filter(pk=instance.pk).update(
+            **self.stamps(moment)
+        )
+
+    def load_classes(self):
+        existing = {
+            item.name: item
+            for item in Class.objects.filter(name__in=CLASS_ORDER)
+        }
+        self.classes = {
+            name: existing.get(name) or Class.objects.create(name=name)
+            for name in CLASS_ORDER
+        }
+
+    def create_fees(self, academic_year: AcademicYear):
+        """Fees of every missing group and term, and the groups of them"""
+        opened = timezone.make_aware(datetime.combine(
+            term_dates(start_year_of(academic_year), 1)[0], time(hour=8)
+        ))
+        fee_rows, group_rows, links = [], [], []
+        for group, items in TERM_FEES.items():
+            if (academic_year.id, group) in self.groups:
+                continue
+            group_id = self.new_id()
+            group_rows.append({
+                "id": group_id, "name": group,
+                "academic_year_id": academic_year.id, **self.stamps(opened)
+            })
+            for order, term_name in enumerate(TERMS, start=1):
+                for item, amount in items.items():
+                    fee_id = self.new_id()
+                    fee_rows.append({
+                        "id": fee_id, "academic_year_id": academic_year.id,
+                        "academic_term_id": self.terms[
+                            (academic_year.id, order)
+                        ].id,
+                        "name": f"{group} {term_name} {item}",
+                        "amount": Decimal(amount), **self.stamps(opened)
+                    })
+                    links.append({
+                        "studentfeegroup_id": group_id, "fee_id": fee_id
+                    })
+        self.copy(Fee, fee_rows)
+        self.copy(StudentFeeGroup, group_rows)
+        self.copy(StudentFeeGroup.fees.through, links)
+        for group in StudentFeeGroup.objects.filter(
+                id__in=[row["id"] for row in group_rows]
+                ).prefetch_related("fees__academic_term"):
+            self.groups[(academic_year.id, group.name)] = group
+            self.fees[(academic_year.id, group.name)] = list(group.fees.all())
+
+    # Generated rows
+
+    def add_students(self, count: int, payments: bool = True) -> list:
+        """
+        Students in a class every seeded year, moving up one class a year,
+        with their class balances and, unless payments is False, their fee
+        payments up to the active term
+        """
+        first_year = start_year_of(self.academic_years[0])
+        admitted = timezone.make_aware(
+            datetime.combine(term_dates(first_year, 1)[0], time(hour=8))
+        )
+        prefix = f"SD{self.seed}-"
+        first = self.next_index(Student, "student_id", prefix)
+        genders = self.rng.choices(["Male", "Female"], k=count)
+        first_names = self.pick("first_name", count)
+        middle_names = self.pick("first_name", count)
+        last_names = self.pick("last_name", count)
+        addresses = self.pick("street_address", count)
+        blood_types = self.rng.choices(BLOOD_TYPES, k=count)
+        rows = []
+        start_class = []
+        for index in range(count):
+            class_index = self.rng.randrange(
+                len(CLASS_ORDER) - len(self.academic_years) + 1
+            )
+            start_class.append(class_index)
+            rows.append({
+                "id": self.new_id(),
+                "student_id": f"{prefix}{first + index:06d}",
+                "first_name": first_names[index],
+                "middle_name": middle_names[index],
+                "last_name": last_names[index],
+                "gender": genders[index],
+                "date_of_birth": date(
+                    first_year - 2 - class_index,
+                    self.rng.randrange(1, 13), self.rng.randrange(1, 29)
+                ),
+                "date_of_admission": admitted.date(),
+                "blood_type": blood_types[index],
+                "address": addresses[index],
+                "is_active": True,
+                **self.stamps(admitted)
+            })
+        self.copy(Student, rows)
+        # COPY sends no signals
+        refresh_search_index([row["id"] for row in rows])
+
+        active_term = max(
+            (term.order for term in self.terms.values() if term.is_active),
+            default=len(TERMS)
+        )
+        payment_methods = [method.value for method in PaymentMethod]
+        class_rows = []
+        payment_rows = []
+        for student, class_index in zip(rows, start_class):
+            carried = Decimal(0)
+            for index, academic_year in enumerate(self.academic_years):
+                class_name = CLASS_ORDER[class_index + index]
+                group = FEE_GROUP_OF_CLASS[class_name]
+                year_fees = self.fees[(academic_year.id, group)]
+                assigned = sum(fee.amount for fee in year_fees)
+                paid = Decimal(0)
+                start_year = start_year_of(academic_year)
+                for fee in year_fees:
+                    order = fee.academic_term.order or 1
+                    if not payments or (
+                            academic_year.is_active and order > active_term):
+                        continue
+                    chance = self.rng.random()
+                    if chance < 0.65:
+                        amount = fee.amount
+                    elif chance < 0.85:
+                        amount = (fee.amount * Decimal(
+                            self.rng.choice(["0.25", "0.5"])
+                        )).quantize(Decimal("0.01"))
+                    else:
+                        continue
+                    paid += amount
+                    moment = self.moment(*term_dates(start_year, order))
+                    payment_rows.append({
+                        "id": self.new_id(),
+                        "academic_year_id": academic_year.id,
+                        "academic_term_id": fee.academic_term_id,
+                        "user_id": self.admin.id,
+                        "student_id": student["id"],
+                        "fee_id": fee.id,
+                        "amount": amount,
+                        "owing_after_payment": assigned - paid,
+                        "payment_method": self.rng.choice(payment_methods),
+                        **self.stamps(moment)
+                    })
+                owing = assigned - paid + carried
+                class_rows.append({
+                    "id": self.new_id(),
+                    "academic_year_id": academic_year.id,
+                    "student_id": student["id"],
+                    "student_class_id": self.classes[class_name].id,
+                    "fee_assigned_id": self.groups[
+                        (academic_year.id, group)
+                    ].id,
+                    "fee_paid": paid, "fee_owing": owing,
+                    "owing": owing > 0,
+                    **self.stamps(student["date_created"])
+                })
+                carried = owing
+        self.copy(StudentClass, class_rows)
+        self.copy(Payment, payment_rows)
+        self.students.extend(rows)
+        return rows
+
+    def add_staff(self, count: int) -> list:
+        """Staff users, their staff records and payment details"""
+        bands = [
+            SalaryBand.objects.get_or_create(
+                name=name,
+                defaults={"amount": Decimal(amount), "user": self.admin}
+            )[0]
+            for name, amount in SALARY_BANDS.items()
+        ]
+        started = timezone.make_aware(datetime.combine(
+            term_dates(start_year_of(self.academic_years[0]), 1)[0],
+            time(hour=8)
+        ))
+        first = self.next_index(Staff, "staff_id", f"ST{self.seed}-")
+        residencies = [residency.value for residency in ResidencyChoices]
+        staff_types = [staff_type.value for staff_type in StaffType]
+        first_names = self.pick("first_name", count)
+        last_names = self.pick("last_name", count)
+        phone_numbers = self.pick("phone_number", count)
+        user_rows, staff_rows, detail_rows = [], [], []
+        for index in range(count):
+            number = first + index
+            user_id = self.new_id()
+            staff_id = self.new_id()
+            user_rows.append({
+                "id": user_id,
+                "email": f"staff{number:05d}.s{self.seed}@seed.school",
+                "password": self.password,
+                "first_name": first_names[index],
+                "last_name": last_names[index],
+                "user_type": "Staff", "is_active": True,
+                "organization_id": self.organization.id,
+            })
+            staff_rows.append({
+                "id": staff_id, "user_id": user_id,
+                "staff_id": f"ST{self.seed}-{number:05d}",
+                "gender": self.rng.choice(["Male", "Female"]),
+                "date_of_birth": date(
+                    self.rng.randrange(1965, 2001),
+                    self.rng.randrange(1, 13), self.rng.randrange(1, 29)
+                ),
+                "start_date": started.date(),
+                "staff_type": self.rng.choice(staff_types),
+                "residency_status": self.rng.choice(residencies),
+                **self.stamps(started)
+            })
+            detail_rows.append({
+                "id": self.new_id(), "user_id": self.admin.id,
+                "staff_id": staff_id,
+                "salary_band_id": self.rng.choice(bands).id,
+                "bank_name": "Seed Bank",
+                "bank_account_number": f"{self.rng.randrange(10 ** 12):012d}",
+                "mobile_money_number": phone_numbers[index],
+                **self.stamps(started)
+            })
+        self.copy(User, user_rows)
+        self.copy(Staff, staff_rows)
+        self.copy(PaymentDetail, detail_rows)
+        return staff_rows
+
+    def add_transactions(self, incomes: int, expenditures: int):
+        """
+        incomes and expenditures in every term of the seeded years, some
+        incomes paid by seeded students
+        """
+        income_types = [
+            IncomeType.objects.get_or_create(name=name)[0]
+            for name in INCOME_TYPES
+        ]
+        expenditure_types = [
+            ExpenditureType.objects.get_or_create(name=name)[0]
+            for name in EXPENDITURE_TYPES
+        ]
+        student_ids = [row["id"] for row in self.students] or list(
+            Student.objects.values_list("id", flat=True)[:POOL_SIZE]
+        )
+        payment_methods = [method.value for method in PaymentMethod]
+        payers = self.pick("name", incomes * len(self.terms))
+        purposes = self.pick("catch_phrase", expenditures * len(self.terms))
+        income_rows, expenditure_rows = [], []
+        for (year_id, order), term in sorted(
+                self.terms.items(), key=lambda item: item[1].order or 0):
+            academic_year = next(
+                year for year in self.academic_years if year.id == year_id
+            )
+            dates = term_dates(start_year_of(academic_year), order)
+            for _ in range(incomes):
+                moment = self.moment(*dates)
+                income_type = self.rng.choice(income_types)
+                income_rows.append({
+                    "id": self.new_id(),
+                    "income_type_id": income_type.id,
+                    "academic_year_id": year_id,
+                    "academic_term_id": term.id,
+                    "user_id": self.admin.id,
+                    "amount": Decimal(self.rng.randrange(20, 500)),
+                    "purpose": income_type.name,
+                    "payer": payers[len(income_rows)],
+                    "student_id": (
+                        self.rng.choice(student_ids)
+                        if student_ids and self.rng.random() < 0.5 else None
+                    ),
+                    "income_date": moment.date(),
+                    "payment_method": self.rng.choice(payment_methods),
+                    **self.stamps(moment)
+                })
+            for _ in range(expenditures):
+                moment = self.moment(*dates)
+                expenditure_rows.append({
+                    "id": self.new_id(),
+                    "expenditure_type_id": self.rng.choice(
+                        expenditure_types
+                    ).id,
+                    "user_id": self.admin.id,
+                    "academic_year_id": year_id,
+                    "academic_term_id": term.id,
+                    "amount": Decimal(self.rng.randrange(50, 2000)),
+                    "purpose": purposes[len(expenditure_rows)],
+                    "expense_date": moment.date(),
+                    "payment_method": self.rng.choice(payment_methods),
+                    **self.stamps(moment)
+                })
+        self.copy(Income, income_rows)
+        self.copy(Expenditure, expenditure_rows)
+
+    def finish(self):
+        """
+        COPY sends no signals: once committed, recompute the closed days
+        the ledger rows went into and drop what the caches hold
+        """
+        for source, (first, last) in self.ledger_days.items():
+            transaction.on_commit(
+                lambda source=source, first=first, last=last:
+                    resummarise_days(source, first, last)
+            )
+        for namespace in CACHE_NAMESPACES:
+            transaction.on_commit(
+                lambda namespace=namespace: bump_namespace(namespace)
+            )
+
+
+def resummarise_days(source: str, first: date, last: date):
+    """Recompute the days from first to last already rolled up"""
+    closed_until = summarised_until(source)
+    if closed_until is not None and first <= closed_until:
+        summarise_days(source, first, min(last, closed_until))
+
+
+def seed_school(students: int = 500, staff: int = 50, years: int = 3,
+                seed: int = 1, last_year: Optional[int] = None) -> dict:
+    """
+    Create a whole school: K academic years, N students in a class every
+    year with their fee payments, M staff on salary bands, and incomes and
+    expenditures in every term
+
+    Args:
+        students: Number of students, enrolled in every seeded year
+        staff: Number of staff, each with payment details for payroll
+        years: Number of academic years, at most the number of classes
+        seed: Seed of the generated data, also part of every unique id
+        last_year: Start year of the active academic year
+    """
+    started = timer.perf_counter()
+    seeder = SchoolSeeder(seed=seed)
+    with transaction.atomic():
+        seeder.create_school(years=years, last_year=last_year)
+        seeder.add_students(students)
+        seeder.add_staff(staff)
+        seeder.add_transactions(
+            incomes=max(1, students // 20), expenditures=max(1, staff)
+        )
+        seeder.finish()
+    return {
+        "organization": seeder.organization.name,
+        "admin": seeder.admin.email,
+        "academic_year": seeder.academic_years[-1].year,
+        "students": students,
+        "staff": staff,
+        "years": len(seeder.academic_years),
+        "student_classes": seeder.counts["studentclass"],
+        "payments": seeder.counts["payment"],
+        "incomes": seeder.counts["income"],
+        "expenditures": seeder.counts["expenditure"],
+        "seconds": round(timer.perf_counter() - started, 2),
+    }
@@ -0,0 +1,61 @@
+"""
+Student IDs of the pattern of the organization, e.g. HHA2026000172 from
+"{prefix}{year}{number:05d}{check}". The numbers come from one counter per
+year shared by every organization (see utils.counters), so no two students
+of a year get the same number and an import reserves the numbers of its
+students in one round trip. The check digit is the Luhn digit of the other
+digits of the ID and catches a mistyped digit or two swapped ones.
+"""
+from typing import Optional, Sequence
+
+from django.utils import timezone
+
+from core.models import OrganizationConfig
+from core.utils import DEFAULT_STUDENT_ID_PATTERN
+from utils.counters import allocator
+from utils.utils import get_initials
+
+# Prefix of the students of users without an organization
+DEFAULT_PREFIX = "HHA"
+
+
+def luhn_check_digit(digits: str) -> int:
+    """The digit completing digits to a valid Luhn number"""
+    total = 0
+    for index, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if index % 2 == 0 else 1)
+        total += value - 9 if value > 9 else value
+    return (10 - total % 10) % 10
+
+
+def student_ids(organization: Optional[OrganizationConfig],
+                names: Sequence[Sequence[Optional[str]]],
+                year: Optional[int] = None) -> list[str]:
+    """
+    IDs of new students, one per tuple of names (first, middle, last) and
+    in that order, with numbers reserved together
+    """
+    year = year or timezone.localdate().year
+    if organization is None:
+        pattern, prefix = DEFAULT_STUDENT_ID_PATTERN, DEFAULT_PREFIX
+    else:
+        pattern = organization.student_id_pattern
+        prefix = get_initials(*organization.name.split()) or DEFAULT_PREFIX
+    numbers = allocator.take(f"student:{year}", len(names)) if names else []
+    ids = []
+    for number, student_names in zip(numbers, names):
+        fields = {
+            "prefix": prefix,
+            "initials": get_initials(*student_names),
+            "year": year,
+            "number": number,
+        }
+        body = pattern.format(check="", **fields)
+        check = luhn_check_digit("".join(c for c in body if c.isdigit()))
+        ids.append(pattern.format(check=check, **fields))
+    return ids
+
+
+def next_student_id(organization: Optional[OrganizationConfig],
+                    *names: Optional[str], year: Optional[int] = None) -> str:
+    return student_ids(organization, [names], year)[0]
@@ -0,0 +1,183 @@
+"""
+Everything the student page shows in one document: class, guardians, the
+fees of the active year per term with what was paid on each, recent
+payments, arrears per year and the balance. Built from a handful of
+grouped queries and cached per student in the "student_profiles"
+namespace until the student's next payment (see core.signals).
+"""
+from decimal import Decimal
+from typing import Optional
+
+from django.db.models import Count, Max, Sum
+
+from core.models import (
+    AcademicTerm, ArrearPayment, Fee, FeeArrear, ParentOrGuardian, Payment,
+    Student, StudentClass
+)
+from utils.cache import forget, get_or_set
+from utils.fee_payment import ZERO, money
+
+PROFILE_NAMESPACE = "student_profiles"
+# Payments listed on the profile, latest first
+RECENT_PAYMENTS = 10
+
+
+def fee_terms(student_class: StudentClass, student_id) -> list[dict]:
+    """Fees of the class's fee group per term, with the amounts paid"""
+    if student_class.fee_assigned_id is None:
+        return []
+    fees = Fee.objects.filter(
+        studentfeegroup=student_class.fee_assigned_id
+    ).select_related("academic_term").order_by(
+        "academic_term__order", "name"
+    )
+    paid = dict(Payment.objects.filter(
+        student_id=student_id, academic_year_id=student_class.academic_year_id
+    ).values("fee_id").annotate(total=Sum("amount")).values_list(
+        "fee_id", "total"
+    ))
+    terms = {}
+    for fee in fees:
+        term = terms.setdefault(fee.academic_term_id, {
+            "academic_term": fee.academic_term.term,
+            "order": fee.academic_term.order,
+            "is_active": fee.academic_term.is_active,
+            "fees": [],
+        })
+        term["fees"].append({
+            "fee_id": str(fee.id),
+            "fee_name": fee.name,
+            "amount": fee.amount,
+            "amount_paid": paid.get(fee.id, ZERO),
+        })
+    for term in terms.values():
+        term["amount"] = sum((fee["amount"] for fee in term["fees"]), ZERO)
+        term["amount_paid"] = sum(
+            (fee["amount_paid"] for fee in term["fees"]), ZERO
+        )
+        for row in [term, *term["fees"]]:
+            row["amount_owing"] = money(row["amount"] - row["amount_paid"])
+            row["amount"] = money(row["amount"])
+            row["amount_paid"] = money(row["amount_paid"])
+    return list(terms.values())
+
+
+def arrears_by_year(student_id) -> list[dict]:
+    """Arrears of earlier years with what was paid on them"""
+    paid = dict(ArrearPayment.objects.filter(
+        fee_arrear__student_id=student_id
+    ).values("fee_arrear__academic_year__year").annotate(
+        total=Sum("amount")
+    ).values_list("fee_arrear__academic_year__year", "total"))
+    return [
+        {
+            "academic_year": arrear["academic_year__year"],
+            "amount": money(arrear["amount"]),
+            "amount_paid": money(paid.get(arrear["academic_year__year"])),
+            "balance": money(arrear["balance"]),
+            "terms": arrear["terms"],
+        }
+        for arrear in FeeArrear.objects.filter(
+            student_id=student_id
+        ).values("academic_year__year").annotate(
+            amount=Sum("amount"), balance=Sum("arrear_balance"),
+            terms=Count("id")
+        ).order_by("academic_year__year")
+    ]
+
+
+def build_student_profile(student_id) -> Optional[dict]:
+    """The profile of a student, None if there is no such student"""
+    student = Student.objects.filter(pk=student_id).values(
+        "id", "student_id", "first_name", "middle_name", "last_name",
+        "gender", "date_of_birth", "date_of_admission", "is_active"
+    ).first()
+    if student is None:
+        return None
+    student["id"] = str(student["id"])
+    student_class = StudentClass.objects.filter(
+        student_id=student_id, academic_year__is_active=True
+    ).select_related("academic_year", "student_class", "fee_assigned").first()
+    active_term = AcademicTerm.objects.filter(
+        is_active=True
+    ).values_list("term", flat=True).first()
+    guardians = [
+        {**guardian, "id": str(guardian["id"])}
+        for guardian in ParentOrGuardian.objects.filter(
+            students=student_id
+        ).order_by("full_name").values(
+            "id", "full_name", "relationship_with_student", "mobile_number",
+            "email", "name_of_father", "father_telephone", "name_of_mother",
+            "mother_telephone", "address"
+        )
+    ]
+    terms = fee_terms(student_class, student_id) if student_class else []
+    payments = [
+        {
+            **payment, "id": str(payment["id"]),
+            "amount": money(payment["amount"]),
+            "date_created": payment["date_created"].isoformat(),
+        }
+        for payment in Payment.objects.filter(
+            student_id=student_id
+        ).order_by("-date_created").values(
+            "id", "fee__name", "academic_year__year",
+            "academic_term__term", "amount", "payment_method",
+            "date_created"
+        )[:RECENT_PAYMENTS]
+    ]
+    totals = Payment.objects.filter(student_id=student_id).aggregate(
+        count=Count("id"), last_paid=Max("date_created")
+    )
+    arrears = arrears_by_year(student_id)
+
+    fees = sum((Decimal(term["amount"]) for term in terms), ZERO)
+    paid = sum((Decimal(term["amount_paid"]) for term in terms), ZERO)
+    arrears_owing = sum(
+        (Decimal(arrear["balance"]) for arrear in arrears), ZERO
+    )
+    return {
+        "student": student,
+        "academic_year": (
+            student_class.academic_year.year if student_class else None
+        ),
+        "academic_term": active_term,
+        "class": {
+            "id": str(student_class.student_class_id),
+            "name": student_class.student_class.name,
+        } if student_class else None,
+        "fee_group": {
+            "id": str(student_class.fee_assigned_id),
+            "name": student_class.fee_assigned.name,
+        } if student_class and student_class.fee_assigned else None,
+        "guardians": guardians,
+        "terms": terms,
+        "payments": payments,
+        "payment_count": totals["count"],
+        "last_paid": (
+            totals["last_paid"].isoformat() if totals["last_paid"] else None
+        ),
+        "arrears": arrears,
+        "balance": {
+            "fees": money(fees),
+            "paid": money(paid),
+            "owing": money(fees - paid),
+            "arrears": money(arrears_owing),
+            "total_owing": money(fees - paid + arrears_owing),
+            "is_owing": fees - paid + arrears_owing > 0,
+        },
+    }
+
+
+def student_profile(student_id) -> Optional[dict]:
+    """The cached profile of a student"""
+    return get_or_set(
+        PROFILE_NAMESPACE, (str(student_id),),
+        lambda: build_student_profile(student_id)
+    )
+
+
+def forget_student_profile(student_id, after_commit: bool = True) -> None:
+    """Drop the cached profile after a change to the student's records"""
+    if student_id is not None:
+        forget(PROFILE_NAMESPACE, str(student_id), after_commit=after_commit)
@@ -0,0 +1,153 @@
+"""
+Thumbnails of student and staff photos.
+Thumbnails are rendered off the request thread once the saving transaction
+commits, and stored under a key derived from the source file name so the
+same photo is only ever rendered once per size.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+# Source field -> thumbnail field of the models with photos
+THUMBNAIL_FIELDS = {
+    "core.Student": ("image", "image_thumbnail"),
+    "core.Staff": ("profile_picture", "profile_picture_thumbnail"),
+}
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Shared pool the thumbnails are rendered on"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix="thumbnails"
+        )
+    return _executor
+
+
+def thumbnail_format() -> tuple[str, str]:
+    """WebP when Pillow supports it, JPEG otherwise"""
+    # Pillow is imported on first use, core.signals loads this module when
+    # the app registry is populated
+    from PIL import features
+
+    if features.check("webp"):
+        return "WEBP", "webp"
+    return "JPEG", "jpg"
+
+
+def thumbnail_name(source_field: str, source_name: str, size: int) -> str:
+    """Deterministic storage name of a source file's thumbnail"""
+    digest = hashlib.sha1(source_name.encode()).hexdigest()
+    return f"thumbnails/{source_field}/{digest}-{size}.{thumbnail_format()[1]}"
+
+
+def render_thumbnail(source, size: int) -> bytes:
+    """Resize an image file so its longest side is at most size pixels"""
+    from PIL import Image, ImageOps
+
+    image_format, _ = thumbnail_format()
+    source.open("rb")
+    try:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            if image_format == "JPEG" or image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGB")
+            output = BytesIO()
+            image.save(output, format=image_format, quality=80)
+    finally:
+        source.close()
+    return output.getvalue()
+
+
+def generate_thumbnail(
+        model_label: str, pk, size: Optional[int] = None) -> Optional[str]:
+    """
+    Render, store and record the thumbnail of one object
+
+    Args:
+        model_label: Key of THUMBNAIL_FIELDS, e.g core.Student
+        pk: Primary key of the object
+        size: Longest side in pixels, THUMBNAIL_SIZE by default
+    Returns:
+        Storage name of the thumbnail, None when there is no photo
+    """
+    size = size or settings.THUMBNAIL_SIZE
+    model = apps.get_model(model_label)
+    source_field, thumb_field = THUMBNAIL_FIELDS[model_label]
+    instance = model.objects.filter(pk=pk).only(
+        "pk", source_field, thumb_field
+        ).first()
+    if instance is None or not getattr(instance, source_field):
+        return None
+    source = getattr(instance, source_field)
+    name = thumbnail_name(source_field, source.name, size)
+    storage = model._meta.get_field(thumb_field).storage
+    if not storage.exists(name):
+        name = storage.save(
+            name, ContentFile(render_thumbnail(source, size))
+            )
+    # Only record it if the photo did not change while rendering
+    model.objects.filter(
+        pk=pk, **{source_field: source.name}
+    ).update(**{thumb_field: name})
+    return name
+
+
+def _run(model_label: str, pk):
+    """Background job: never let a bad photo take the worker down"""
+    try:
+        generate_thumbnail(model_label, pk)
+    except Exception:
+        logger.exception("Thumbnail of %s %s failed", model_label, pk)
+    finally:
+        connection.close()
+
+
+def schedule_thumbnail(instance):
+    """Queue a thumbnail after the current transaction commits"""
+    model_label = instance._meta.label
+    if settings.THUMBNAIL_SYNC:
+        transaction.on_commit(
+            lambda: generate_thumbnail(model_label, instance.pk)
+        )
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(_run, model_label, instance.pk)
+    )
+
+
+def thumbnail_is_current(instance) -> bool:
+    """Whether the recorded thumbnail belongs to the current photo"""
+    source_field, thumb_field = THUMBNAIL_FIELDS[instance._meta.label]
+    source = getattr(instance, source_field)
+    thumbnail = getattr(instance, thumb_field)
+    if not source:
+        return not thumbnail
+    return thumbnail.name == thumbnail_name(
+        source_field, source.name, settings.THUMBNAIL_SIZE
+        )
+
+
+def thumbnail_url(thumbnail, context: dict) -> Optional[str]:
+    """URL of a thumbnail, absolute like DRF file fields when possible"""
+    if not thumbnail:
+        return None
+    request = context.get("request")
+    if request is not None:
+        return request.build_absolute_uri(thumbnail.url)
+    return thumbnail.url
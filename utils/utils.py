@@ -4,7 +4,6 @@ Any helper functions
 import secrets
 import string
 import logging
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -22,27 +21,6 @@ def generate_random_string(length=15) -> str:
     return random_string
 
 
-def generate_studentid(*args) -> str:
-    """Generate Student ID"""
-    # student_initial
-    characters = string.ascii_uppercase + string.digits
-    current_year: str = str(datetime.now().year)
-    initials = get_initials(*args)
-
-    random_string: str = ''.join(secrets.choice(characters) for _ in range(3))
-
-    return "HHA" + random_string + initials + current_year
-
-
-def generate_random_receipt_number(length=10) -> str:
-    """Generating receipt number"""
-
-    chars = string.digits
-
-    random_string: str = "".join(secrets.choice(chars) for _ in range(length))
-    return random_string
-
-
 def get_initials(*args) -> str:
     first_letter = ""
     for n in args: